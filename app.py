@@ -1,27 +1,51 @@
 import streamlit as st
 import requests
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+import os
 import time
-import pytz
+import uuid
 
+from dashboard.api import BackendClient, RerunTimer
+from dashboard.live_state import LiveQueue
+from dashboard.render import (
+    RenderCache, _text, format_display_time, history_list, patient_card, queue_cards, stylesheet,
+)
 
 st.set_page_config(page_title="Hospital Triage System", layout="wide")
 st.title("🏥 Hospital Triage Queue Management")
 
 backend_url = "https://hospital-queue-system.onrender.com"  # Change this to your deployed backend URL when needed
 
+@st.cache_resource
+def get_backend_client():
+    """One pooled keep-alive client for every session, so reruns skip TCP/TLS setup"""
+    return BackendClient(backend_url)
+
+@st.cache_resource
+def get_render_cache():
+    """Rendered queue and history pages shared by every session, keyed by backend version"""
+    return RenderCache()
+
+api = get_backend_client()
+renders = get_render_cache()
+# Set DASHBOARD_RENDER=cards for the original layout: one HTML block and one button per patient
+RENDER_MODE = os.environ.get("DASHBOARD_RENDER", "batched")
+timer = RerunTimer()  # Backend latency of this rerun, shown in the sidebar
+
 # ─────────────────────────────────────────────
 # Caching and API Safety functions
 # ─────────────────────────────────────────────
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def safe_api_call(url, method="get", json_data=None):
-    """Make API calls with error handling and caching"""
+def safe_api_call(path, method="get", json_data=None, idempotency_key=None):
+    """Make API calls with error handling; never cached, since most of them change the queue.
+
+    POSTs with an idempotency_key are retried on failure and applied at most once by the backend.
+    """
     try:
         if method.lower() == "get":
-            response = requests.get(url, timeout=10)
+            response = timer.track(path, api.get, path)
         elif method.lower() == "post":
-            response = requests.post(url, json=json_data, timeout=10)
+            response = timer.track(path, api.post, path, json=json_data, idempotency_key=idempotency_key)
         else:
             return {"error": "Invalid method"}
             
@@ -34,173 +58,100 @@ def safe_api_call(url, method="get", json_data=None):
     except ValueError:
         return {"error": "Invalid response from API"}
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_queue_data():
-    """Get and cache the queue data"""
-    return safe_api_call(f"{backend_url}/view_queue")
+RESUBMIT_SECONDS = 5  # The same form submitted again this quickly (a double-click) is sent once
+
+def submission(action, fields, payload=None):
+    """(idempotency key, payload) for a form submission.
+
+    Repeating an action with the same fields within RESUBMIT_SECONDS reuses the
+    first key and payload, so the backend applies it once and replays its answer.
+    """
+    last = st.session_state.get(f"submission_{action}")
+    now = time.monotonic()
+    if last is not None and last[0] == fields and now - last[3] < RESUBMIT_SECONDS:
+        return last[1], last[2]
+    key = uuid.uuid4().hex
+    st.session_state[f"submission_{action}"] = (fields, key, payload, now)
+    return key, payload
+
+PAGE_SIZE = 10  # Rows per page for the queue and history views
+
+def fetch_page(path, page=1, page_size=PAGE_SIZE):
+    """Fetch one server-side page and the total row count (page_size=None fetches everything)"""
+    params = {}
+    if page_size is not None:
+        params = {"offset": (page - 1) * page_size, "limit": page_size}
+    try:
+        response = timer.track(path, api.get_cached, path, params=params)
+        if response.status_code == 200:
+            items = response.json()
+            return {"items": items, "total": int(response.headers.get("X-Total-Count", len(items))),
+                    "version": response.headers.get("ETag")}
+        else:
+            return {"error": f"API returned status code {response.status_code}"}
+    except requests.exceptions.RequestException as e:
+        return {"error": f"API request failed: {str(e)}"}
+    except ValueError:
+        return {"error": "Invalid response from API"}
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_history_data():
-    """Get and cache the history data"""
-    return safe_api_call(f"{backend_url}/history")
+def start_queue_sync():
+    """Start syncing this session's live queue copy with /events in the background"""
+    if "live_queue" not in st.session_state:
+        st.session_state.live_queue = LiveQueue(backend_url)
+    # A rerun can interrupt the script while the last sync is still in flight;
+    # wait for that one rather than syncing the same copy from two threads
+    running = st.session_state.get("queue_sync")
+    if running is not None and not running.done():
+        return running
+    st.session_state.queue_sync = api.submit(
+        timer.track, "/events", st.session_state.live_queue.sync, api.session, api.timeout)
+    return st.session_state.queue_sync
+
+def get_queue_data(page=1, page_size=PAGE_SIZE):
+    """Get one rendered page of the queue from this session's live copy once the sync has finished"""
+    try:
+        queue_sync.result()
+        live = st.session_state.live_queue
+
+        def build():
+            view = live.page(page, page_size)
+            # Copies, since the live copy keeps updating its rows
+            items = [dict(row) for row in view["items"]]
+            return {"items": items, "total": view["total"],
+                    "html": queue_cards(items, start=(page - 1) * page_size + 1)}
+
+        return renders.get_or_build(("queue", live.department or "", live.version, page, page_size), build)
+    except requests.exceptions.RequestException as e:
+        return {"error": f"API request failed: {str(e)}"}
+    except (ValueError, KeyError):
+        return {"error": "Invalid response from API"}
+
+def get_history_data(page=1, page_size=PAGE_SIZE):
+    """Get one rendered page of the history data; unchanged pages are revalidated with a 304"""
+    history = fetch_page("/history", page, page_size)
+    if "error" in history:
+        return history
+    return renders.get_or_build(("history", history["version"], page, page_size),
+                                lambda: dict(history, html=history_list(history["items"])))
 
 # Helper function to generate consistent timestamps
 def get_utc_timestamp():
     """Generate a UTC timestamp in a consistent format"""
-    return datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
-
-def format_display_time(timestamp_str):
-    try:
-        dt = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        return dt.strftime("%H:%M:%S")
-    except:
-        return timestamp_str  # Return original if parsing fails
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
 def get_current_time():
     """Get current time in HH:MM:SS format"""
     return datetime.now().strftime("%H:%M:%S")
 
+# The queue sync overlaps with the sidebar's history fetch instead of following it
+queue_sync = start_queue_sync()
+
 # ─────────────────────────────────────────────
 # Enhanced Custom CSS Styling
 # ─────────────────────────────────────────────
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@400;600&display=swap');
-
-    html, body, [class*="css"] {
-        font-family: 'Poppins', sans-serif !important;
-    }
-
-    .main > div {
-        background: #ffffff;
-        padding: 30px;
-        border-radius: 18px;
-        box-shadow: 0 6px 14px rgba(0, 0, 0, 0.08);
-        margin-bottom: 25px;
-    }
-
-    .stButton>button {
-        background: linear-gradient(90deg, #2563eb, #1e40af);
-        color: white;
-        font-weight: 600;
-        padding: 0.75em 1.5em;
-        border-radius: 14px;
-        transition: all 0.3s ease;
-        border: none;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.12);
-    }
-
-    .stButton>button:hover {
-        background: linear-gradient(90deg, #1e40af, #2563eb);
-        transform: scale(1.03);
-        box-shadow: 0 6px 12px rgba(0,0,0,0.2);
-    }
-
-    .patient-card {
-        background: #f9fafb;
-        color: black;
-        padding: 18px 24px;
-        border-radius: 16px;
-        margin-bottom: 16px;
-        border-left: 5px solid var(--primary);
-        transition: 0.3s;
-        box-shadow: 0 4px 10px rgba(0, 0, 0, 0.05);
-    }
-
-    .patient-card:hover {
-        transform: scale(1.01);
-        box-shadow: 0 8px 20px rgba(0, 0, 0, 0.08);
-    }
-
-    .severity-badge {
-        font-size: 0.8em;
-        padding: 5px 12px;
-        border-radius: 999px;
-        font-weight: 600;
-        margin-left: 10px;
-        color: white;
-        box-shadow: 0 2px 6px rgba(0,0,0,0.1);
-    }
-
-    .severity-1 {
-        background: #dc2626;
-    }
-    .severity-2 {
-        background: #f59e0b;
-    }
-    .severity-3 {
-        background: #10b981;
-    }
-
-    .next-patient-banner {
-        background: linear-gradient(90deg, #3b82f6, #2563eb);
-        color: white;
-        padding: 24px;
-        border-radius: 20px;
-        font-size: 1.2em;
-        text-align: center;
-        animation: pulse 2s infinite;
-        box-shadow: 0 6px 12px rgba(0,0,0,0.1);
-    }
-
-    .history-item {
-        background: #f9fafb;
-        color: black;
-        border-left: 4px solid #2563eb;
-        padding: 12px 16px;
-        margin-bottom: 10px;
-        border-radius: 10px;
-    }
-
-    .timestamp {
-        font-size: 0.75em;
-        color: #64748b;
-        margin-top: 5px;
-    }
-
-    .wait-time {
-        font-size: 0.85em;
-        font-weight: 600;
-        color: #1e40af;
-    }
-
-    .pagination {
-        display: flex;
-        justify-content: center;
-        margin-top: 15px;
-    }
-
-    @keyframes pulse {
-        0% { transform: scale(1); }
-        50% { transform: scale(1.02); }
-        100% { transform: scale(1); }
-    }
-
-</style>
-""", unsafe_allow_html=True)
-
-# ─────────────────────────────────────────────
-# Helper Functions
-# ─────────────────────────────────────────────
-def calculate_wait_time(patient, queue):
-    """Calculate dynamic wait time based on position in queue and severity"""
-    base_times = {1: 15, 2: 10, 3: 5}  # Base minutes per severity level
-    
-    try:
-        position = next((i for i, p in enumerate(queue) if p.get('name') == patient.get('name')), 0) + 1
-        
-        # Calculate wait time based on patients ahead in queue
-        ahead_patients = queue[:position-1] if position > 0 else []
-        wait_time = sum(base_times.get(p.get('severity', 3), 5) for p in ahead_patients)
-        
-        # Add base time for current patient
-        wait_time += base_times.get(patient.get('severity', 3), 5)
-        
-        # Ensure minimum wait time
-        return max(5, wait_time)
-    except (TypeError, ValueError, IndexError):
-        # Fallback for any errors in calculation
-        return 10  # Default wait time
+# Read from dashboard/static once per process; Streamlit drops elements a rerun
+# does not repeat, so the (unchanged) block is still sent every run
+st.markdown(stylesheet(), unsafe_allow_html=True)
 
 # ─────────────────────────────────────────────
 # Sidebar – App Info & Patient History
@@ -225,56 +176,38 @@ with st.sidebar:
     # Admin tools
     with st.expander("⚙️ Admin Tools", expanded=True):
         if st.button("🔄 Refresh Queue", key="refresh_btn"):
-            # Clear caches when manually refreshing
-            get_queue_data.clear()
-            get_history_data.clear()
+            # Reload the live queue from a full snapshot when manually refreshing
+            st.session_state.pop("live_queue", None)
+            st.session_state.pop("queue_sync", None)
             st.rerun()
             
-        if st.button("📊 Generate Report", key="report_btn"):
-            history = get_history_data()
-            
-            if not history or "error" in history:
-                st.error(f"Failed to fetch history: {history.get('error', 'Unknown error')}")
-            elif not history:
-                st.info("No patient data to generate report.")
-            else:
-                try:
-                    report_data = [
-                        {
-                            "Name": p.get('name', 'Unknown'),
-                            "Condition": p.get('condition', 'Not specified'),
-                            "Severity": p.get('severity', 'N/A'),
-                            "Timestamp": p.get('arrival_time', 'N/A'),
-                            "Status": "Completed"
-                        }
-                        for p in history
-                    ]
-                    df = pd.DataFrame(report_data)
-                    csv_data = df.to_csv(index=False).encode()
-                    
-                    st.download_button(
-                        "⬇️ Download Patient Report (CSV)", 
-                        csv_data, 
-                        file_name=f"patient_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv"
-                    )
-                except Exception as e:
-                    st.error(f"Error generating report: {str(e)}")
+        # The browser downloads the report straight from the backend, which
+        # streams it in chunks, so its size never passes through this app
+        st.markdown("**📊 Patient Report**")
+        today = datetime.utcnow().date()
+        report_range = st.date_input("Arrival dates", value=(today - timedelta(days=30), today),
+                                     key="report_range")
+        report_format = st.selectbox("Format", ["csv", "parquet"], key="report_format")
+        if len(report_range) == 2:
+            query = urlencode({"since": report_range[0].isoformat(), "until": report_range[1].isoformat(),
+                               "format": report_format})
+            st.markdown(f"[⬇️ Download Patient Report]({api.url('/history/export')}?{query})")
+        else:
+            st.caption("Pick a start and end date.")
 
     # Patient history with pagination
     with st.expander("📜 Patient History", expanded=True):
-        history = get_history_data()
+        current_page = st.session_state.get("history_page", 1)
+        history = get_history_data(current_page)
         
         if not history or "error" in history:
             st.error(f"Failed to fetch history: {history.get('error', 'Unknown error')}")
-        elif not history:
+        elif not history["items"]:
             st.info("No patient history yet.")
         else:
-            # Implement pagination for history
-            page_size = 10
+            # The backend returns only the requested page plus the total count
             try:
-                history_pages = [history[i:i + page_size] for i in range(0, len(history), page_size)]
-                total_pages = len(history_pages)
+                total_pages = -(-history["total"] // PAGE_SIZE)
                 
                 if total_pages > 0:
                     col1, col2, col3 = st.columns([1, 2, 1])
@@ -287,17 +220,8 @@ with st.sidebar:
                             key="history_page"
                         )
                     
-                    # Display current page of history
-                    display_history = history_pages[current_page-1]
-                    for p in display_history:
-                        st.markdown(f"""
-                            <div class="history-item">
-                                <div style="font-weight: bold;">{p.get('name', 'Unknown')}</div>
-                                <div style="font-size: 0.85em; opacity: 0.9;">{p.get('condition', 'Not specified')}</div>
-                                <span class="severity-badge severity-{p.get('severity', 3)}">Severity {p.get('severity', 3)}</span>
-                                <div class="timestamp">Arrived: {format_display_time(p.get('arrival_time', 'N/A'))}</div>
-                            </div>
-                        """, unsafe_allow_html=True)
+                    # Display current page of history as one block
+                    st.markdown(history["html"], unsafe_allow_html=True)
                     
                     # Pagination controls
                     st.markdown('<div class="pagination">', unsafe_allow_html=True)
@@ -353,22 +277,17 @@ with st.form("add_patient_form"):
             st.error("Please fill in all required fields")
         else:
             try:
-                res = safe_api_call(
-                    f"{backend_url}/add_patient",
-                    method="post",
-                    json_data={
-                        "name": name,
-                        "condition": condition,
-                        "severity": severity,
-                        "arrival_time": arrival_time
-                    }
-                )
+                # A double-clicked submit sends the first payload (and arrival time) again under its key
+                key, payload = submission("add_patient", (name, condition, severity), {
+                    "name": name,
+                    "condition": condition,
+                    "severity": severity,
+                    "arrival_time": arrival_time
+                })
+                res = safe_api_call("/add_patient", method="post", json_data=payload, idempotency_key=key)
                 
                 if res and "error" not in res:
                     st.success("✅ Patient successfully added to queue!")
-                    # Clear the cache since we made changes
-                    get_queue_data.clear()
-                    get_history_data.clear()
                     time.sleep(1)
                     st.rerun()
                 else:
@@ -380,27 +299,54 @@ with st.form("add_patient_form"):
 # Queue Display
 # ─────────────────────────────────────────────
 st.subheader("🧾 Current Triage Queue")
-queue = get_queue_data()
+
+def mark_treated(p, rerun=True):
+    # Treating a patient twice is always a repeat, so the key is the patient's
+    res = safe_api_call(
+        "/mark_treated", 
+        method="post", 
+        json_data={"patient_id": p.get('patient_id'), "name": p.get('name')},
+        idempotency_key=f"treat-{p.get('patient_id')}"
+    )
+    
+    if res and "error" not in res:
+        st.success(f"{p.get('name', 'Patient')} marked as treated.")
+        if rerun:
+            time.sleep(1)
+            st.rerun()
+    else:
+        st.error(f"Failed to update status: {res.get('error', 'Unknown error')}")
+
+def treat_selected(rows):
+    """on_click of the batched view's button. Callbacks run before the rerun that
+    fetches the queue again (which may change the picker's options and reset it),
+    so this treats the patient picked on the page the nurse was looking at"""
+    selected = st.session_state.get("treat_patient")
+    if selected in rows:
+        mark_treated(rows[selected][1], rerun=False)  # The click already reruns the script
+
+if "queue_page" not in st.session_state:
+    st.session_state.queue_page = 1
+queue = get_queue_data(st.session_state.queue_page)
+if "error" not in queue and not queue["items"] and st.session_state.queue_page > 1:
+    # The page we were on emptied out (patients were called or treated)
+    st.session_state.queue_page = max(1, -(-queue["total"] // PAGE_SIZE))
+    queue = get_queue_data(st.session_state.queue_page)
 
 if "error" in queue:
     st.error(f"Failed to fetch queue: {queue['error']}")
-elif not queue:
+elif not queue["items"]:
     st.info("🎉 The queue is currently empty! No patients waiting.")
 else:
     try:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            st.metric("Total Patients in Queue", len(queue))
+            st.metric("Total Patients in Queue", queue["total"])
 
-        # Implementation of pagination for queue if needed
-        page_size = 10  # Show 10 patients per page
-        queue_pages = [queue[i:i + page_size] for i in range(0, len(queue), page_size)]
-        total_pages = len(queue_pages)
+        # The backend returns only the requested page plus the total count
+        total_pages = -(-queue["total"] // PAGE_SIZE)
         
         if total_pages > 0:
-            if "queue_page" not in st.session_state:
-                st.session_state.queue_page = 1
-                
             if total_pages > 1:
                 col1, col2, col3 = st.columns([1, 2, 1])
                 with col2:
@@ -411,55 +357,41 @@ else:
                         value=st.session_state.queue_page,
                         key="queue_page_input"
                     )
-                    st.session_state.queue_page = current_queue_page
+                    if current_queue_page != st.session_state.queue_page:
+                        st.session_state.queue_page = current_queue_page
+                        st.rerun()
             else:
                 current_queue_page = 1
                 
             # Display only current page of queue
-            display_queue = queue_pages[current_queue_page-1]
+            display_queue = queue["items"]
+            first = (current_queue_page - 1) * PAGE_SIZE + 1
             
-            for i, p in enumerate(display_queue, start=(current_queue_page-1)*page_size + 1):
-                emoji = "🚨" if p.get('severity') == 1 else "⚠️" if p.get('severity') == 2 else "✅"
-                wait_time = calculate_wait_time(p, queue)
-                
+            if RENDER_MODE == "cards":
+                for i, p in enumerate(display_queue, start=first):
+                    col1, col2 = st.columns([4, 1])
+                    with col1:
+                        st.markdown(patient_card(p, i), unsafe_allow_html=True)
+                    with col2:
+                        if st.button("✅ Mark as Treated", key=f"treated_{p.get('patient_id', i)}"):
+                            mark_treated(p)
+            else:
+                # The whole page is one block, with one picker and one button instead of a
+                # button per card; the button is bound to this page's rows, and its callback
+                # reads the picked patient ID before the queue is fetched again
+                st.markdown(queue["html"], unsafe_allow_html=True)
+                rows = {p.get('patient_id'): (i, p) for i, p in enumerate(display_queue, start=first)}
                 col1, col2 = st.columns([4, 1])
                 with col1:
-                    st.markdown(f"""
-                        <div class="patient-card">
-                            <div style="display: flex; justify-content: space-between; align-items: center;">
-                                <div>
-                                    <strong style="font-size: 1.1em;">{emoji} {i}. {p.get('name', 'Unknown')}</strong>
-                                    <div style="color: #64748b; font-size: 0.9em;">{p.get('condition', 'Not specified')}</div>
-                                </div>
-                                <span class="severity-badge severity-{p.get('severity', 3)}">Priority {p.get('severity', 3)}</span>
-                            </div>
-                            <div style="margin-top: 8px; display: flex; justify-content: space-between; align-items: center;">
-                                <div style="font-size: 0.8em; color: #64748b;">
-                                    Arrived: {format_display_time(p.get('arrival_time', 'N/A'))}
-                                </div>
-                                <div class="wait-time">
-                                    Estimated wait: ~{wait_time} minutes
-                                </div>
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
+                    st.selectbox(
+                        "Patient to mark as treated",
+                        list(rows),
+                        format_func=lambda patient_id: f"{rows[patient_id][0]}. {rows[patient_id][1].get('name', 'Unknown')}",
+                        key="treat_patient",
+                        label_visibility="collapsed"
+                    )
                 with col2:
-                    if st.button("✅ Mark as Treated", key=f"treated_{i}"):
-                        res = safe_api_call(
-                            f"{backend_url}/mark_treated", 
-                            method="post", 
-                            json_data={"name": p.get('name')}
-                        )
-                        
-                        if res and "error" not in res:
-                            st.success(f"{p.get('name', 'Patient')} marked as treated.")
-                            # Clear the cache since we made changes
-                            get_queue_data.clear()
-                            get_history_data.clear()
-                            time.sleep(1)
-                            st.rerun()
-                        else:
-                            st.error(f"Failed to update status: {res.get('error', 'Unknown error')}")
+                    st.button("✅ Mark as Treated", key="treat_selected", on_click=treat_selected, args=(rows,))
             
             # Pagination controls for queue if needed
             if total_pages > 1:
@@ -489,17 +421,19 @@ col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
     if st.button("🔔 Call Next Patient", type="primary", key="next_patient_btn"):
         try:
-            res = safe_api_call(f"{backend_url}/next_patient")
+            # Every press calls a new patient, so it gets its own key; the key only
+            # makes the client's retries of this one call safe
+            res = safe_api_call("/next_patient", method="post", idempotency_key=uuid.uuid4().hex)
             
             if res and "error" not in res:
                 next_p = res
                 st.markdown(f"""
                     <div class="next-patient-banner">
                         <h3>Now Serving</h3>
-                        <h2>{next_p.get('name', 'Unknown')}</h2>
-                        <p>{next_p.get('condition', 'Not specified')} • Severity: {next_p.get('severity', 'N/A')}</p>
+                        <h2>{_text(next_p.get('name', 'Unknown'))}</h2>
+                        <p>{_text(next_p.get('condition', 'Not specified'))} • Severity: {_text(next_p.get('severity', 'N/A'))}</p>
                         <div style="font-size: 0.9em; margin-top: 10px;">
-                            Arrived at: {format_display_time(next_p.get('arrival_time', 'N/A'))}
+                            Arrived at: {_text(format_display_time(next_p.get('arrival_time', 'N/A')))}
                         </div>
                         <div style="font-size: 0.9em; margin-top: 5px;">
                             Called at: {get_current_time()}
@@ -507,10 +441,10 @@ with col2:
                     </div>
                 """, unsafe_allow_html=True)
                 
-                # Clear the cache since we may have changed the queue
-                get_queue_data.clear()
-                get_history_data.clear()
             else:
                 st.warning(f"No patients in the queue to call. {res.get('error', '')}")
         except Exception as e:
             st.error(f"Error calling next patient: {str(e)}")
+
+with st.sidebar:
+    st.caption(f"⏱️ {timer.summary()}")
@@ -0,0 +1,321 @@
+import math
+import os
+import threading
+import time
+
+from backend.queue_logic import format_arrival, parse_arrival
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+PERIODS = (HOUR, DAY, WEEK)  # Resolutions every cell is kept at; each divides the next
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+RELATIVE_ACCURACY = 0.01  # Quantile estimates are within 1% of a true sample value
+GROUPINGS = ("hour", "day", "severity", "condition")
+DEFAULT_BACKFILL_DAYS = 7  # Durable history read back into the aggregates at startup
+DEFAULT_HOUR_RETENTION = DEFAULT_BACKFILL_DAYS * DAY  # Hour cells kept; day and week cells are kept for good
+MAX_CONDITIONS = 200  # Distinct conditions tracked; later new ones are counted as OTHER_CONDITION
+OTHER_CONDITION = "Other"
+
+
+class QuantileSketch:
+    """Streaming quantiles over positive values in a log-bucketed histogram.
+
+    Each value lands in bucket ceil(log_gamma(value)) so every estimate is
+    within RELATIVE_ACCURACY of some recorded value (the DDSketch scheme).
+    Memory grows with the log of the value range, not the sample count, and
+    two sketches merge exactly by adding bucket counts, which is what lets
+    hourly aggregates roll up into reports over any range.
+    """
+
+    __slots__ = ("count", "total", "zeros", "bins")
+
+    _gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    _log_gamma = math.log(_gamma)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.zeros = 0  # Values too small to bucket (under a second of wait)
+        self.bins = {}  # bucket index -> count
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < 1:
+            self.zeros += 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.zeros += other.zeros
+        bins = self.bins
+        for index, count in other.bins.items():
+            bins[index] = bins.get(index, 0) + count
+
+    def quantile(self, q):
+        """Estimated q-quantile (0 <= q <= 1), or None if nothing was recorded"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.bins) / (self._gamma + 1)
+
+
+class _Bucket:
+    """Counts and waits for one (period, severity, condition) cell"""
+
+    __slots__ = ("arrivals", "called", "treated", "waits")
+
+    def __init__(self):
+        self.arrivals = 0
+        self.called = 0
+        self.treated = 0
+        self.waits = QuantileSketch()
+
+    def merge(self, other):
+        self.arrivals += other.arrivals
+        self.called += other.called
+        self.treated += other.treated
+        self.waits.merge(other.waits)
+
+
+class QueueAnalytics:
+    """Incrementally maintained throughput and wait-time aggregates.
+
+    Registered as a TriageQueue listener: admissions count as arrivals in the
+    hour the patient arrived, and calls and treatments as served in the hour
+    they happened, with the door-to-call wait (arrival until leaving the
+    queue) added to a quantile sketch. Each event updates a total, a
+    per-severity and a per-condition cell at hour, day and week resolution,
+    so a report over months merges a few dozen week and day cells plus the
+    partial hours at either end instead of scanning history.
+
+    Memory stays bounded in a long-running process: hour cells are dropped
+    once they are ``hour_retention`` old (whole days at a time, so the same
+    hourly detail as a restart that backfills that far), and ranges reaching
+    further back are answered to whole days. Conditions are free text, so
+    they are grouped case- and whitespace-insensitively under their first
+    spelling, and only the first MAX_CONDITIONS get cells of their own.
+
+    With the shared SQLite queue each worker only sees its own changes after
+    startup; figures are rebuilt from the shared history when it restarts.
+    """
+
+    def __init__(self, clock=time.time, hour_retention=DEFAULT_HOUR_RETENTION):
+        self._clock = clock
+        self.hour_retention = hour_retention
+        self._hours_from = None  # Day start before which hour cells have been dropped
+        self._conditions = {}  # normalised condition -> label cells are kept under
+        self._lock = threading.Lock()
+        self.backfilling = False  # True while history is being read back in the background
+        # period length -> period start (epoch) -> {(dimension, value): _Bucket}
+        # where dimension is "total", "severity" or "condition"
+        self._periods = {length: {} for length in PERIODS}
+
+    def on_change(self, event, patient):
+        """TriageQueue listener"""
+        if event == 'admitted':
+            if patient.arrival is not None:
+                self._record(patient.arrival, patient.severity, patient.condition, arrivals=1)
+        else:
+            self._served(event, patient.severity, patient.condition, patient.arrival, int(self._clock()))
+
+    def backfill(self, history_records, queued_patients):
+        """Rebuild from served records (with served_time) and the patients still waiting"""
+        for record in history_records:
+            arrival = _epoch(record.get('arrival_time'))
+            served = _epoch(record.get('served_time'))
+            severity, condition = record.get('severity'), record.get('condition')
+            if arrival is not None:
+                self._record(arrival, severity, condition, arrivals=1)
+            if served is not None:
+                self._served(record.get('status', 'called'), severity, condition, arrival, served)
+        for patient in queued_patients:
+            self.on_change('admitted', patient)
+
+    def start_backfill(self, history_records):
+        """Backfill served records on a background thread, so a long durable history
+        never holds up startup; reports cover them as they are read"""
+        def run():
+            try:
+                self.backfill(history_records, ())
+            finally:
+                self.backfilling = False
+
+        self.backfilling = True
+        thread = threading.Thread(target=run, name="analytics-backfill", daemon=True)
+        thread.start()
+        return thread
+
+    def _served(self, event, severity, condition, arrival, served):
+        wait = max(0, served - arrival) if arrival is not None else None
+        if event == 'called':
+            self._record(served, severity, condition, called=1, wait=wait)
+        else:
+            self._record(served, severity, condition, treated=1, wait=wait)
+
+    def _record(self, when, severity, condition, arrivals=0, called=0, treated=0, wait=None):
+        with self._lock:
+            keys = (("total", None), ("severity", severity), ("condition", self._condition(condition)))
+            for length, periods in self._periods.items():
+                start = when - when % length
+                cells = periods.get(start)
+                if cells is None:
+                    if length == HOUR:
+                        self._prune_hours()
+                        if self._hours_from is not None and start < self._hours_from:
+                            continue  # Older than the hourly detail kept (from a backfill)
+                    cells = periods[start] = {}
+                for key in keys:
+                    bucket = cells.get(key)
+                    if bucket is None:
+                        bucket = cells[key] = _Bucket()
+                    bucket.arrivals += arrivals
+                    bucket.called += called
+                    bucket.treated += treated
+                    if wait is not None:
+                        bucket.waits.add(wait)
+
+    def _condition(self, condition):
+        """The label a condition is counted under; caller holds _lock"""
+        if not isinstance(condition, str):
+            return condition
+        key = " ".join(condition.split()).casefold()
+        label = self._conditions.get(key)
+        if label is None:
+            if len(self._conditions) >= MAX_CONDITIONS:
+                return OTHER_CONDITION
+            label = self._conditions[key] = " ".join(condition.split())
+        return label
+
+    def _prune_hours(self):
+        """Drop hour cells older than hour_retention, a whole day at a time; caller holds _lock"""
+        kept = int(self._clock()) - self.hour_retention
+        kept -= kept % DAY
+        if self._hours_from is not None and kept <= self._hours_from:
+            return
+        self._hours_from = kept
+        hours = self._periods[HOUR]
+        for start in [start for start in hours if start < kept]:
+            del hours[start]
+
+    def report(self, since=None, until=None, group_by=None, quantiles=DEFAULT_QUANTILES):
+        """Aggregates for whole hours overlapping [since, until] (epoch seconds, inclusive).
+
+        Returns {"total": stats, "groups": [{"key": ..., **stats}, ...]} with
+        groups only when ``group_by`` is one of GROUPINGS. Wait figures are
+        minutes. Bounds older than the hourly detail kept are widened to whole
+        days, and grouping by hour only covers the hours kept.
+        """
+        if group_by is not None and group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+        dimension = group_by if group_by in ("severity", "condition") else "total"
+        # Grouping by time needs cells no coarser than the groups
+        finest = {"hour": HOUR, "day": DAY}.get(group_by, PERIODS[-1])
+        with self._lock:
+            groups = {}
+            for start, cells in self._cover(since, until, finest):
+                for (kind, value), bucket in cells.items():
+                    if kind != dimension:
+                        continue
+                    key = {"hour": start, "day": start - start % DAY}.get(group_by, value)
+                    group = groups.get(key)
+                    if group is None:
+                        group = groups[key] = _Bucket()
+                    group.merge(bucket)
+
+        total = _Bucket()
+        for group in groups.values():
+            total.merge(group)
+        result = {"total": _stats(total, quantiles)}
+        if self.backfilling:
+            result["backfilling"] = True  # Older history is still being added
+        if group_by is not None:
+            keys = sorted(groups, key=lambda k: (k is None, k))
+            if group_by in ("hour", "day"):
+                result["groups"] = [dict(_stats(groups[k], quantiles), key=format_arrival(k)) for k in keys]
+            else:
+                result["groups"] = [dict(_stats(groups[k], quantiles), key=k) for k in keys]
+        return result
+
+    def _cover(self, since, until, coarsest):
+        """(start, cells) tiling the hours in range with the coarsest whole periods that fit"""
+        days = self._periods[DAY]
+        if not days:
+            return []
+        first = since - since % HOUR if since is not None else min(days)
+        last = until - until % HOUR if until is not None else max(days) + DAY - HOUR
+        kept = self._hours_from
+        if kept is not None:
+            # Hour cells before ``kept`` are gone: cover those days whole
+            if first < kept:
+                first -= first % DAY
+            if last < kept:
+                last += DAY - HOUR - last % DAY
+        lengths = sorted((p for p in PERIODS if p <= coarsest), reverse=True)
+        chosen = []
+        self._tile(first, last + HOUR, lengths, chosen)
+        return chosen
+
+    def _tile(self, start, end, lengths, chosen):
+        """Cover [start, end) with whole periods of lengths[0], recursing into the ragged ends"""
+        if start >= end:
+            return
+        length, finer = lengths[0], lengths[1:]
+        inner_start = -(-start // length) * length
+        inner_end = end - end % length
+        if not finer:
+            inner_start, inner_end = start, end
+        elif inner_start >= inner_end:
+            self._tile(start, end, finer, chosen)
+            return
+        periods = self._periods[length]
+        for period in range(inner_start, inner_end, length):
+            cells = periods.get(period)
+            if cells is not None:
+                chosen.append((period, cells))
+        if finer:
+            self._tile(start, inner_start, finer, chosen)
+            self._tile(inner_end, end, finer, chosen)
+
+
+def backfill_days_from_env(environ=os.environ):
+    """ANALYTICS_BACKFILL_DAYS (default 7) of durable history to rebuild /stats from at startup; 0 for none"""
+    return float(environ.get('ANALYTICS_BACKFILL_DAYS', DEFAULT_BACKFILL_DAYS))
+
+
+def _stats(bucket, quantiles):
+    waits = bucket.waits
+    stats = {
+        "arrivals": bucket.arrivals,
+        "served": bucket.called + bucket.treated,
+        "called": bucket.called,
+        "treated": bucket.treated,
+        "mean_wait_minutes": round(waits.total / waits.count / 60, 1) if waits.count else None,
+    }
+    stats["wait_minutes"] = {
+        f"p{q * 100:g}": _minutes(waits.quantile(q)) for q in quantiles
+    }
+    return stats
+
+
+def _minutes(seconds):
+    return None if seconds is None else round(seconds / 60, 1)
+
+
+def _epoch(text):
+    try:
+        return parse_arrival(text) if text else None
+    except ValueError:
+        return None
+
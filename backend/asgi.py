@@ -0,0 +1,447 @@
+"""Asyncio (ASGI) front end for the queue API.
+
+Serves the core routes of backend.server over the same service state
+(backend.service) without a thread per connection, so thousands of idle
+or slow dashboard connections cost a few kilobytes each instead of a
+worker each. Run it under any ASGI server:
+
+    uvicorn backend.asgi:app --port 5002
+
+or, with no extra dependency, the small HTTP/1.1 server built in here:
+
+    python -m backend.asgi [port]
+
+Reads are answered directly on the event loop. Every mutation goes through
+one writer task, which applies them in arrival order, so no two ever run
+at once and the queue locks are never contended. Whatever queued up while
+the writer was busy is applied as one batch: consecutive admissions to a
+department become a single add_patients call, and with a synchronous
+write-ahead log the batch waits for one fsync instead of one per request.
+
+A SQLite call can wait up to its busy timeout (30 s) for another worker's
+write lock or a history flush, so with QUEUE_DB or HISTORY_DB the reads and
+batches that touch the database run on executor threads instead; the
+writer still applies one batch at a time. /search always does, since it
+may wait for the history index to be built.
+"""
+import asyncio
+import functools
+import json
+import sys
+import time
+from urllib.parse import parse_qsl
+
+from backend.history import SQLiteHistoryStore
+from backend.persistence import JournalWriteError
+from backend.service import (
+    begin_idempotent, departments, history_etag, history_log, idempotency, journal_failed, journals, metrics,
+    parse_page_args, patient_from_payload, queue_etag, queue_page, queue_version, request_seconds,
+    resolve_patient_id, search_patients, shared_queues, unknown_department, wait_durable,
+)
+from backend.snapshot_cache import dumps
+
+EXPOSED_HEADERS = "X-Total-Count, X-Next-Cursor, X-Department, X-Triage-Aging, ETag, Idempotent-Replayed"
+MAX_BODY_BYTES = 10 * 2**20
+# Which state lives in SQLite, where a call may block (see the module docstring)
+history_on_sqlite = isinstance(history_log, SQLiteHistoryStore)
+
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers need"""
+
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"")
+        self.args = dict(parse_qsl(self.query_string.decode("latin-1")))
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                        for name, value in scope.get("headers", ())}
+        self.body = body
+
+    def json(self):
+        """The JSON body, or None when it is missing or malformed"""
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+    def etag_matches(self, etag):
+        header = self.headers.get("if-none-match")
+        if not header:
+            return False
+        tags = [tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")]
+        return "*" in tags or etag in tags
+
+
+def respond(body, status=200, headers=()):
+    """(status, headers, body bytes) with a JSON body unless it is already bytes"""
+    if not isinstance(body, bytes):
+        body = dumps(body)
+        headers = (("Content-Type", "application/json"),) + tuple(headers)
+    return status, list(headers), body
+
+
+async def idempotent(handler, request):
+    """Answer a repeated Idempotency-Key with the first response, without running the handler again"""
+    key = request.headers.get("idempotency-key")
+    if key is None:
+        return await handler(request)
+    stored, error, status = begin_idempotent(key, request.method, request.path, request.query_string, request.body)
+    if error:
+        # 409: the first request with this key is still running; retry to get its answer
+        return respond(error, status, [("Retry-After", "1")] if status == 409 else [])
+    if stored is not None:
+        status, content_type, body = stored
+        return status, [("Content-Type", content_type), ("Idempotent-Replayed", "true")], body
+    try:
+        status, headers, body = await handler(request)
+    except BaseException:
+        # Including cancellation: the client went away before an answer was stored
+        idempotency.abandon(key)
+        raise
+    if status >= 500:
+        idempotency.abandon(key)
+    else:
+        content_type = next((value for name, value in headers if name.lower() == "content-type"), "application/json")
+        idempotency.finish(key, (status, content_type, body))
+    return status, headers, body
+
+
+async def off_loop(blocking, function, *args):
+    """function(*args), on an executor thread when it may block on SQLite"""
+    if not blocking:
+        return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+def reads(blocking):
+    """Serve a synchronous handler through off_loop"""
+    def decorate(handler):
+        async def serve(request):
+            return await off_loop(blocking, handler, request)
+        return serve
+    return decorate
+
+
+def not_modified(etag):
+    return 304, [("ETag", f'"{etag}"'), ("Cache-Control", "no-cache")], b""
+
+
+class SingleWriter:
+    """Applies queue mutations one batch at a time from a single task.
+
+    ``submit`` returns when the mutation has been applied (and made durable
+    when the journal is synchronous), with its result or its exception.
+    """
+
+    def __init__(self):
+        self._pending = None  # asyncio.Queue, created on the running loop
+        self._task = None
+
+    async def submit(self, operation, *args):
+        """Run operation(*args) on the writer; consecutive ("admit", queue, patient)
+        submissions are merged into one add_patients call"""
+        if self._task is None:
+            self._pending = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait((future, operation, args))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._pending.get()]
+            while not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+            # Shared queues lock and write the database (and shared history) on every change
+            results = await off_loop(shared_queues, self._apply, batch)
+            if any(journal.sync for journal in journals):
+                # QUEUE_WAL_SYNC=1: one fsync wait covers the whole batch
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, wait_durable)
+                except JournalWriteError as e:
+                    results = [(False, e)] * len(batch)
+            for (future, _, _), (ok, value) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    @staticmethod
+    def _apply(batch):
+        results = []
+        index = 0
+        while index < len(batch):
+            _, operation, args = batch[index]
+            if operation == "admit":
+                # Merge the run of admissions to the same queue
+                queue = args[0]
+                end = index + 1
+                while end < len(batch) and batch[end][1] == "admit" and batch[end][2][0] is queue:
+                    end += 1
+                patients = [batch[i][2][1] for i in range(index, end)]
+                try:
+                    results.extend((True, patient_id) for patient_id in queue.add_patients(patients))
+                except Exception as e:
+                    results.extend((False, e) for _ in patients)
+                index = end
+                continue
+            try:
+                results.append((True, operation(*args)))
+            except Exception as e:
+                results.append((False, e))
+            index += 1
+        return results
+
+
+writer = SingleWriter()
+
+
+def remove_patient(patient_id):
+    queue = departments.owner(patient_id)
+    return queue.remove_by_id(patient_id) if queue is not None else None
+
+
+async def add_patient(request):
+    data = request.json()
+    try:
+        patient = patient_from_payload(data)
+    except ValueError as e:
+        return respond({"error": str(e)}, 400)
+    department = data.get("department")
+    if department is not None and department not in departments:
+        return respond(unknown_department(department)[0], 404)
+    patient_id = await writer.submit("admit", departments.get(department), patient)
+    return respond({"message": "Patient added successfully", "patient_id": patient_id})
+
+
+async def next_patient(request):
+    names = (request.args.get("departments") or request.args.get("department") or departments.default).split(",")
+    unknown = [name for name in names if name not in departments]
+    if unknown:
+        return respond(unknown_department(unknown[0])[0], 404)
+    patient = await writer.submit(departments.call_next, names)
+    if patient:
+        return respond(patient.to_dict())
+    return respond({"message": "No patients in queue"}, 404)
+
+
+@reads(shared_queues)
+def view_queue(request):
+    department = request.args.get("department") or departments.default
+    if department not in departments:
+        return respond(unknown_department(department)[0], 404)
+    triage = departments.get(department)
+    version = queue_version(triage)
+    etag = queue_etag(department, version)
+    if request.etag_matches(etag):
+        return not_modified(etag)
+    try:
+        body, total, next_cursor, _ = queue_page(department, version, request.args, request.query_string)
+    except ValueError as e:
+        return respond({"error": str(e)}, 400)
+    # No X-Event-Seq: /events is only served by backend.server, so live dashboards
+    # poll this page with If-None-Match instead
+    headers = [("Content-Type", "application/json"), ("X-Department", department),
+               ("Cache-Control", "no-cache"), ("ETag", f'"{etag}"')]
+    if triage.scheduler.ages:
+        headers.append(("X-Triage-Aging", triage.scheduler.spec))
+    return respond(body, 200, headers + _page_headers(total, next_cursor))
+
+
+async def mark_treated(request):
+    patient_id, error, status = await off_loop(shared_queues, resolve_patient_id, request.json())
+    if error:
+        return respond(error, status)
+    patient = await writer.submit(remove_patient, patient_id)
+    if patient:
+        return respond({"message": f"Patient {patient.name} marked as treated", "patient_id": patient.patient_id})
+    return respond({"error": "Patient not found in queue"}, 404)
+
+
+@reads(history_on_sqlite)
+def history(request):
+    etag = history_etag()
+    if request.etag_matches(etag):
+        return not_modified(etag)
+    try:
+        page_args = parse_page_args(request.args)
+        if page_args["cursor"] is not None:
+            page_args["cursor"] = int(page_args["cursor"])
+    except ValueError as e:
+        return respond({"error": str(e)}, 400)
+    rows, total, next_cursor = history_log.query(**page_args)
+    headers = [("Cache-Control", "no-cache"), ("ETag", f'"{etag}"')]
+    return respond(rows, 200, headers + _page_headers(total, next_cursor))
+
+
+@reads(True)
+def search(request):
+    try:
+        return respond(search_patients(request.args))
+    except ValueError as e:
+        return respond({"error": str(e)}, 400)
+
+
+@reads(shared_queues)
+def wait_time(request):
+    patient_id = request.args.get("patient_id")
+    queue = departments.owner(patient_id) if patient_id else None
+    estimate = queue.wait_time(patient_id) if queue is not None else None
+    if estimate is None:
+        return respond({"error": "Patient not found in queue"}, 404)
+    return respond(dict(estimate, patient_id=patient_id))
+
+
+@reads(shared_queues)
+def list_departments(request):
+    return respond({
+        "default": departments.default,
+        "departments": [{"name": name, "waiting": len(queue)} for name, queue in departments.items()],
+    })
+
+
+@reads(shared_queues or history_on_sqlite)
+def metrics_endpoint(request):
+    return respond(metrics.render().encode(), 200, [("Content-Type", "text/plain; version=0.0.4")])
+
+
+def _page_headers(total, next_cursor):
+    headers = []
+    if total is not None:
+        headers.append(("X-Total-Count", str(total)))
+    if next_cursor is not None:
+        headers.append(("X-Next-Cursor", str(next_cursor)))
+    return headers
+
+
+# Mutations a client may retry with an Idempotency-Key
+IDEMPOTENT_ROUTES = {("POST", "/add_patient"), ("POST", "/next_patient"), ("GET", "/next_patient"),
+                     ("POST", "/mark_treated")}
+
+ROUTES = {
+    ("POST", "/add_patient"): add_patient,
+    ("POST", "/next_patient"): next_patient,
+    ("GET", "/next_patient"): next_patient,
+    ("GET", "/view_queue"): view_queue,
+    ("POST", "/mark_treated"): mark_treated,
+    ("GET", "/history"): history,
+    ("GET", "/wait_time"): wait_time,
+    ("GET", "/search"): search,
+    ("GET", "/departments"): list_departments,
+    ("GET", "/metrics"): metrics_endpoint,
+}
+
+
+async def app(scope, receive, send):
+    """ASGI 3 application"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    start = time.perf_counter()
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body") or len(body) > MAX_BODY_BYTES:
+            break
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if len(body) > MAX_BODY_BYTES:
+        endpoint = scope["path"] if handler else "unmatched"
+        status, headers, content = respond({"error": "Request body too large"}, 413)
+    elif scope["method"] == "OPTIONS":
+        endpoint = "preflight"
+        status, headers, content = 204, [
+            ("Access-Control-Allow-Methods", "GET, POST, OPTIONS"),
+            ("Access-Control-Allow-Headers", "Content-Type, If-None-Match, Idempotency-Key"),
+        ], b""
+    elif handler is None:
+        endpoint = "unmatched"
+        status, headers, content = respond({"error": "Not found"}, 404)
+    else:
+        endpoint = scope["path"]
+        if (scope["method"], scope["path"]) in IDEMPOTENT_ROUTES:
+            handler = functools.partial(idempotent, handler)
+        try:
+            status, headers, content = await handler(Request(scope, body))
+        except JournalWriteError:
+            status, headers, content = respond(journal_failed()[0], 503, [("Retry-After", "5")])
+
+    headers = headers + [("Access-Control-Allow-Origin", "*"),
+                         ("Access-Control-Expose-Headers", EXPOSED_HEADERS),
+                         ("Content-Length", str(len(content)))]
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+    await send({"type": "http.response.body", "body": content})
+    request_seconds.observe(time.perf_counter() - start, endpoint, scope["method"], status)
+
+
+async def _serve_connection(reader, writer_stream):
+    """Minimal HTTP/1.1 with keep-alive for the built-in server (no chunked request bodies)"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                return
+            method, target, version = request_line.decode("latin-1").split()
+            headers = []
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+            fields = dict(headers)
+            body = await reader.readexactly(int(fields.get(b"content-length", 0)))
+            path, _, query = target.partition("?")
+            scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": version[5:],
+                     "method": method.upper(), "path": path, "query_string": query.encode("latin-1"),
+                     "headers": headers}
+
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            response = []
+
+            async def send(message):
+                response.append(message)
+
+            await app(scope, receive, send)
+            start, chunks = response[0], [m.get("body", b"") for m in response[1:]]
+            head = [f"HTTP/1.1 {start['status']} {_reason(start['status'])}"]
+            head += [f"{name.decode('latin-1')}: {value.decode('latin-1')}" for name, value in start["headers"]]
+            writer_stream.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + b"".join(chunks))
+            await writer_stream.drain()
+            if version == "HTTP/1.0" or fields.get(b"connection", b"").lower() == b"close":
+                return
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer_stream.close()
+
+
+def _reason(status):
+    return {200: "OK", 204: "No Content", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+            409: "Conflict", 413: "Payload Too Large", 422: "Unprocessable Entity",
+            501: "Not Implemented", 503: "Service Unavailable"}.get(status, "")
+
+
+async def serve(host="0.0.0.0", port=5002):
+    server = await asyncio.start_server(_serve_connection, host, port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else 5002))
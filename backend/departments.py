@@ -0,0 +1,69 @@
+import os
+
+DEFAULT_DEPARTMENT = "general"  # Where requests without a department key go
+
+
+class Departments:
+    """Named triage queues, one per department, routed by a department key.
+
+    Every department has its own queue object, and so its own lock and
+    severity lanes (kept by its wait-time estimator): a burst of admissions
+    in one department never blocks another. The queues are built by ``make_queue(name)``, which
+    should give them a shared admission counter (or shared database) so
+    ``call_next`` can compare heads across departments first-come,
+    first-served.
+    """
+
+    def __init__(self, make_queue, names=(DEFAULT_DEPARTMENT,)):
+        if not names:
+            raise ValueError("At least one department is required")
+        self.default = names[0]
+        self._queues = {name: make_queue(name) for name in names}
+
+    def __iter__(self):
+        return iter(self._queues)
+
+    def __len__(self):
+        return len(self._queues)
+
+    def __contains__(self, name):
+        return name in self._queues
+
+    def items(self):
+        return self._queues.items()
+
+    def get(self, name=None):
+        """The queue for a department (the default one for None); KeyError if unknown"""
+        return self._queues[name or self.default]
+
+    def add_listener(self, listener):
+        """Register listener(event, patient) on every department's queue"""
+        for queue in self._queues.values():
+            queue.add_listener(listener)
+
+    def owner(self, patient_id):
+        """The queue currently holding a patient, or None"""
+        for queue in self._queues.values():
+            if queue.get_patient(patient_id) is not None:
+                return queue
+        return None
+
+    def find_by_name(self, name, names=None):
+        """Queued patients with this name in the given departments (default: all)"""
+        return [patient for department in (names or self._queues)
+                for patient in self.get(department).find_by_name(name)]
+
+    def call_next(self, names):
+        """Call the highest-priority patient waiting in any of the named departments"""
+        queues = [self.get(name) for name in dict.fromkeys(names)]
+        return type(queues[0]).pop_first(queues)
+
+
+def departments_from_env(make_queue, environ=os.environ):
+    """DEPARTMENTS=ed,pediatrics,urgent_care names the queues; the first is the default.
+
+    Data from before departments existed (a shared SQLite queue, the journal in
+    QUEUE_WAL_DIR itself) belongs to the "general" department.
+    """
+    names = [name.strip() for name in environ.get('DEPARTMENTS', DEFAULT_DEPARTMENT).split(',') if name.strip()]
+    return Departments(make_queue, names)
@@ -0,0 +1,122 @@
+import collections
+import json
+import os
+import secrets
+import threading
+import time
+
+DEFAULT_BACKLOG = 10_000  # Events kept for clients catching up by sequence number
+DEFAULT_MAX_STREAMS = 4  # Server-sent event streams open at once; each holds a server thread
+HEARTBEAT_SECONDS = 15
+
+
+class EventBroker:
+    """Sequenced feed of queue changes for live dashboards.
+
+    Registered as a TriageQueue listener, so events are numbered in the exact
+    order the queue changed. Recent events are kept in a bounded backlog:
+    a client that remembers the last sequence number it applied can fetch
+    just the newer ones, or must resync from /view_queue if it fell further
+    behind than the backlog reaches.
+
+    Sequence numbers start again at zero in every process, so they are only
+    meaningful together with ``epoch``, which is drawn at random when the
+    broker is created: a client holding another epoch's number (from before
+    a restart, or from another worker) must resync too.
+    """
+
+    def __init__(self, backlog=DEFAULT_BACKLOG, epoch=None, max_streams=DEFAULT_MAX_STREAMS):
+        self.epoch = epoch or secrets.token_hex(4)
+        self._events = collections.deque(maxlen=backlog)
+        self._seq = 0
+        self._changed = threading.Condition()
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, event, patient):
+        """TriageQueue listener: record one admitted/called/treated change"""
+        with self._changed:
+            self._seq += 1
+            self._events.append({
+                "seq": self._seq,
+                "type": event,
+                "patient": patient.to_dict(),
+                "time": time.time(),
+            })
+            self._changed.notify_all()
+
+    def since(self, seq):
+        """Events after seq, or None if some of them have already left the backlog
+        or seq is ahead of this broker (it was issued by another epoch)"""
+        with self._changed:
+            if seq > self._seq:
+                return None
+            if seq == self._seq:
+                return []
+            if not self._events or self._events[0]["seq"] > seq + 1:
+                return None
+            # Sequence numbers are contiguous, so the first wanted event is at a known offset
+            start = seq + 1 - self._events[0]["seq"]
+            return [self._events[i] for i in range(start, len(self._events))]
+
+    def wait(self, seq, timeout):
+        """Block until there are events after seq or timeout passes (at once if seq is ahead)"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq != seq, timeout)
+
+    def position(self, event_id):
+        """The seq in an event ID ("epoch:seq") from this epoch, else None"""
+        epoch, _, seq = (event_id or "").rpartition(":")
+        return int(seq) if epoch == self.epoch and seq.isdigit() else None
+
+    def stream(self, seq):
+        """Server-sent events after seq, with heartbeats; ends with a 'resync' event if it
+        falls behind. Event IDs carry the epoch, so a client reconnecting to a restarted
+        process with its Last-Event-ID is told to resync."""
+        while True:
+            events = self.since(seq) if seq is not None else None
+            if events is None:
+                yield f"event: resync\ndata: {json.dumps({'seq': self._seq, 'epoch': self.epoch})}\n\n"
+                return
+            for event in events:
+                yield f"id: {self.epoch}:{event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                seq = event["seq"]
+            if not events:
+                yield ": heartbeat\n\n"
+            self.wait(seq, HEARTBEAT_SECONDS)
+
+    def open_stream(self, seq):
+        """stream(seq) as an iterable whose close() frees its slot, or None when
+        max_streams are already open, so streams never take every server thread"""
+        if not self._streams.acquire(blocking=False):
+            return None
+        return _Stream(self.stream(seq), self._streams.release)
+
+
+class _Stream:
+    """Iterator over a stream that releases its slot once when the server closes it
+    (WSGI servers call close() even when they never started iterating)"""
+
+    def __init__(self, chunks, release):
+        self._chunks = chunks
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        release, self._release = self._release, None
+        self._chunks.close()
+        if release is not None:
+            release()
+
+
+def events_from_env(environ=os.environ):
+    """EVENT_STREAMS (default 4) caps the server-sent event streams open at once"""
+    return EventBroker(max_streams=int(environ.get('EVENT_STREAMS', DEFAULT_MAX_STREAMS)))
@@ -0,0 +1,123 @@
+import csv
+import io
+import itertools
+
+from backend.queue_logic import parse_arrival
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Optional: only needed for the Arrow and Parquet formats
+    pyarrow = None
+
+EXPORT_COLUMNS = ("history_id", "patient_id", "name", "condition", "severity",
+                  "arrival_time", "status", "served_time", "department")
+EXPORT_FORMATS = {  # format -> (mimetype, file extension)
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+DEFAULT_CHUNK_SIZE = 5_000  # Records encoded per yielded chunk
+
+
+def format_available(fmt):
+    return fmt == "csv" or (fmt in EXPORT_FORMATS and pyarrow is not None)
+
+
+def export_chunks(records, fmt="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode an iterable of history records as a stream of byte chunks.
+
+    Only one chunk of records is held at a time, so memory stays flat however
+    many records there are. Arrow is written as an IPC stream with one record
+    batch per chunk and Parquet with one row group per chunk.
+    """
+    batches = _batched(records, chunk_size)
+    if fmt == "csv":
+        return _csv_chunks(batches)
+    if fmt == "arrow":
+        return _arrow_chunks(batches, lambda sink, schema: pyarrow.ipc.new_stream(sink, schema))
+    if fmt == "parquet":
+        return _arrow_chunks(batches, lambda sink, schema: pyarrow.parquet.ParquetWriter(sink, schema))
+    raise ValueError(f"Unknown export format {fmt!r}")
+
+
+def _batched(records, size):
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows([record.get(column) for column in EXPORT_COLUMNS] for record in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # Header only: nothing matched
+
+
+def _arrow_schema():
+    timestamp = pyarrow.timestamp("s", tz="UTC")
+    return pyarrow.schema([
+        ("history_id", pyarrow.int64()),
+        ("patient_id", pyarrow.string()),
+        ("name", pyarrow.string()),
+        ("condition", pyarrow.string()),
+        ("severity", pyarrow.int8()),
+        ("arrival_time", timestamp),
+        ("status", pyarrow.string()),
+        ("served_time", timestamp),
+        ("department", pyarrow.string()),
+    ])
+
+
+def _arrow_chunks(batches, open_writer):
+    schema = _arrow_schema()
+    sink = _DrainableSink()
+    writer = open_writer(sink, schema)
+    for batch in batches:
+        columns = {column: [record.get(column) for record in batch] for column in EXPORT_COLUMNS}
+        for column in ("arrival_time", "served_time"):
+            columns[column] = [parse_arrival(value) if value else None for value in columns[column]]
+        table = pyarrow.Table.from_pydict(columns, schema=schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+class _DrainableSink:
+    """Write-only file object whose contents are handed out and dropped after every chunk"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,498 @@
+import array
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from backend.queue_logic import format_arrival, parse_arrival
+
+DEFAULT_MEMORY_LIMIT = 100_000  # Records kept by the in-memory store
+DEFAULT_HOT_LIMIT = 5_000  # Recent records the SQLite store answers from memory
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryHistoryStore:
+    """Served/treated patient records in the order they left the queue.
+
+    Each record gets a monotonically increasing ``history_id`` which doubles as
+    the pagination cursor. A per-severity index of IDs lets filtered pages be
+    sliced directly instead of scanning the whole log. With a ``capacity`` the
+    store is a ring buffer: the oldest records are dropped in batches so memory
+    stays bounded however long the server runs.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self._records = []
+        self._first_id = 1  # history_id of self._records[0]
+        self._by_severity = {}  # severity -> history_ids, ascending
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def first_id(self):
+        """history_id of the oldest record held; older ones were evicted"""
+        return self._first_id
+
+    @property
+    def next_id(self):
+        return self._first_id + len(self._records)
+
+    @property
+    def version(self):
+        """Changes whenever a record is added or evicted (which shifts offsets)"""
+        return f"{self._first_id}-{self.next_id}"
+
+    def append(self, record):
+        record = dict(record, history_id=record.get('history_id') or self.next_id)
+        self._by_severity.setdefault(record.get('severity'), []).append(record['history_id'])
+        self._records.append(record)
+        if self.capacity and len(self._records) >= self.capacity + max(64, self.capacity // 4):
+            self._evict(len(self._records) - self.capacity)
+        return record
+
+    def _evict(self, count):
+        del self._records[:count]
+        self._first_id += count
+        for severity, ids in list(self._by_severity.items()):
+            del ids[:bisect.bisect_left(ids, self._first_id)]
+            if not ids:
+                del self._by_severity[severity]
+
+    def get(self, history_id):
+        index = history_id - self._first_id
+        return self._records[index] if 0 <= index < len(self._records) else None
+
+    def covers(self, history_id):
+        """True if every record from history_id onwards is held here"""
+        return history_id >= self._first_id
+
+    def records_after(self, history_id, limit):
+        """Up to ``limit`` records appended after history_id, oldest first"""
+        return self.query(cursor=history_id, limit=limit)[0]
+
+    def query(self, offset=0, limit=None, cursor=None, severities=None, since=None, until=None):
+        """Return (records, total, next_cursor) for one page of history.
+
+        ``cursor`` is the history_id of the last record on the previous page.
+        ``since``/``until`` bound arrival_time (inclusive); ``total`` is None
+        when they are used since counting would need a full scan, and
+        ``offset`` then counts matching records only.
+        """
+        ranged = since is not None or until is not None
+        skip, offset = (offset, 0) if ranged and cursor is None else (0, offset)
+        if severities is None:
+            lanes = [range(self._first_id, self.next_id)]
+        else:
+            lanes = [self._by_severity.get(s, []) for s in severities]
+        total = sum(len(lane) for lane in lanes)
+
+        if cursor is not None:
+            streams = [_tail(lane, bisect.bisect_right(lane, cursor)) for lane in lanes]
+        elif len(lanes) == 1:
+            streams = [_tail(lanes[0], offset)]
+        else:
+            streams = [itertools.islice(heapq.merge(*lanes), offset, None)]
+        ids = streams[0] if len(streams) == 1 else heapq.merge(*streams)
+        rows = map(self.get, ids)
+        if ranged:
+            rows = itertools.islice((r for r in rows if _in_range(r, since, until)), skip, None)
+            total = None
+
+        records = list(itertools.islice(rows, limit))
+        more = limit is not None and len(records) == limit and next(rows, None) is not None
+        return records, total, records[-1]['history_id'] if more else None
+
+    def close(self):
+        pass
+
+
+class ColumnarHistoryStore(MemoryHistoryStore):
+    """MemoryHistoryStore that keeps each field in its own compact column.
+
+    Patient IDs are packed as 16 raw bytes, severities and arrival epochs go
+    into typed arrays and conditions into small integer codes, so a record
+    costs tens of bytes instead of a dict with its own key table and strings.
+    Records are rebuilt as dicts when read. Fields other than the patient's
+    are kept per record in a side table.
+    """
+
+    _NO_ARRIVAL = -1 << 63
+
+    def __init__(self, capacity=None):
+        super().__init__(capacity)
+        self._ids = bytearray()
+        self._odd_ids = {}  # history_id -> patient_id that isn't 32 hex digits
+        self._names = []
+        self._condition_codes = array.array('I')
+        self._conditions = []  # code -> condition
+        self._condition_index = {}  # condition -> code
+        self._department_codes = array.array('H')
+        self._departments = []  # code -> department
+        self._department_index = {}  # department -> code
+        self._severities = array.array('b')
+        self._arrivals = array.array('q')
+        self._statuses = array.array('b')  # index into _STATUSES
+        self._served = array.array('q')
+        self._extras = {}  # history_id -> other fields
+
+    def __len__(self):
+        return len(self._severities)
+
+    @property
+    def next_id(self):
+        return self._first_id + len(self._severities)
+
+    def append(self, record):
+        history_id = record.get('history_id') or self.next_id
+        patient_id = record.get('patient_id') or ''
+        try:
+            packed = bytes.fromhex(patient_id)
+        except ValueError:
+            packed = b''
+        if len(packed) != 16:
+            packed = bytes(16)
+            self._odd_ids[history_id] = patient_id
+        self._ids += packed
+
+        self._condition_codes.append(_code(record.get('condition'), self._conditions, self._condition_index))
+        self._department_codes.append(_code(record.get('department'), self._departments, self._department_index))
+        self._names.append(record.get('name'))
+        self._severities.append(record.get('severity') or 0)
+        arrival = record.get('arrival_time')
+        self._arrivals.append(self._NO_ARRIVAL if arrival is None else parse_arrival(arrival))
+        self._statuses.append(_STATUSES.index(record.get('status')) if record.get('status') in _STATUSES else 0)
+        served = record.get('served_time')
+        self._served.append(self._NO_ARRIVAL if served is None else parse_arrival(served))
+        extras = {k: v for k, v in record.items() if k not in _COLUMN_FIELDS}
+        if extras:
+            self._extras[history_id] = extras
+
+        self._by_severity.setdefault(record.get('severity'), []).append(history_id)
+        if self.capacity and len(self) >= self.capacity + max(64, self.capacity // 4):
+            self._evict(len(self) - self.capacity)
+        return dict(record, history_id=history_id)
+
+    def _evict(self, count):
+        del self._ids[:16 * count]
+        del self._names[:count]
+        del self._condition_codes[:count]
+        del self._department_codes[:count]
+        del self._severities[:count]
+        del self._arrivals[:count]
+        del self._statuses[:count]
+        del self._served[:count]
+        first_id = self._first_id + count
+        for table in (self._odd_ids, self._extras):
+            for history_id in [h for h in table if h < first_id]:
+                del table[history_id]
+        super()._evict(count)
+
+    def get(self, history_id):
+        index = history_id - self._first_id
+        if not 0 <= index < len(self._severities):
+            return None
+        arrival = self._arrivals[index]
+        served = self._served[index]
+        record = {
+            "patient_id": self._odd_ids.get(history_id) or self._ids[16 * index:16 * index + 16].hex(),
+            "name": self._names[index],
+            "condition": self._conditions[self._condition_codes[index]],
+            "severity": self._severities[index],
+            "arrival_time": None if arrival == self._NO_ARRIVAL else format_arrival(arrival),
+            "department": self._departments[self._department_codes[index]],
+        }
+        if self._statuses[index]:
+            record["status"] = _STATUSES[self._statuses[index]]
+        if served != self._NO_ARRIVAL:
+            record["served_time"] = format_arrival(served)
+        record.update(self._extras.get(history_id, ()))
+        record['history_id'] = history_id
+        return record
+
+
+class SQLiteHistoryStore:
+    """Append-only SQLite history with batched commits and a hot in-memory tail.
+
+    Appends go to a small in-memory ring of recent records (which serves the
+    dashboard's newest pages without touching disk) and to a pending batch that
+    a background thread commits every ``flush_interval`` seconds or as soon as
+    ``batch_size`` records are waiting, so fsync cost is paid once per batch.
+    Older pages and time-range/severity filters are answered from indexed
+    columns. Startup only reads per-severity counts and the hot tail.
+
+    With ``shared`` set, several worker processes append to the same file:
+    each record is committed immediately, SQLite assigns the history_id, and
+    every read goes to the database since no single process sees all writes.
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5, hot_capacity=DEFAULT_HOT_LIMIT,
+                 shared=False):
+        self.path = path
+        self.shared = shared
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Appends only take _lock, so they never wait on an fsync. Writers and
+        # readers of the database take _db_lock first, then _lock to swap out
+        # the pending batch.
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                history_id INTEGER PRIMARY KEY,
+                severity INTEGER,
+                arrival_time TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_severity ON history (severity, history_id);
+            CREATE INDEX IF NOT EXISTS history_arrival ON history (arrival_time);
+        """)
+        self._pending = []
+        self._counts = dict(self._conn.execute(
+            "SELECT severity, COUNT(*) FROM history GROUP BY severity"))
+        last_id = self._conn.execute("SELECT MAX(history_id) FROM history").fetchone()[0] or 0
+
+        self._hot = MemoryHistoryStore(hot_capacity)
+        self._hot._first_id = last_id + 1
+        tail = self._conn.execute(
+            "SELECT history_id, data FROM history ORDER BY history_id DESC LIMIT ?",
+            (0 if shared else hot_capacity,)).fetchall()
+        if tail:
+            self._hot._first_id = last_id - len(tail) + 1
+            for row in reversed(tail):
+                self._hot.append(_record(row))
+
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="history-flush", daemon=True)
+        self._flusher.start()
+
+    first_id = 1  # Records are never evicted
+
+    def __len__(self):
+        if self.shared:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        return sum(self._counts.values())
+
+    @property
+    def next_id(self):
+        if self.shared:
+            with self._db_lock:
+                return (self._conn.execute("SELECT MAX(history_id) FROM history").fetchone()[0] or 0) + 1
+        return self._hot.next_id
+
+    @property
+    def version(self):
+        """The next history_id; records are never removed, so only appends change pages"""
+        return str(self.next_id)
+
+    def append(self, record):
+        if self.shared:
+            with self._db_lock, self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO history (severity, arrival_time, data) VALUES (?, ?, ?)",
+                    (record.get('severity'), record.get('arrival_time'), json.dumps(record)))
+            return dict(record, history_id=cursor.lastrowid)
+        with self._lock:
+            record = self._hot.append(record)
+            self._pending.append(record)
+            severity = record.get('severity')
+            self._counts[severity] = self._counts.get(severity, 0) + 1
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+        return record
+
+    def get(self, history_id):
+        if not self.shared:
+            with self._lock:
+                if self._hot.covers(history_id):
+                    return self._hot.get(history_id)
+        with self._db_lock:
+            self._write_pending()
+            row = self._conn.execute(
+                "SELECT history_id, data FROM history WHERE history_id = ?", (history_id,)).fetchone()
+        return _record(row) if row else None
+
+    def records_after(self, history_id, limit):
+        """Up to ``limit`` records appended after history_id, oldest first"""
+        if not self.shared:
+            with self._lock:
+                if self._hot.covers(history_id + 1):
+                    return self._hot.records_after(history_id, limit)
+        with self._db_lock:
+            self._write_pending()
+            rows = self._conn.execute(
+                "SELECT history_id, data FROM history WHERE history_id > ? ORDER BY history_id LIMIT ?",
+                (history_id, limit)).fetchall()
+        return [_record(row) for row in rows]
+
+    def flush(self):
+        """Commit pending records in one transaction (one fsync)"""
+        with self._db_lock:
+            self._write_pending()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # The batch stays pending for the next try (a full disk or a locked
+                # database can clear up); back off, since appends keep waking us
+                logger.exception("Could not write history to %s; retrying", self.path)
+                time.sleep(self.flush_interval)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
+
+    def query(self, offset=0, limit=None, cursor=None, severities=None, since=None, until=None):
+        """Return (records, total, next_cursor); same contract as MemoryHistoryStore.query"""
+        with self._lock:
+            total = None
+            if since is None and until is None and not self.shared:
+                total = sum(n for s, n in self._counts.items() if severities is None or s in severities)
+            # Recent pages are served from the hot tail without touching disk
+            if severities is None and since is None and until is None and not self.shared:
+                start_id = cursor + 1 if cursor is not None else offset + 1
+                if self._hot.covers(start_id):
+                    records, _, next_cursor = self._hot.query(cursor=start_id - 1, limit=limit)
+                    return records, total, next_cursor
+
+        # Severity filters count towards the total; the cursor and arrival bounds don't
+        filters = []
+        if severities is not None:
+            filters.append(f"severity IN ({','.join('?' * len(severities))})")
+        clauses, params = list(filters), list(severities or ())
+        if cursor is not None:
+            clauses.append("history_id > ?")
+            params.append(cursor)
+        if since is not None:
+            clauses.append("arrival_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("arrival_time <= ?")
+            params.append(until)
+        sql = f"SELECT history_id, data FROM history{_where(clauses)} ORDER BY history_id LIMIT ? OFFSET ?"
+        params += [limit + 1 if limit is not None else -1, offset if cursor is None else 0]
+        with self._db_lock:
+            self._write_pending()
+            records = [_record(row) for row in self._conn.execute(sql, params)]
+            if self.shared and since is None and until is None:
+                total = self._conn.execute(
+                    f"SELECT COUNT(*) FROM history{_where(filters)}", list(severities or ())).fetchone()[0]
+
+        more = limit is not None and len(records) > limit
+        records = records[:limit] if more else records
+        return records, total, records[-1]['history_id'] if more else None
+
+    def _write_pending(self):
+        """Insert the pending batch in one transaction; caller holds _db_lock"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            rows = [(r['history_id'], r.get('severity'), r.get('arrival_time'), json.dumps(r))
+                    for r in pending]
+            try:
+                with self._conn:
+                    self._conn.executemany("INSERT INTO history VALUES (?, ?, ?, ?)", rows)
+            except BaseException:
+                # Rolled back: put the batch back ahead of anything appended since
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+
+def history_store_from_env(environ=os.environ):
+    """Pick the history backend: HISTORY_DB=path for SQLite, otherwise a bounded memory ring.
+
+    HISTORY_COLUMNAR=1 keeps the memory ring in compact columns (ColumnarHistoryStore).
+
+    When QUEUE_DB is set (multi-worker mode) history is kept in SQLite too,
+    in that same file unless HISTORY_DB says otherwise, and shared between workers.
+    """
+    path = environ.get('HISTORY_DB') or environ.get('QUEUE_DB')
+    if path:
+        return SQLiteHistoryStore(
+            path,
+            batch_size=int(environ.get('HISTORY_BATCH_SIZE', 256)),
+            flush_interval=float(environ.get('HISTORY_FLUSH_INTERVAL', 0.5)),
+            hot_capacity=int(environ.get('HISTORY_HOT_LIMIT', DEFAULT_HOT_LIMIT)),
+            shared=bool(environ.get('QUEUE_DB')),
+        )
+    store = ColumnarHistoryStore if environ.get('HISTORY_COLUMNAR') == '1' else MemoryHistoryStore
+    return store(int(environ.get('HISTORY_MEMORY_LIMIT', DEFAULT_MEMORY_LIMIT)))
+
+
+_COLUMN_FIELDS = frozenset(("patient_id", "name", "condition", "severity", "arrival_time", "history_id",
+                            "status", "served_time", "department"))
+_STATUSES = (None, "called", "treated")
+
+
+def _code(value, values, index):
+    """Small integer standing for a repeated value, adding it to the code table if new"""
+    code = index.get(value)
+    if code is None:
+        code = index[value] = len(values)
+        values.append(value)
+    return code
+
+
+def iter_records(store, batch_size=10_000, **filters):
+    """Every record in a history store (matching query() filters), oldest first, a page at a time"""
+    records, _, cursor = store.query(limit=batch_size, **filters)
+    yield from records
+    while cursor is not None:
+        records, _, cursor = store.query(cursor=cursor, limit=batch_size, **filters)
+        yield from records
+
+
+def records_since(store, arrival_time, end_id, batch_size=10_000):
+    """Records from the first one that arrived at or after arrival_time up to (not
+    including) end_id, oldest first, a batch at a time. Records after that first one
+    are all included: they left the queue later, whenever they arrived.
+    """
+    first, _, _ = store.query(limit=1, since=arrival_time)
+    cursor = first[0]['history_id'] - 1 if first else end_id
+    while cursor < end_id - 1:
+        records = store.records_after(cursor, batch_size)
+        for record in records:
+            if record['history_id'] >= end_id:
+                return
+            yield record
+        if len(records) < batch_size:
+            return
+        cursor = records[-1]['history_id']
+
+
+def _where(clauses):
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+def _record(row):
+    history_id, data = row
+    return dict(json.loads(data), history_id=history_id)
+
+
+def _in_range(record, since, until):
+    arrival = record.get('arrival_time') or ''
+    return (since is None or arrival >= since) and (until is None or arrival <= until)
+
+
+def _tail(seq, start):
+    """Iterate seq[start:] without copying it or stepping over the skipped items"""
+    return map(seq.__getitem__, range(start, len(seq)))
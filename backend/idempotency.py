@@ -0,0 +1,104 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
+DEFAULT_MAX_KEYS = 10_000
+DEFAULT_TTL = 24 * 3600  # Seconds a key is remembered; longer than any client keeps retrying
+MAX_KEY_LENGTH = 255
+
+# What ``begin`` found for a key
+NEW = "new"  # Run the request, then ``finish`` (or ``abandon``) the key
+REPLAY = "replay"  # Already answered: return the stored response
+IN_PROGRESS = "in_progress"  # Another request with this key has not finished yet
+MISMATCH = "mismatch"  # The key was used for a different request
+
+
+def fingerprint(*parts):
+    """Digest of what makes a request the same request (method, path, query, body)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        part = part if isinstance(part, bytes) else str(part).encode()
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.digest()
+
+
+class IdempotencyCache:
+    """Responses to recent mutating requests, by the client's Idempotency-Key.
+
+    A client that retries a request, or a form submitted twice, sends the
+    same key again and gets the stored response back with one dict lookup:
+    the queue is never touched a second time. A key is claimed when its
+    request starts, so a duplicate that arrives while the original is still
+    running is told so (IN_PROGRESS) rather than run alongside it, and it is
+    bound to the request's fingerprint, so reusing a key for a different
+    request is an error rather than a silent replay.
+
+    Keys are forgotten after ``ttl`` seconds, and the least recently used go
+    first once there are more than ``max_keys``. The cache is per process:
+    with the shared SQLite queue each gunicorn worker only recognises the
+    keys it has seen itself.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> [fingerprint, expires, response or None]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def begin(self, key, request_fingerprint):
+        """(NEW | REPLAY | IN_PROGRESS | MISMATCH, stored response or None)"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._entries[key] = [request_fingerprint, now + self.ttl, None]
+                self._evict(now)
+                return NEW, None
+            self._entries.move_to_end(key)
+            if entry[0] != request_fingerprint:
+                return MISMATCH, None
+            if entry[2] is None:
+                return IN_PROGRESS, None
+            return REPLAY, entry[2]
+
+    def finish(self, key, response):
+        """Store the response to replay for this key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2] = response
+
+    def abandon(self, key):
+        """Release a key whose request failed, so a retry runs it again"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is None:
+                del self._entries[key]
+
+    def _evict(self, now):
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+        # Expired keys at the cold end go now; the rest when they are looked up or pushed out
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[1] > now:
+                break
+            del self._entries[key]
+
+
+def idempotency_from_env(environ=os.environ):
+    """IDEMPOTENCY_KEYS (default 10000) and IDEMPOTENCY_TTL seconds (default a day) bound the cache"""
+    return IdempotencyCache(
+        max_keys=int(environ.get('IDEMPOTENCY_KEYS', DEFAULT_MAX_KEYS)),
+        ttl=float(environ.get('IDEMPOTENCY_TTL', DEFAULT_TTL)),
+    )
@@ -0,0 +1,239 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+
+# Request latency buckets (seconds), from sub-millisecond queue calls to slow exports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROFILE_INTERVAL = 0.005  # Seconds between profiler samples
+MAX_PROFILE_SECONDS = 60
+
+
+class _Shards:
+    """One storage object per thread, so updates on the request path never take a lock.
+
+    Only the owning thread ever writes its shard; a scrape copies every
+    shard (dict and list copies are atomic under the GIL) and sums them.
+    The lock is only taken the first time a thread records anything, and
+    by scrapes. Shards of threads that have exited are folded into a base
+    shard with ``merge`` at those points, so servers that start a thread per request
+    do not accumulate one shard per request.
+    """
+
+    def __init__(self, factory, merge):
+        self._factory = factory
+        self._merge = merge
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._base = factory()  # Totals of threads that have exited
+        self._all = []  # (thread, shard) of threads that may still record
+
+    def mine(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._factory()
+            with self._lock:
+                self._fold()
+                self._all.append((threading.current_thread(), shard))
+            return shard
+
+    def all(self):
+        with self._lock:
+            self._fold()
+            return [self._base] + [shard for _, shard in self._all]
+
+    def _fold(self):
+        """Merge the shards of exited threads into the base; caller holds _lock"""
+        live = []
+        for thread, shard in self._all:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._merge(self._base, shard)
+        self._all = live
+
+
+def _add_counts(base, shard):
+    for labels, value in shard.items():
+        base[labels] = base.get(labels, 0) + value
+
+
+def _add_cells(base, shard):
+    for labels, cell in shard.items():
+        total = base.get(labels)
+        # A new list, since a scrape may be copying the old one
+        base[labels] = list(cell) if total is None else [a + b for a, b in zip(total, cell)]
+
+
+class Counter:
+    """Monotonic count per label values"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(dict, _add_counts)
+
+    def inc(self, *labels, amount=1):
+        shard = self._shards.mine()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.all():
+            for labels, value in shard.copy().items():
+                totals[labels] = totals.get(labels, 0) + value
+        return [(self.name, self.labelnames, labels, value) for labels, value in sorted(totals.items())]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label values"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(dict, _add_cells)
+
+    def observe(self, value, *labels):
+        shard = self._shards.mine()
+        cell = shard.get(labels)
+        if cell is None:
+            # One count per bucket plus +Inf, then the sum
+            cell = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.all():
+            for labels, cell in shard.copy().items():
+                cell = list(cell)
+                total = totals.get(labels)
+                totals[labels] = cell if total is None else [a + b for a, b in zip(total, cell)]
+        samples = []
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        bucket_labelnames = self.labelnames + ("le",)
+        for labels, cell in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", bucket_labelnames, labels + (bound,), cumulative))
+            samples.append((f"{self.name}_sum", self.labelnames, labels, cell[-1]))
+            samples.append((f"{self.name}_count", self.labelnames, labels, cumulative))
+        return samples
+
+
+class Gauge:
+    """Current values read at scrape time from ``callback() -> {label values: value}``"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, callback, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+
+    def collect(self):
+        return [(self.name, self.labelnames, labels, value) for labels, value in sorted(self._callback().items())]
+
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, callback, labelnames=()):
+        return self._register(Gauge(name, help, callback, labelnames))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, labelnames, labels, value in metric.collect():
+                lines.append(f"{sample_name}{_labels(labelnames, labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class SamplingProfiler:
+    """Statistical profiler: samples every thread's stack at a fixed interval.
+
+    Costs nothing until ``sample`` is called, which watches the other
+    threads for the given number of seconds without interrupting them and
+    returns the hottest stacks in the folded format flame graph tools read:
+    ``outer;inner;leaf count`` per line. The calling thread is left out, so
+    it only sees work when requests run on other threads at the same time:
+    on a server that handles one request at a time the process is idle.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()  # One profile at a time
+
+    def sample(self, seconds, limit=None):
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already being taken")
+        try:
+            counts = collections.Counter()
+            me = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != me:
+                        counts[_folded(frame)] += 1
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common(limit))
+
+
+def _folded(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def profiler_from_env(environ=os.environ):
+    """METRICS_PROFILER=1 allows sampling profiles to be taken on demand; otherwise None"""
+    return SamplingProfiler() if environ.get('METRICS_PROFILER') == '1' else None
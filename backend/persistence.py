@@ -0,0 +1,270 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from backend.queue_logic import Patient
+
+SNAPSHOT_FILE = "snapshot.json"
+SEGMENT_PATTERN = "journal-{:06d}.log"
+
+logger = logging.getLogger(__name__)
+
+
+class JournalWriteError(OSError):
+    """A change was applied to the queue but its batch could not be written to the journal"""
+
+
+class QueueJournal:
+    """Write-ahead log for a TriageQueue with periodic compacted snapshots.
+
+    Every admit, call-next and treat is appended as a JSON line tagged with a
+    log sequence number (LSN). Lines are buffered and a background thread
+    writes and fsyncs whatever has accumulated every ``flush_interval``
+    seconds (group commit), so request handlers never wait on the disk. With
+    ``sync`` set, callers use ``wait_durable()`` after a change to block until
+    the batch holding it is on disk, sharing one fsync with everyone else in
+    that batch.
+
+    After ``snapshot_every`` records the log rolls over to a new segment and
+    the live queue is written to ``snapshot.json``; older segments are then
+    deleted. Recovery loads the snapshot and replays the remaining segments,
+    skipping records the snapshot (or an earlier segment) already includes.
+
+    A failed write keeps its batch buffered for the next flush, which goes to a
+    new segment in case the failed one ends in a torn line; ``wait_durable``
+    raises JournalWriteError instead of waiting for the retry.
+    """
+
+    def __init__(self, directory, flush_interval=0.05, snapshot_every=50_000, sync=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()  # Guards the buffer and LSN counters
+        self._io_lock = threading.Lock()  # Serializes file writes, rotation and snapshots
+        self._durable = threading.Condition(self._lock)
+        self._buffer = []
+        self._lsn = 0
+        self._durable_lsn = 0
+        self._failures = 0  # Failed writes so far, so waiters notice one
+        self._since_snapshot = 0
+        self._segment = None
+        self._file = None
+        self._queue = None
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    @property
+    def lsn(self):
+        return self._lsn
+
+    # Recovery ------------------------------------------------------------------
+
+    def recover(self, queue):
+        """Restore queue from the snapshot and log, then start journaling its changes"""
+        snapshot_lsn = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as f:
+                snapshot = json.load(f)
+            snapshot_lsn = snapshot['lsn']
+            for data in snapshot['patients']:
+                queue.add_patient(Patient.from_dict(data), data.get('order'))
+
+        last_lsn = snapshot_lsn
+        segments = self._segments()
+        for number, path in segments:
+            for record in _read_records(path):
+                # Older than the snapshot, or written again after a failed write
+                if record['lsn'] <= last_lsn:
+                    continue
+                if record['op'] == 'admit':
+                    # The snapshot may already hold patients admitted while it was taken
+                    if queue.get_patient(record['patient']['patient_id']) is None:
+                        queue.add_patient(Patient.from_dict(record['patient']), record.get('order'))
+                else:
+                    queue.remove_by_id(record['patient_id'])
+                last_lsn = record['lsn']
+
+        self._lsn = self._durable_lsn = last_lsn
+        self._since_snapshot = last_lsn - snapshot_lsn
+        self._open_segment(segments[-1][0] + 1 if segments else 1)
+        self._queue = queue
+        queue.add_listener(self._on_change)
+        self._flusher = threading.Thread(target=self._flush_loop, name="queue-journal", daemon=True)
+        self._flusher.start()
+        return queue
+
+    def _segments(self):
+        paths = glob.glob(os.path.join(self.directory, "journal-*.log"))
+        return sorted((int(os.path.basename(p)[8:14]), p) for p in paths)
+
+    # Logging -------------------------------------------------------------------
+
+    def _on_change(self, event, patient):
+        # Runs under the queue's lock, so only the change is noted here; the flusher
+        # encodes it. The admission order lets recovery keep first-come, first-served
+        # across departments.
+        order = self._queue.admission(patient.patient_id) if event == 'admitted' else None
+        with self._lock:
+            self._lsn += 1
+            self._buffer.append((self._lsn, event, patient, order))
+            self._since_snapshot += 1
+
+    def wait_durable(self):
+        """Block until everything logged so far has been fsynced (no-op unless sync is set);
+        raises JournalWriteError if a write fails first"""
+        if not self.sync:
+            return
+        with self._lock:
+            lsn = self._lsn
+            failures = self._failures
+            if self._durable_lsn < lsn:
+                self._wakeup.set()
+            while self._durable_lsn < lsn and not self._closed:
+                if self._failures != failures:
+                    raise JournalWriteError(f"Could not write the queue journal in {self.directory}")
+                self._durable.wait()
+
+    def flush(self):
+        """Write and fsync everything logged so far as one batch"""
+        with self._io_lock:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        with self._lock:
+            changes, self._buffer = self._buffer, []
+            lsn = self._lsn
+        if changes:
+            try:
+                if self._file is None:
+                    self._open_segment(self._segment + 1)
+                self._file.write("".join(map(_encode, changes)))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except BaseException:
+                # Keep the batch, ahead of anything logged since, and leave the segment:
+                # it may end in a torn line, after which replay reads nothing
+                with self._lock:
+                    self._buffer[:0] = changes
+                    self._failures += 1
+                    self._durable.notify_all()
+                self._drop_segment()
+                raise
+        with self._lock:
+            self._durable_lsn = max(self._durable_lsn, lsn)
+            self._durable.notify_all()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if self._since_snapshot >= self.snapshot_every:
+                    self.compact()
+            except Exception:
+                # A full disk can clear up; back off, since waiters keep waking us
+                logger.exception("Could not write the queue journal in %s; retrying", self.directory)
+                time.sleep(self.flush_interval)
+
+    # Compaction ----------------------------------------------------------------
+
+    def _open_segment(self, number):
+        self._segment = number
+        self._file = open(os.path.join(self.directory, SEGMENT_PATTERN.format(number)), "a")
+
+    def _drop_segment(self):
+        """Stop writing to the current segment; the next write opens a new one"""
+        file, self._file = self._file, None
+        if file is not None:
+            try:
+                file.close()
+            except OSError:
+                pass  # Its unwritten tail is still in the buffer
+
+    def compact(self):
+        """Snapshot the live queue and drop the log segments it supersedes"""
+        with self._io_lock:
+            # Roll over first so everything logged from here on lands in the new segment
+            self._write_buffer()
+            old_segment = self._segment
+            self._drop_segment()
+            self._open_segment(old_segment + 1)
+
+            patients, lsn = self._capture()
+            tmp_path = os.path.join(self.directory, SNAPSHOT_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"lsn": lsn, "patients": [dict(p.to_dict(), order=order) for order, p in patients]}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.directory, SNAPSHOT_FILE))
+            with self._lock:
+                self._since_snapshot = self._lsn - lsn
+
+            for number, path in self._segments():
+                if number <= old_segment:
+                    os.remove(path)
+
+    def _capture(self):
+        """The live queue as (order, patient) in admission order and an LSN it reflects at least.
+
+        Changes racing with the capture may be both in the snapshot and after
+        its LSN; replay is idempotent for those (admits of present patients
+        are skipped, removals of absent ones are no-ops).
+        """
+        lsn = self._lsn
+        return self._queue.admissions(), lsn
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._segment is not None:
+            self.flush()
+            self._drop_segment()
+        with self._lock:
+            self._durable.notify_all()
+
+
+def _encode(change):
+    """One journal line for a buffered (lsn, event, patient, order) change"""
+    lsn, event, patient, order = change
+    if event == 'admitted':
+        record = {"op": "admit", "patient": patient.to_dict(), "order": order, "lsn": lsn}
+    else:
+        record = {"op": event, "patient_id": patient.patient_id, "lsn": lsn}
+    return json.dumps(record) + "\n"
+
+
+def _read_records(path):
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write; nothing after it was acknowledged
+                break
+
+
+def journal_from_env(environ=os.environ, subdirectory=None):
+    """QUEUE_WAL_DIR enables the write-ahead log; QUEUE_WAL_SYNC=1 waits for fsync before replying.
+
+    ``subdirectory`` keeps one queue's journal apart from the others (one per department).
+    """
+    directory = environ.get('QUEUE_WAL_DIR')
+    if not directory:
+        return None
+    return QueueJournal(
+        os.path.join(directory, subdirectory) if subdirectory else directory,
+        flush_interval=float(environ.get('QUEUE_WAL_FLUSH_INTERVAL', 0.05)),
+        snapshot_every=int(environ.get('QUEUE_WAL_SNAPSHOT_EVERY', 50_000)),
+        sync=environ.get('QUEUE_WAL_SYNC') == '1',
+    )
@@ -1,31 +1,340 @@
+import contextlib
+import itertools
+import sys
+import threading
+import time
+import uuid
+
+from backend.departments import DEFAULT_DEPARTMENT
+from backend.scheduler import StrictPriority
+from backend.timestamps import format_arrival, parse_arrival
+from backend.wait_times import WaitTimeEstimator
+
 class Patient:
-    def __init__(self, name, condition, severity):
+    """A patient record small enough to hold millions of.
+
+    Slots instead of a per-instance dict, severity as a small int, arrival as
+    integer epoch seconds and condition strings interned, since the same few
+    conditions repeat across patients. ``arrival_time`` and ``to_dict()``
+    give the formatted wire representation.
+    """
+
+    __slots__ = ('patient_id', 'name', 'condition', 'severity', 'arrival', 'department')
+
+    def __init__(self, name, condition, severity, arrival=None):
+        self.patient_id = None  # Issued by the queue on admission
         self.name = name
-        self.condition = condition
-        self.severity = severity
-        self.arrival_time = None  # Will be set when adding to queue
+        self.condition = sys.intern(condition) if type(condition) is str else condition
+        self.severity = int(severity)
+        self.arrival = arrival  # Epoch seconds; set when adding to queue
+        self.department = None  # Set by a department's queue on admission
+
+    @property
+    def arrival_time(self):
+        return None if self.arrival is None else format_arrival(self.arrival)
+
+    @arrival_time.setter
+    def arrival_time(self, text):
+        self.arrival = None if text is None else parse_arrival(text)
+
+    def to_dict(self):
+        """Serialized fields, as sent to clients and written to the journal and history"""
+        return {
+            "patient_id": self.patient_id,
+            "name": self.name,
+            "condition": self.condition,
+            "severity": self.severity,
+            "arrival_time": self.arrival_time,
+            "department": self.department,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a patient from its serialized fields (see to_dict)"""
+        patient = cls(data['name'], data['condition'], data['severity'])
+        patient.patient_id = data.get('patient_id')
+        patient.arrival_time = data.get('arrival_time')
+        patient.department = data.get('department')
+        return patient
+
+class AdmissionOrder:
+    """Counter of admissions, shared by queues that are compared head to head.
+
+    ``advance`` moves it past an order restored from a journal, so patients
+    admitted after a restart still come after every recovered one.
+    """
 
-class TriageQueue:
     def __init__(self):
-        self.queue = []
-    
-    def add_patient(self, patient):
-        """Add a patient to the queue and sort by severity"""
-        self.queue.append(patient)
-        self.queue.sort(key=lambda x: x.severity)  # Sort by severity (1 is highest priority)
-    
+        self._count = itertools.count()
+
+    def __next__(self):
+        return next(self._count)
+
+    def advance(self, past):
+        self._count = itertools.count(max(next(self._count), past + 1))
+
+class TriageQueue:
+    """Priority queue of waiting patients, safe to share between threads.
+
+    Every operation holds one lock for just its O(log n) index updates (or
+    the page it returns); ID generation and sorting happen outside it.
+    Listeners run inside the lock, so whatever they record (history, the
+    write-ahead log) is ordered and atomic with the change itself.
+
+    ``version`` increases with every change, so callers can cache anything
+    derived from the queue until it moves.
+
+    A queue may serve one ``department``. Queues that share an ``order``
+    counter can be compared head to head, which is how ``pop_first`` calls
+    the next patient across several departments.
+
+    Patients wait in one first-come, first-served lane per severity (the
+    wait-time estimator's lanes). The ``scheduler`` ranks the lane heads
+    whenever a patient is called: StrictPriority (the default) always takes
+    the most severe, AgingPriority lets long waits catch up. ``clock`` is
+    the time aging is measured against.
+    """
+
+    def __init__(self, service_minutes=None, department=DEFAULT_DEPARTMENT, order=None,
+                 scheduler=None, clock=time.time):
+        self.department = department
+        self.scheduler = scheduler or StrictPriority()
+        self._clock = clock
+        self._lock = threading.Lock()
+        # The admission counter breaks ties so patients of the same rank stay
+        # first-come, first-served and patients themselves are never compared.
+        self._order = order if order is not None else AdmissionOrder()
+        self._entries = {}  # patient_id -> [severity, order, patient, ticket]
+        self._by_name = {}  # name -> {patient_id: None}, in admission order
+        self._wait_times = WaitTimeEstimator(service_minutes)
+        self._listeners = []
+        self._version = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def severity_counts(self):
+        """Waiting patients per severity"""
+        with self._lock:
+            return self._wait_times.counts()
+
+    @property
+    def version(self):
+        return self._version
+
+    def add_listener(self, listener):
+        """Call listener(event, patient) after every change; event is 'admitted', 'called' or 'treated'"""
+        self._listeners.append(listener)
+
+    def _notify(self, event, patient):
+        for listener in self._listeners:
+            listener(event, patient)
+
+    def add_patient(self, patient, order=None):
+        """Add a patient to the queue in O(log n), ordered by severity then arrival.
+
+        ``order`` restores the admission order a journal recorded (see ``admission``);
+        the queue's AdmissionOrder then continues after it.
+        """
+        if patient.patient_id is None:
+            patient.patient_id = uuid.uuid4().hex
+        patient.department = self.department
+        with self._lock:
+            if order is None:
+                order = next(self._order)
+            else:
+                self._order.advance(order)
+            ticket = self._wait_times.admit(patient.severity, patient, order)
+            self._entries[patient.patient_id] = [patient.severity, order, patient, ticket]
+            self._by_name.setdefault(patient.name, {})[patient.patient_id] = None
+            self._version += 1
+            self._notify('admitted', patient)
+        return patient.patient_id
+
+    def add_patients(self, patients):
+        """Admit a batch under one lock acquisition; returns the patient IDs in order"""
+        for patient in patients:
+            if patient.patient_id is None:
+                patient.patient_id = uuid.uuid4().hex
+            patient.department = self.department
+        with self._lock:
+            for patient in patients:
+                order = next(self._order)
+                ticket = self._wait_times.admit(patient.severity, patient, order)
+                self._entries[patient.patient_id] = [patient.severity, order, patient, ticket]
+                self._by_name.setdefault(patient.name, {})[patient.patient_id] = None
+            self._version += 1
+            for patient in patients:
+                self._notify('admitted', patient)
+        return [patient.patient_id for patient in patients]
+
     def get_next_patient(self):
-        """Get the next patient in the queue (highest severity)"""
-        if self.queue:
-            return self.queue.pop(0)  # Remove and return the first patient
-        return None
-    
+        """Get the next patient in the queue (highest priority), or None if it is empty"""
+        with self._lock:
+            head = self._peek(self._clock() if self.scheduler.ages else None)
+            return self._pop(head[1]) if head is not None else None
+
+    @staticmethod
+    def pop_first(queues):
+        """Call the highest-priority patient across queues sharing an order counter.
+
+        Takes every queue's lock (in a fixed order, so concurrent callers
+        cannot deadlock), compares only the k heads and pops the best one:
+        O(k + log n), and atomic, so the patient is the true head of the union.
+        """
+        queues = sorted(set(queues), key=id)
+        now = queues[0]._clock() if queues else None
+        with contextlib.ExitStack() as stack:
+            for queue in queues:
+                stack.enter_context(queue._lock)
+            heads = [(head, queue) for queue in queues for head in [queue._peek(now)] if head is not None]
+            if not heads:
+                return None
+            (_, entry), queue = min(heads, key=lambda h: h[0][0])
+            return queue._pop(entry)
+
+    def _rank(self, entry, now):
+        return self.scheduler.rank(entry[0], entry[2].arrival, now), entry[1]
+
+    def _peek(self, now):
+        """(rank, entry) of the patient to call next, or None; caller holds the lock.
+
+        Only the head of each severity lane can be next, so this ranks at most
+        one patient per severity.
+        """
+        if not self.scheduler.ages:
+            # Strict priority: the most severe lane's head, no ranking needed
+            ticket = self._wait_times.head()
+            if ticket is None:
+                return None
+            entry = self._entries[ticket.item.patient_id]
+            return (entry[0], entry[1]), entry
+        heads = self._wait_times.heads()
+        if not heads:
+            return None
+        return min((self._rank(entry, now), entry)
+                   for entry in (self._entries[ticket.item.patient_id] for ticket in heads))
+
+    def _pop(self, entry):
+        patient = entry[2]
+        self._unindex(patient)
+        self._version += 1
+        self._notify('called', patient)
+        return patient
+
+    def _iter_items(self, start=0, after=None, severities=None):
+        """Waiting patients in the order they would be called now; caller holds the lock"""
+        key = None
+        if self.scheduler.ages:
+            now = self._clock()
+            key = lambda ticket: self._rank(self._entries[ticket.item.patient_id], now)
+        return self._wait_times.iter_items(start, after, severities, key)
+
     def view_queue(self):
-        """View the current queue without modifying it"""
-        return self.queue.copy()
-    
+        """View the current queue in priority order without modifying it"""
+        with self._lock:
+            return list(self._iter_items())
+
+    def page(self, offset=0, limit=None, cursor=None, severities=None, since=None, until=None):
+        """Return (patients, total, next_cursor) for one page of the queue in priority order.
+
+        ``cursor`` is the patient_id of the last patient on the previous page.
+        ``since``/``until`` bound arrival_time (inclusive). ``total`` is None
+        when the arrival filter makes counting the whole queue necessary, and
+        ``offset`` then counts matching patients only.
+        Raises KeyError if the cursor patient has since left the queue.
+        """
+        with self._lock:
+            after = None
+            if cursor is not None:
+                after = self._entries[cursor][3]
+                offset = 0
+            ranged = since is not None or until is not None
+            items = self._iter_items(0 if ranged else offset, after, severities)
+            if ranged:
+                since = parse_arrival(since) if since is not None else None
+                until = parse_arrival(until) if until is not None else None
+                items = itertools.islice((p for p in items
+                                          if (since is None or p.arrival >= since)
+                                          and (until is None or p.arrival <= until)), offset, None)
+                total = None
+            else:
+                total = self._wait_times.count(severities)
+            patients = list(itertools.islice(items, limit))
+            more = limit is not None and len(patients) == limit and next(items, None) is not None
+        return patients, total, patients[-1].patient_id if more else None
+
+    def admission(self, patient_id):
+        """Admission order of a queued patient, or None; listeners may call it"""
+        entry = self._entries.get(patient_id)
+        return entry[1] if entry else None
+
+    def admissions(self):
+        """(order, patient) of every queued patient, in admission order"""
+        with self._lock:
+            return sorted((entry[1], entry[2]) for entry in self._entries.values())
+
+    def get_patient(self, patient_id):
+        """Look up a queued patient by ID in O(1)"""
+        entry = self._entries.get(patient_id)
+        return entry[2] if entry else None
+
+    def find_by_name(self, name):
+        """Return every queued patient with this name, in admission order"""
+        with self._lock:
+            return [self._entries[pid][2] for pid in self._by_name.get(name, ())]
+
+    def remove_by_id(self, patient_id):
+        """Remove a patient by ID without touching the rest of the queue"""
+        with self._lock:
+            return self._remove(patient_id)
+
+    def remove_many(self, patient_ids):
+        """Remove a batch by ID under one lock acquisition; None for IDs not in the queue"""
+        with self._lock:
+            return [self._remove(patient_id) for patient_id in patient_ids]
+
     def remove_patient(self, index):
-        """Remove a patient at the specified index"""
-        if 0 <= index < len(self.queue):
-            return self.queue.pop(index)
+        """Remove a patient at the specified position in priority order"""
+        with self._lock:
+            if 0 <= index < len(self._entries):
+                patient = next(self._iter_items(index))
+                return self._remove(patient.patient_id)
         return None
+
+    def wait_time(self, patient_id):
+        """Return position and estimated wait (minutes) for a queued patient in O(log n).
+
+        With an aging scheduler the position is where the patient ranks now
+        (O(log^2 n)); it ignores the aging still to come while they wait.
+        """
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                return None
+            cutoffs = None
+            if self.scheduler.ages:
+                now = self._clock()
+                rank = self.scheduler.rank(entry[0], entry[2].arrival, now)
+                cutoffs = {severity: self.scheduler.cutoff(severity, rank, now, entry[2].arrival)
+                           for severity in self._wait_times.severities()}
+            position, minutes = self._wait_times.estimate(entry[3], cutoffs)
+        return {"position": position, "estimated_wait": minutes}
+
+    def _remove(self, patient_id):
+        entry = self._entries.get(patient_id)
+        if entry is None:
+            return None
+        patient = entry[2]
+        self._unindex(patient)
+        self._version += 1
+        self._notify('treated', patient)
+        return patient
+
+    def _unindex(self, patient):
+        entry = self._entries.pop(patient.patient_id)
+        self._wait_times.remove(entry[3])
+        same_name = self._by_name[patient.name]
+        del same_name[patient.patient_id]
+        if not same_name:
+            del self._by_name[patient.name]
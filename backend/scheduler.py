@@ -0,0 +1,107 @@
+import math
+import os
+
+HOUR = 3600
+
+
+class StrictPriority:
+    """Most severe first, first-come, first-served within a severity.
+
+    The original policy: a patient's rank is their severity and never
+    changes, so severity-3 patients wait for as long as more urgent ones
+    keep arriving.
+    """
+
+    ages = False  # Ranks do not depend on the time
+
+    def rank(self, severity, arrival, now):
+        return severity
+
+    def cutoff(self, severity, rank, now, arrival=None):
+        """Patients of this severity who arrived before the cutoff, or at it and were
+        admitted earlier, are called before a patient of rank ``rank`` who arrived
+        at ``arrival``"""
+        return math.inf if severity < rank else -math.inf
+
+
+class AgingPriority:
+    """Severity minus an aging credit that grows with time waited.
+
+    ``rates`` maps severity to how many severity levels a patient gains per
+    hour of waiting (severities left out do not age). With {2: 0.5, 3: 1} a
+    severity-3 patient who has waited two hours ranks with a new severity-1
+    arrival and goes ahead of one that has just arrived.
+
+    ``floor`` caps the credit: aging never ranks a patient ahead of a fresh
+    arrival of a severity below it, so with floor=1.5 waiting patients can
+    overtake new severity-2 arrivals but never severity 1.
+
+    Everyone in a severity ages at the same rate, so their relative order
+    never changes: the queue keeps one first-come, first-served lane per
+    severity and only the lane heads are ranked at call time, in O(number of
+    severities). Nothing is ever re-sorted.
+    """
+
+    ages = True
+
+    def __init__(self, rates, floor=None):
+        for severity, rate in rates.items():
+            if rate < 0:
+                raise ValueError(f"Aging rate for severity {severity} must not be negative")
+        self.rates = dict(rates)
+        self.floor = floor
+
+    @property
+    def spec(self):
+        """The policy in TRIAGE_AGING form, e.g. "2:0.5,3:1;floor=1.5" """
+        rates = ",".join(f"{severity}:{rate:g}" for severity, rate in sorted(self.rates.items()))
+        return rates if self.floor is None else f"{rates};floor={self.floor:g}"
+
+    def _lowest(self, severity):
+        return -math.inf if self.floor is None else min(severity, self.floor)
+
+    def rank(self, severity, arrival, now):
+        rate = self.rates.get(severity, 0)
+        if not rate or arrival is None:
+            return severity
+        return max(self._lowest(severity), severity - rate * max(0, now - arrival) / HOUR)
+
+    def cutoff(self, severity, rank, now, arrival=None):
+        """Patients of this severity who arrived before the cutoff, or at it and were
+        admitted earlier (equal ranks are called in admission order), are called
+        before a patient of rank ``rank`` who arrived at ``arrival``"""
+        rate = self.rates.get(severity, 0)
+        if severity < rank:
+            return math.inf  # Ahead without any credit
+        lowest = self._lowest(severity)
+        if not rate or lowest > rank:
+            if severity == rank and arrival is not None:
+                return arrival  # Not aging, but level with the patient: admission order decides
+            return -math.inf  # Never ahead, however long they wait
+        reached = now - (severity - rank) * HOUR / rate  # Arrived by then: aged to ``rank``
+        if lowest == rank and arrival is not None:
+            # Everyone who has aged to the floor ties with the patient, so only those
+            # admitted first are ahead, and admission order follows arrival
+            return min(reached, arrival)
+        return reached
+
+
+def parse_spec(spec):
+    """AgingPriority from "2:0.5,3:1" or "2:0.5,3:1;floor=1.5"; raises ValueError"""
+    rates_spec, _, floor = spec.partition(';')
+    rates = {}
+    for item in rates_spec.split(','):
+        severity, _, rate = item.partition(':')
+        rates[int(severity)] = float(rate)
+    if floor and not floor.startswith('floor='):
+        raise ValueError(f"Expected floor=<rank> after ';' in {spec!r}")
+    return AgingPriority(rates, float(floor[len('floor='):]) if floor else None)
+
+
+def scheduler_from_env(environ=os.environ):
+    """TRIAGE_AGING=2:0.5,3:1 ages severities by that many levels per hour; otherwise strict.
+
+    Add ;floor=1.5 to stop aging short of the severity-1 lane.
+    """
+    spec = environ.get('TRIAGE_AGING')
+    return parse_spec(spec) if spec else StrictPriority()
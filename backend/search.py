@@ -0,0 +1,300 @@
+import array
+import bisect
+import collections
+import heapq
+import itertools
+import os
+import re
+import threading
+
+FIELDS = ("name", "condition")  # Free-text fields that are searched
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+CATCH_UP_BATCH = 10_000  # History records read per query when indexing what was appended elsewhere
+DEFAULT_WINDOW = 100_000  # Most recent history records that are searched
+MERGE_KEYS = 8  # A prefix expanding to more keys than this has their postings merged into one array
+MERGED_PREFIXES = 32  # Merged arrays kept for reuse, least recently used dropped first
+
+_WORD = re.compile(r"\w+")
+
+
+def words(text):
+    """Lower-cased words of a name or condition ("O'Brien-Smith" -> o, brien, smith)"""
+    return _WORD.findall(text.casefold()) if isinstance(text, str) else []
+
+
+def index_keys(name, condition, severity, department):
+    """Everything a record is found by: field-qualified words plus its severity and department"""
+    keys = {f"name:{word}" for word in words(name)}
+    keys.update(f"condition:{word}" for word in words(condition))
+    keys.add(f"severity:{severity}")
+    if department is not None:
+        keys.add(f"department:{department}")
+    return keys
+
+
+class Query:
+    """A parsed search: every word must match (as a word prefix unless ``prefix`` is off)
+    in one of ``fields``, and the record must have one of the severities and the department.
+
+    ``terms`` are (alternative keys, prefix) pairs; a record matches a term
+    when it has any of the keys (or a key starting with one, for prefixes).
+    """
+
+    def __init__(self, text, prefix=True, fields=FIELDS, severities=None, department=None):
+        for field in fields:
+            if field not in FIELDS:
+                raise ValueError(f"field must be one of {', '.join(FIELDS)}")
+        self.terms = [([f"{field}:{word}" for field in fields], prefix) for word in words(text)]
+        if severities:
+            self.terms.append(([f"severity:{severity}" for severity in severities], False))
+        if department is not None:
+            self.terms.append(([f"department:{department}"], False))
+        if not self.terms:
+            raise ValueError("q must contain a word to search for")
+
+    def matches(self, name, condition, severity, department):
+        """Check one record directly, for queues that are not indexed"""
+        keys = index_keys(name, condition, severity, department)
+        return all(any(key in keys or (prefix and any(k.startswith(key) for k in keys)) for key in alternatives)
+                   for alternatives, prefix in self.terms)
+
+
+class TokenIndex:
+    """Inverted index from keys ("name:smith") to ascending document IDs.
+
+    Each key's postings are a typed array, eight bytes per document, so a
+    million records with a handful of keys each fit in tens of megabytes.
+    Keys are also kept sorted, so a prefix expands to its keys by bisection.
+    Documents must be added in increasing ID order.
+    """
+
+    def __init__(self):
+        self._postings = {}  # key -> array of document IDs, ascending
+        self._keys = []  # Sorted, for prefix lookups
+        self._merged = collections.OrderedDict()  # prefix -> (merged postings, length of each key's postings)
+
+    def __len__(self):
+        return len(self._postings)
+
+    def add(self, doc_id, keys):
+        for key in keys:
+            postings = self._postings.get(key)
+            if postings is None:
+                postings = self._postings[key] = array.array('q')
+                bisect.insort(self._keys, key)
+            postings.append(doc_id)
+
+    def trim(self, first_id):
+        """Forget every document before first_id"""
+        for key, postings in list(self._postings.items()):
+            del postings[:bisect.bisect_left(postings, first_id)]
+            if not postings:
+                del self._postings[key]
+        self._keys = [key for key in self._keys if key in self._postings]
+        self._merged.clear()
+
+    def compact(self, keep):
+        """Forget every document for which keep(doc_id) is false"""
+        for key, postings in list(self._postings.items()):
+            postings = array.array('q', filter(keep, postings))
+            if postings:
+                self._postings[key] = postings
+            else:
+                del self._postings[key]
+        self._keys = [key for key in self._keys if key in self._postings]
+        self._merged.clear()
+
+    def _postings_for(self, keys, prefix):
+        if not prefix:
+            return [self._postings[key] for key in keys if key in self._postings]
+        found = []
+        for key in keys:
+            start = index = bisect.bisect_left(self._keys, key)
+            while index < len(self._keys) and self._keys[index].startswith(key):
+                index += 1
+            expanded = [self._postings[k] for k in self._keys[start:index]]
+            # Short prefixes ("jo") expand to hundreds of keys: one sorted array is
+            # cheaper to walk and to probe than a heap merge over all of them
+            found.extend([self._merge(key, expanded)] if len(expanded) > MERGE_KEYS else expanded)
+        return found
+
+    def _merge(self, prefix, expanded):
+        """The union of a prefix's postings, kept and extended with what was added since"""
+        cached = self._merged.get(prefix)
+        if cached is not None and len(cached[1]) == len(expanded):
+            # Same keys as last time; documents only ever arrive with larger IDs
+            merged, lengths = cached
+            tails = [postings[length:] for postings, length in zip(expanded, lengths) if len(postings) > length]
+            if tails:
+                merged.extend(sorted(itertools.chain.from_iterable(tails)))
+            self._merged.move_to_end(prefix)
+        else:
+            merged = array.array('q', sorted(itertools.chain.from_iterable(expanded)))
+            if len(self._merged) >= MERGED_PREFIXES:
+                self._merged.popitem(last=False)
+        self._merged[prefix] = (merged, [len(postings) for postings in expanded])
+        return merged
+
+    def search(self, terms, limit, before=None, after=None, keep=None):
+        """IDs of documents matching every term, newest first.
+
+        Only IDs below ``before`` and above ``after`` are considered, and only
+        those ``keep`` accepts. The term with the fewest postings drives the
+        scan; the others are checked by binary search, so a selective term
+        answers in a few microseconds per result however large the index.
+        """
+        groups = [self._postings_for(keys, prefix) for keys, prefix in terms]
+        if not all(groups):
+            return []
+        groups.sort(key=lambda group: sum(map(len, group)))
+        driver, checks = groups[0], groups[1:]
+        hits = []
+        previous = None
+        for doc_id in _descending(driver, before):
+            if after is not None and doc_id <= after:
+                break
+            if doc_id == previous:
+                continue  # In several of the driver's postings
+            previous = doc_id
+            if keep is not None and not keep(doc_id):
+                continue
+            if all(any(_contains(postings, doc_id) for postings in group) for group in checks):
+                hits.append(doc_id)
+                if len(hits) == limit:
+                    break
+        return hits
+
+
+def _descending(group, before):
+    """Every ID in the postings of a group below ``before``, largest first"""
+    streams = []
+    for postings in group:
+        end = len(postings) if before is None else bisect.bisect_left(postings, before)
+        streams.append(map(postings.__getitem__, range(end - 1, -1, -1)))
+    return streams[0] if len(streams) == 1 else heapq.merge(*streams, reverse=True)
+
+
+def _contains(postings, doc_id):
+    index = bisect.bisect_left(postings, doc_id)
+    return index < len(postings) and postings[index] == doc_id
+
+
+class PatientSearch:
+    """Word and prefix search over the waiting patients and recent history.
+
+    Queue changes arrive through ``on_change`` (a queue listener): admissions
+    are indexed, called and treated patients stop matching at once and are
+    swept out of the postings in batches. History is indexed by history_id
+    as records are appended; records appended by other processes (shared
+    SQLite history) or before the index existed are read and indexed when
+    the next query runs. Only the latest ``window`` records are searched, so
+    the index stays the same size however long durable history grows: older
+    records (and those the history store has evicted) are trimmed from the
+    index in batches.
+    """
+
+    def __init__(self, history, window=DEFAULT_WINDOW):
+        self._history = history
+        self.window = window
+        self._lock = threading.Lock()
+        self._catching_up = threading.Lock()  # One catch-up at a time; _lock is only held per batch
+        self._queue = TokenIndex()
+        self._waiting = {}  # document ID -> Patient
+        self._documents = {}  # patient_id -> document ID
+        self._next_document = 0
+        self._removed = 0  # Documents still in the postings though no longer waiting
+        self._records = TokenIndex()
+        self._indexed_through = 0  # Last history_id indexed; history is indexed in order
+        self._trimmed_to = 0
+
+    def on_change(self, event, patient):
+        """Queue listener: index admissions, forget called and treated patients"""
+        with self._lock:
+            if event == 'admitted':
+                document = self._next_document
+                self._next_document += 1
+                self._queue.add(document, index_keys(patient.name, patient.condition, patient.severity,
+                                                      patient.department))
+                self._waiting[document] = patient
+                self._documents[patient.patient_id] = document
+                return
+            document = self._documents.pop(patient.patient_id, None)
+            if document is None:
+                return
+            del self._waiting[document]
+            self._removed += 1
+            if self._removed > max(1024, len(self._waiting)):
+                self._queue.compact(self._waiting.__contains__)
+                self._removed = 0
+
+    def add_history(self, record):
+        """Index a record just appended to history; anything out of order is left to catch_up"""
+        with self._lock:
+            if record.get('history_id') == self._indexed_through + 1:
+                self._index_record(record)
+                self._trim()
+
+    def catch_up(self):
+        """Index every history record in the window appended since the last one indexed"""
+        with self._catching_up:
+            oldest = self._history.next_id - 1 - self.window
+            with self._lock:
+                if self._indexed_through < oldest:
+                    # Never built, or too far behind: skip straight to the window
+                    self._records = TokenIndex()
+                    self._indexed_through = self._trimmed_to = oldest
+                start = self._indexed_through
+            while True:
+                # Read without the index lock, so queue changes and queries carry on meanwhile
+                records = self._history.records_after(start, CATCH_UP_BATCH)
+                with self._lock:
+                    for record in records:
+                        if record['history_id'] > self._indexed_through:  # Unless add_history got there first
+                            self._index_record(record)
+                    self._trim()
+                if len(records) < CATCH_UP_BATCH:
+                    break
+                start = records[-1]['history_id']
+
+    def start_catch_up(self):
+        """Build the history index on a background thread, so the first query finds it ready"""
+        thread = threading.Thread(target=self.catch_up, name="search-catch-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _index_record(self, record):
+        self._records.add(record['history_id'], index_keys(
+            record.get('name'), record.get('condition'), record.get('severity'), record.get('department')))
+        self._indexed_through = record['history_id']
+
+    def _window_start(self):
+        """history_id of the oldest record searched"""
+        return max(self._history.first_id, self._indexed_through + 1 - self.window)
+
+    def _trim(self):
+        first_id = self._window_start()
+        if first_id > self._trimmed_to + max(1024, self.window // 4):
+            self._records.trim(first_id)
+            self._trimmed_to = first_id
+
+    def queue(self, query, limit=DEFAULT_LIMIT):
+        """Waiting patients matching the query, most recently admitted first"""
+        with self._lock:
+            documents = self._queue.search(query.terms, limit, keep=self._waiting.__contains__)
+            return [self._waiting[document] for document in documents]
+
+    def history(self, query, limit=DEFAULT_LIMIT, cursor=None):
+        """(records, next_cursor) of the history window matching the query, newest
+        first; the cursor is the history_id of the last record on the previous page"""
+        self.catch_up()
+        with self._lock:
+            ids = self._records.search(query.terms, limit + 1, before=cursor, after=self._window_start() - 1)
+        more = len(ids) > limit
+        records = [record for record in map(self._history.get, ids[:limit]) if record is not None]
+        return records, ids[limit - 1] if more else None
+
+
+def search_from_env(history, environ=os.environ):
+    """PatientSearch over the last SEARCH_HISTORY_LIMIT history records (default 100000)"""
+    return PatientSearch(history, window=int(environ.get('SEARCH_HISTORY_LIMIT', DEFAULT_WINDOW)))
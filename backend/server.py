@@ -1,85 +1,440 @@
-from flask import Flask, request, jsonify
-from backend.queue_logic import TriageQueue, Patient
+from flask import Flask, Response, request, jsonify
+from backend.export import EXPORT_FORMATS, export_chunks, format_available
+from backend.history import iter_records
+from backend.metrics import MAX_PROFILE_SECONDS
+from backend.persistence import JournalWriteError
+from backend.queue_logic import parse_arrival
+from backend.service import (
+    analytics, begin_idempotent, departments, events, history_etag, history_log, idempotency, journal_failed,
+    metrics, parse_page_args, patient_from_payload, profiler, queue_etag, queue_page, queue_version,
+    request_seconds, resolve_patient_id, search_patients, shared_queues, unknown_department, validate_timestamp,
+    wait_durable,
+)
+from backend.snapshot_cache import dumps
 from backend.flask_cors import CORS
 import datetime
+import functools
+import json
+import time
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Event-Seq", "X-Event-Epoch", "X-Department",
+                          "X-Triage-Aging", "ETag", "Idempotent-Replayed"])
 
-triage = TriageQueue()
-history_log = []
+def read_batch(key):
+    """Items of a JSON array body, a {key: [...]} object, or an NDJSON stream (one item per line)"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        return [json.loads(line) for line in request.stream if line.strip()]
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get(key)
+    if not isinstance(data, list):
+        raise ValueError(f"Expected a JSON array, {{\"{key}\": [...]}} or NDJSON body")
+    return data
 
-def validate_timestamp(timestamp_str):
+def not_modified(etag):
+    """304 for a client that already holds this version of the resource, else None"""
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+    return None
+
+def page_response(rows, total, next_cursor):
+    """JSON list of rows (or its encoded bytes), with paging metadata in headers so the body shape is unchanged"""
+    response = Response(rows if isinstance(rows, bytes) else dumps(rows), mimetype='application/json')
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+def idempotent(view):
+    """Answer a repeated Idempotency-Key with the first response, without running the view again.
+
+    Error responses (5xx) and exceptions release the key so the client can retry.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        stored, error, status = begin_idempotent(key, request.method, request.path, request.query_string,
+                                                 request.get_data())
+        if error:
+            # 409: the first request with this key is still running; retry to get its answer
+            return jsonify(error), status, {'Retry-After': '1'} if status == 409 else {}
+        if stored is not None:
+            status, content_type, body = stored
+            return Response(body, status=status, content_type=content_type, headers={'Idempotent-Replayed': 'true'})
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency.abandon(key)
+            raise
+        if response.status_code >= 500:
+            idempotency.abandon(key)
+        else:
+            idempotency.finish(key, (response.status_code, response.content_type, response.get_data()))
+        return response
+    return wrapper
+
+@app.errorhandler(JournalWriteError)
+def journal_write_failed(error):
+    """QUEUE_WAL_SYNC=1 and the change could not be made durable"""
+    body, status = journal_failed()
+    return jsonify(body), status, {'Retry-After': '5'}
+
+@app.before_request
+def start_timer():
+    request.environ['metrics.start'] = time.perf_counter()
+
+@app.after_request
+def record_timing(response):
+    start = request.environ.get('metrics.start')
+    if start is not None:
+        # The route pattern, not the path, keeps the label set small
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - start, endpoint, request.method, response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Sample the other threads for ?seconds= and return the hottest stacks in folded format.
+
+    Only requests running meanwhile on other threads show up, so this needs a
+    threaded server (the Procfile's gthread workers); a sync worker would be idle.
+    """
+    if profiler is None:
+        return jsonify({"error": "Profiling is disabled; set METRICS_PROFILER=1"}), 404
+    if not holds_thread_ok():
+        return jsonify({"error": "This worker handles one request at a time, so there is nothing to sample "
+                                 "while profiling; run a threaded server (gunicorn --worker-class gthread)"}), 501
     try:
-        datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        return True
+        seconds = min(float(request.args.get('seconds', 10)), MAX_PROFILE_SECONDS)
+        limit = int(request.args.get('limit', 50))
     except ValueError:
-        return False
+        return jsonify({"error": "seconds and limit must be numbers"}), 400
+    try:
+        stacks = profiler.sample(seconds, limit)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return Response(stacks, mimetype='text/plain')
 
 @app.route('/')
 def home():
     return "🚑 Hospital Queue Management API is running."
 
+@app.route('/departments', methods=['GET'])
+def list_departments():
+    return jsonify({
+        "default": departments.default,
+        "departments": [{"name": name, "waiting": len(queue)} for name, queue in departments.items()],
+    })
+
 @app.route('/add_patient', methods=['POST'])
+@idempotent
 def add_patient():
-    data = request.json
-    # Create patient with additional arrival_time property
-    patient = Patient(
-        name=data['name'], 
-        condition=data['condition'], 
-        severity=data['severity']
-    )
+    try:
+        patient = patient_from_payload(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    department = request.json.get('department')
+    if department is not None and department not in departments:
+        return jsonify(unknown_department(department)[0]), 404
     
-    # Add arrival time to patient object
-    patient.arrival_time = data.get('arrival_time', datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+    patient_id = departments.get(department).add_patient(patient)
+    wait_durable()
+    return jsonify({"message": "Patient added successfully", "patient_id": patient_id})
+
+@app.route('/add_patients', methods=['POST'])
+def add_patients():
+    """Admit a batch in one pass and one merge per department queue, with a result per item.
+
+    Items go to their own "department", else the ?department= of the request.
+    """
+    try:
+        items = read_batch('patients')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    default = request.args.get('department') or departments.default
     
-    triage.add_patient(patient)
-    return jsonify({"message": "Patient added successfully"})
+    results = []
+    batches = {}  # department -> (patients, their results)
+    for index, data in enumerate(items):
+        try:
+            patient = patient_from_payload(data)
+        except ValueError as e:
+            results.append({"index": index, "error": str(e), "status": 400})
+            continue
+        department = data.get('department') or default
+        if department not in departments:
+            error, status = unknown_department(department)
+            results.append(dict(error, index=index, status=status))
+            continue
+        result = {"index": index}
+        results.append(result)
+        patients, batch_results = batches.setdefault(department, ([], []))
+        patients.append(patient)
+        batch_results.append(result)
+    
+    added = 0
+    for department, (patients, batch_results) in batches.items():
+        for result, patient_id in zip(batch_results, departments.get(department).add_patients(patients)):
+            result["patient_id"] = patient_id
+        added += len(patients)
+    wait_durable()
+    return jsonify({"added": added, "failed": len(results) - added, "results": results})
 
-@app.route('/next_patient', methods=['GET'])
+# POST is the method clients should use; GET is kept for older dashboards
+@app.route('/next_patient', methods=['GET', 'POST'])
+@idempotent
 def next_patient():
-    patient = triage.get_next_patient()
+    """Call the next patient in ?department=, or the most urgent across ?departments=a,b"""
+    names = (request.args.get('departments') or request.args.get('department') or departments.default).split(',')
+    unknown = [name for name in names if name not in departments]
+    if unknown:
+        return jsonify(unknown_department(unknown[0])[0]), 404
+    patient = departments.call_next(names)
+    wait_durable()
     if patient:
-        # Add the patient to history log
-        history_log.append(vars(patient))
-        return jsonify(vars(patient))
+        return jsonify(patient.to_dict())
     else:
         return jsonify({"message": "No patients in queue"}), 404
 
 @app.route('/view_queue', methods=['GET'])
 def view_queue():
-    return jsonify([vars(p) for p in triage.view_queue()])
+    department = request.args.get('department') or departments.default
+    if department not in departments:
+        return jsonify(unknown_department(department)[0]), 404
+    triage = departments.get(department)
+    # A page only depends on the queue version and the query string, so clients
+    # polling with If-None-Match get a 304 until the queue changes
+    version = queue_version(triage)
+    etag = queue_etag(department, version)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+
+    try:
+        body, total, next_cursor, seq = queue_page(department, version, request.args, request.query_string)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = page_response(body, total, next_cursor)
+    if not shared_queues:
+        response.headers['X-Event-Seq'] = str(seq)
+        response.headers['X-Event-Epoch'] = events.epoch
+    response.headers['X-Department'] = department
+    if triage.scheduler.ages:
+        response.headers['X-Triage-Aging'] = triage.scheduler.spec
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response
+
+def holds_thread_ok():
+    """True when the server runs requests on threads, so one can wait (long polls, streams)
+    without stalling every other request; gunicorn's sync workers handle one at a time"""
+    return request.environ.get('wsgi.multithread', False)
+
+def events_unavailable():
+    """404 for the event routes under shared queues, where they would only show this worker's changes"""
+    return jsonify({"error": "Queue events are not available with a shared queue; poll /view_queue with If-None-Match"}), 404
+
+@app.route('/events', methods=['GET'])
+def queue_events():
+    """Queue changes after ?since=<seq> of ?epoch=; ?wait=<seconds> long-polls until there is
+    one (on threaded servers; a single-threaded worker answers at once).
+
+    410 tells the client to reload /view_queue: it fell behind the backlog, or its
+    seq comes from another epoch (before a restart, or another worker).
+    """
+    if shared_queues:
+        return events_unavailable()
+    try:
+        since = int(request.args.get('since', 0))
+        wait = min(float(request.args.get('wait', 0)), 30)
+    except ValueError:
+        return jsonify({"error": "since and wait must be numbers"}), 400
+    epoch = request.args.get('epoch')
+    if epoch is not None and epoch != events.epoch:
+        return jsonify({"error": "The backend restarted, reload /view_queue", "seq": events.seq,
+                        "epoch": events.epoch}), 410
+    if wait > 0 and holds_thread_ok():
+        events.wait(since, wait)
+    changes = events.since(since)
+    if changes is None:
+        return jsonify({"error": "Too far behind, reload /view_queue", "seq": events.seq, "epoch": events.epoch}), 410
+    return jsonify({"seq": changes[-1]['seq'] if changes else since, "epoch": events.epoch, "events": changes})
+
+@app.route('/events/stream', methods=['GET'])
+def stream_events():
+    """Server-sent events; reconnecting clients resume from their Last-Event-ID ("epoch:seq").
+
+    Each stream holds a server thread for as long as it is open, so streams need a
+    threaded worker (the Procfile runs gunicorn's gthread workers) and at most
+    EVENT_STREAMS are open at once; clients beyond that should poll /events.
+    """
+    if shared_queues:
+        return events_unavailable()
+    if not holds_thread_ok():
+        return jsonify({"error": "Event streams need a threaded server (gunicorn --worker-class gthread); "
+                                 "poll /events instead"}), 501
+    last_event_id = request.headers.get('Last-Event-ID')
+    try:
+        if last_event_id:
+            since = events.position(last_event_id)  # None (resync) if from another epoch
+        else:
+            since = int(request.args.get('since', events.seq))
+    except ValueError:
+        return jsonify({"error": "since must be a number"}), 400
+    if request.args.get('epoch', events.epoch) != events.epoch:
+        since = None
+    stream = events.open_stream(since)
+    if stream is None:
+        return jsonify({"error": "Too many event streams open, poll /events instead"}), 503, {'Retry-After': '30'}
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/wait_time', methods=['GET'])
+def wait_time():
+    patient_id = request.args.get('patient_id')
+    queue = departments.owner(patient_id) if patient_id else None
+    estimate = queue.wait_time(patient_id) if queue is not None else None
+    if estimate is None:
+        return jsonify({"error": "Patient not found in queue"}), 404
+    return jsonify(dict(estimate, patient_id=patient_id))
 
 @app.route('/history', methods=['GET'])
 def history():
-    return jsonify(history_log)
+    etag = history_etag()
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    try:
+        page_args = parse_page_args(request.args)
+        if page_args['cursor'] is not None:
+            page_args['cursor'] = int(page_args['cursor'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = page_response(*history_log.query(**page_args))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Waiting patients and history by words or word prefixes of their name and condition"""
+    try:
+        return jsonify(search_patients(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/history/export', methods=['GET'])
+def export_history():
+    """Stream history as CSV (or Arrow/Parquet with pyarrow) in constant memory.
+
+    Accepts the same severity/since/until filters as /history; since and
+    until may also be plain dates (YYYY-MM-DD), covering whole days.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if not format_available(fmt):
+        return jsonify({"error": f"{fmt} export needs pyarrow installed on the server"}), 501
+    args = request.args.to_dict()
+    for bound, time_of_day in (('since', '00:00:00'), ('until', '23:59:59')):
+        if len(args.get(bound, '')) == 10:
+            args[bound] = f"{args[bound]} {time_of_day}"
+    try:
+        page_args = parse_page_args(args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    records = iter_records(history_log, severities=page_args['severities'],
+                           since=page_args['since'], until=page_args['until'])
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"patient_history_{datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return Response(export_chunks(records, fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Arrivals, served counts and wait percentiles, optionally grouped by hour, day, severity or condition"""
+    try:
+        bounds = {}
+        for bound in ('since', 'until'):
+            value = request.args.get(bound)
+            if value and not validate_timestamp(value):
+                raise ValueError(f"{bound} must be formatted as YYYY-MM-DD HH:MM:SS")
+            bounds[bound] = parse_arrival(value) if value else None
+        quantiles = [float(q) for q in request.args.get('quantiles', '0.5,0.9,0.99').split(',')]
+        if not all(0 <= q <= 1 for q in quantiles):
+            raise ValueError("quantiles must be between 0 and 1")
+        report = analytics.report(group_by=request.args.get('group_by') or None, quantiles=quantiles, **bounds)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report)
 
 @app.route('/mark_treated', methods=['POST'])
+@idempotent
 def mark_treated():
-    data = request.json
-    patient_name = data.get('name')
-    
-    if not patient_name:
-        return jsonify({"error": "Patient name is required"}), 400
-    
-    # Find patient in queue
-    queue = triage.view_queue()
-    found = False
+    patient_id, error, status = resolve_patient_id(request.json)
+    if error:
+        return jsonify(error), status
     
-    for i, patient in enumerate(queue):
-        if patient.name == patient_name:
-            # Add to history
-            history_log.append(vars(patient))
-            
-            # Remove from queue
-            triage.remove_patient(i)
-            found = True
-            break
+    queue = departments.owner(patient_id)
+    patient = queue.remove_by_id(patient_id) if queue is not None else None
+    wait_durable()
     
-    if found:
-        return jsonify({"message": f"Patient {patient_name} marked as treated"})
+    if patient:
+        return jsonify({"message": f"Patient {patient.name} marked as treated", "patient_id": patient.patient_id})
     else:
         return jsonify({"error": "Patient not found in queue"}), 404
 
+@app.route('/mark_treated_batch', methods=['POST'])
+def mark_treated_batch():
+    """Treat a batch of patients (IDs, or {"patient_id"}/{"name"} objects) with a result per item"""
+    try:
+        items = read_batch('patients')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    results = []
+    patient_ids = []
+    for index, item in enumerate(items):
+        reference = {"patient_id": item} if isinstance(item, str) else item
+        if not isinstance(reference, dict):
+            results.append({"index": index, "error": "Expected a patient ID or object", "status": 400})
+            continue
+        patient_id, error, status = resolve_patient_id(reference)
+        if error:
+            results.append(dict(error, index=index, status=status))
+        else:
+            results.append({"index": index, "patient_id": patient_id})
+            patient_ids.append(patient_id)
+    
+    # One removal pass per department holding any of the patients
+    by_queue = {}
+    for position, patient_id in enumerate(patient_ids):
+        by_queue.setdefault(departments.owner(patient_id), []).append(position)
+    removed = [None] * len(patient_ids)
+    for queue, positions in by_queue.items():
+        if queue is not None:
+            for position, patient in zip(positions, queue.remove_many([patient_ids[p] for p in positions])):
+                removed[position] = patient
+    removed = iter(removed)
+    treated = 0
+    for result in results:
+        if "error" in result:
+            continue
+        if next(removed) is None:
+            result.update(error="Patient not found in queue", status=404)
+        else:
+            treated += 1
+    wait_durable()
+    return jsonify({"treated": treated, "failed": len(results) - treated, "results": results})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5002)
@@ -0,0 +1,320 @@
+"""The queue service behind every HTTP front end.
+
+Builds the department queues, history, journals, analytics, event broker
+and metrics from the environment once per process, plus the validation
+and paging helpers the Flask app (backend.server) and the ASGI app
+(backend.asgi) share, so both serve the same state the same way.
+"""
+
+import atexit
+import datetime
+import itertools
+import time
+
+from backend.analytics import DAY, QueueAnalytics, backfill_days_from_env
+from backend.departments import DEFAULT_DEPARTMENT, departments_from_env
+from backend.events import events_from_env
+from backend.history import SQLiteHistoryStore, history_store_from_env, records_since
+from backend.idempotency import IN_PROGRESS, MAX_KEY_LENGTH, MISMATCH, REPLAY, fingerprint, idempotency_from_env
+from backend.metrics import MetricsRegistry, profiler_from_env
+from backend.persistence import journal_from_env
+from backend.queue_logic import AdmissionOrder, TriageQueue, Patient, format_arrival
+from backend.scheduler import scheduler_from_env
+from backend.search import DEFAULT_LIMIT, FIELDS, MAX_LIMIT, Query, search_from_env
+from backend.shared_queue import queue_from_env
+from backend.snapshot_cache import SnapshotCache, dumps
+
+# In-memory department queues draw admission order from one counter, so
+# calling across departments stays first-come, first-served within a severity
+admission_order = AdmissionOrder()
+# Set TRIAGE_AGING=2:0.5,3:1 so long waits raise priority (in-memory queues only;
+# the shared SQLite queue always calls strictly by severity)
+scheduler = scheduler_from_env()
+
+def make_queue(department):
+    # Set QUEUE_DB to share the queues (and history) between gunicorn workers through SQLite
+    queue = queue_from_env(department=department)
+    if queue is None:
+        queue = TriageQueue(department=department, order=admission_order, scheduler=scheduler)
+    return queue
+
+# Set DEPARTMENTS=ed,pediatrics,... for one independently locked queue per department
+departments = departments_from_env(make_queue)
+# Shared SQLite queues also change in other workers, which this one never hears about
+shared_queues = not all(isinstance(queue, TriageQueue) for _, queue in departments.items())
+# Bounded in-memory ring by default; set HISTORY_DB to keep durable history in SQLite
+history_log = history_store_from_env()
+atexit.register(history_log.close)
+# Word and prefix search over waiting patients and recent history for /search; the
+# history index is built in the background and kept to the last SEARCH_HISTORY_LIMIT records
+search = search_from_env(history_log)
+search.start_catch_up()
+
+# Set QUEUE_WAL_DIR to journal the live queues and restore them after a restart,
+# one subdirectory per department (the default "general" one keeps the top level).
+# The shared SQLite queue is durable on its own and needs no journal.
+journals = []
+for name, queue in departments.items():
+    journal = journal_from_env(subdirectory=None if name == DEFAULT_DEPARTMENT else name) \
+        if isinstance(queue, TriageQueue) else None
+    if journal is not None:
+        journal.recover(queue)
+        atexit.register(journal.close)
+        journals.append(journal)
+
+def record_history(event, patient):
+    """Log called/treated patients from inside the queue's lock, so pop-and-log is atomic"""
+    if event != 'admitted':
+        search.add_history(history_log.append(
+            dict(patient.to_dict(), status=event, served_time=format_arrival(int(time.time())))))
+
+# Added after recovery so replaying the journal does not log patients twice
+departments.add_listener(record_history)
+
+# Hourly/daily throughput and wait aggregates for /stats: the recovered queue now,
+# recent durable history in the background (ANALYTICS_BACKFILL_DAYS), and every
+# change from here on through the listener
+backfill_days = backfill_days_from_env()
+# Hourly detail is kept as far back as a restart rebuilds it (at least a day)
+analytics = QueueAnalytics(hour_retention=int(max(backfill_days, 1) * DAY))
+analytics.backfill((), itertools.chain.from_iterable(queue.view_queue() for _, queue in departments.items()))
+if backfill_days > 0:
+    # Only records logged before the listener takes over, so none is counted twice
+    analytics.start_backfill(records_since(
+        history_log, format_arrival(int(time.time() - backfill_days * DAY)), history_log.next_id))
+departments.add_listener(analytics.on_change)
+
+# In-memory queues are indexed as they change; shared ones are scanned (they are short)
+if not shared_queues:
+    for _, queue in departments.items():
+        for patient in queue.view_queue():
+            search.on_change('admitted', patient)
+    departments.add_listener(search.on_change)
+
+# Live dashboards follow queue changes through /events instead of re-downloading the queue.
+# Each worker numbers only its own changes, so with shared queues dashboards poll
+# /view_queue with If-None-Match instead (no X-Event-Seq is sent and /events is off)
+events = events_from_env()
+departments.add_listener(events.publish)
+
+# Versions of in-process queues and history restart with the process, so their ETags
+# carry this ID (the event epoch) and a page cached before a restart never revalidates.
+# SQLite state keeps its versions across restarts and workers, and its ETags must not vary by worker.
+BOOT_ID = events.epoch
+
+# Encoded /view_queue pages per department and queue version; polling between changes is a dict lookup
+snapshots = {name: SnapshotCache() for name in departments}
+
+# Prometheus metrics for /metrics. Updates go to per-thread shards, so timing a
+# request or counting a queue change never contends on a lock
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Time to handle a request (until the body starts when streaming)",
+    ("endpoint", "method", "status"))
+queue_changes = metrics.counter(
+    "triage_queue_changes_total", "Patients admitted, called and treated", ("department", "event", "severity"))
+departments.add_listener(lambda event, patient: queue_changes.inc(patient.department, event, patient.severity))
+
+def queue_depths():
+    depths = {}
+    for name, queue in departments.items():
+        counts = queue.severity_counts()
+        for severity in SEVERITY_LEVELS:
+            depths[(name, severity)] = counts.get(severity, 0)
+    return depths
+
+metrics.gauge("triage_queue_depth", "Patients waiting", queue_depths, ("department", "severity"))
+metrics.gauge("triage_history_records", "Records held by the history store", lambda: {(): len(history_log)})
+metrics.gauge("triage_event_seq", "Sequence number of the last queue event", lambda: {(): events.seq})
+
+# Set METRICS_PROFILER=1 to allow /debug/profile to sample hot stacks on demand
+profiler = profiler_from_env()
+
+# Responses to recent admissions and calls by Idempotency-Key, so retries and
+# double submissions replay the first answer instead of changing the queue again
+idempotency = idempotency_from_env()
+
+def validate_timestamp(timestamp_str):
+    try:
+        datetime.datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+SEVERITY_LEVELS = (1, 2, 3)
+
+def patient_from_payload(data):
+    """Validate one admission payload and build its Patient; raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("Patient must be a JSON object")
+    for field in ('name', 'condition'):
+        if not isinstance(data.get(field), str) or not data[field].strip():
+            raise ValueError(f"{field} is required")
+    if type(data.get('severity')) is not int or data['severity'] not in SEVERITY_LEVELS:
+        raise ValueError("severity must be 1, 2 or 3")
+    if data.get('department') is not None and not isinstance(data['department'], str):
+        raise ValueError("department must be a string")
+    arrival_time = data.get('arrival_time')
+    if arrival_time is None or arrival_time == "":
+        arrival_time = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    if not isinstance(arrival_time, str) or not validate_timestamp(arrival_time):
+        raise ValueError("arrival_time must be a string formatted as YYYY-MM-DD HH:MM:SS")
+    patient = Patient(name=data['name'], condition=data['condition'], severity=data['severity'])
+    patient.arrival_time = arrival_time
+    return patient
+
+def unknown_department(name):
+    return {"error": f"Unknown department {name}", "departments": list(departments)}, 404
+
+def resolve_patient_id(data):
+    """Turn a {"patient_id"} or {"name"} reference into (patient_id, error, status).
+
+    Names are looked up in the reference's "department", or in every department.
+    Anything but a JSON object (including no body) is a 400, and so are IDs,
+    names and departments that are not strings.
+    """
+    if not isinstance(data, dict):
+        return None, {"error": "Patient ID or name is required"}, 400
+    for field in ('patient_id', 'name', 'department'):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return None, {"error": f"{field} must be a string"}, 400
+    patient_id = data.get('patient_id')
+    patient_name = data.get('name')
+    if patient_id:
+        return patient_id, None, None
+    if not patient_name:
+        return None, {"error": "Patient ID or name is required"}, 400
+    department = data.get('department')
+    if department is not None and department not in departments:
+        return (None, *unknown_department(department))
+    # Names are not unique, so only resolve them when there is exactly one match
+    matches = departments.find_by_name(patient_name, [department] if department else None)
+    if len(matches) > 1:
+        return None, {
+            "error": f"Multiple patients named {patient_name} in queue, specify patient_id",
+            "patient_ids": [p.patient_id for p in matches]
+        }, 409
+    if not matches:
+        return None, {"error": "Patient not found in queue"}, 404
+    return matches[0].patient_id, None, None
+
+def begin_idempotent(key, method, path, query_string, body):
+    """Claim an Idempotency-Key for a request: (stored response, None, None) to replay,
+    (None, error, status) to refuse, or (None, None, None) to run the request and
+    then ``idempotency.finish`` (or ``abandon``) the key.
+
+    Stored responses are (status, content type, body bytes).
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None, {"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}, 400
+    outcome, stored = idempotency.begin(key, fingerprint(method, path, query_string, body))
+    if outcome == REPLAY:
+        return stored, None, None
+    if outcome == IN_PROGRESS:
+        return None, {"error": "A request with this Idempotency-Key is still in progress"}, 409
+    if outcome == MISMATCH:
+        return None, {"error": "This Idempotency-Key was already used for a different request"}, 422
+    return None, None, None
+
+def wait_durable():
+    """With QUEUE_WAL_SYNC=1, hold the response until the change is fsynced;
+    raises JournalWriteError when the journal cannot be written"""
+    for journal in journals:
+        journal.wait_durable()
+
+def journal_failed():
+    return {"error": "The change was applied but could not be written to the journal; "
+                     "check the queue before retrying"}, 503
+
+def parse_page_args(args):
+    """Read offset/limit/cursor and severity/arrival filters from the query string"""
+    offset = int(args.get('offset', 0))
+    limit = args.get('limit')
+    limit = int(limit) if limit is not None else None
+    if offset < 0 or (limit is not None and limit < 1):
+        raise ValueError("offset must be >= 0 and limit >= 1")
+    severity = args.get('severity')
+    severities = {int(s) for s in severity.split(',')} if severity else None
+    for bound in ('since', 'until'):
+        if args.get(bound) and not validate_timestamp(args[bound]):
+            raise ValueError(f"{bound} must be formatted as YYYY-MM-DD HH:MM:SS")
+    return {
+        "offset": offset,
+        "limit": limit,
+        "cursor": args.get('cursor'),
+        "severities": severities,
+        "since": args.get('since') or None,
+        "until": args.get('until') or None,
+    }
+
+def search_patients(args):
+    """/search response: waiting patients (the first ?limit=) and a page of recent
+    history matching ?q=, newest first; raises ValueError for bad arguments.
+
+    ?match=token matches whole words only (default: word prefixes), ?field= limits
+    the words to name or condition, ?severity= and ?department= filter, and
+    ?cursor= (the previous page's next_cursor) pages through history.
+    """
+    scope = args.get('scope', 'all')
+    if scope not in ('all', 'queue', 'history'):
+        raise ValueError("scope must be all, queue or history")
+    match = args.get('match', 'prefix')
+    if match not in ('prefix', 'token'):
+        raise ValueError("match must be prefix or token")
+    limit = int(args.get('limit', DEFAULT_LIMIT))
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    cursor = int(args['cursor']) if args.get('cursor') else None
+    severity = args.get('severity')
+    query = Query(args.get('q', ''), prefix=match == 'prefix',
+                  fields=(args['field'],) if args.get('field') else FIELDS,
+                  severities={int(s) for s in severity.split(',')} if severity else None,
+                  department=args.get('department') or None)
+    result = {}
+    if scope != 'history':
+        if not shared_queues:
+            patients = search.queue(query, limit)
+        else:
+            patients = [p for _, queue in departments.items() for p in queue.view_queue()
+                        if query.matches(p.name, p.condition, p.severity, p.department)][:limit]
+        result["queue"] = [p.to_dict() for p in patients]
+    if scope != 'queue':
+        result["history"], result["next_cursor"] = search.history(query, limit, cursor)
+    return result
+
+def queue_version(triage):
+    """What a /view_queue page depends on: the queue version, plus the minute
+    under aging priorities, whose ranks and estimates move with the clock"""
+    if triage.scheduler.ages:
+        return f"{triage.version}-{int(time.time()) // 60}"
+    return str(triage.version)
+
+def queue_etag(department, version):
+    """ETag of a /view_queue page at a queue_version"""
+    return f"{department}-{version}" if shared_queues else f"{BOOT_ID}-{department}-{version}"
+
+def history_etag():
+    """ETag of every /history page: history only grows (or drops its oldest records),
+    so its version tells clients whether any page could have changed"""
+    version = history_log.version
+    return version if isinstance(history_log, SQLiteHistoryStore) else f"{BOOT_ID}-{version}"
+
+def queue_page(department, version, args, query_string):
+    """(body, total, next_cursor, seq) of one /view_queue page, encoded once per
+    queue version and query string; raises ValueError for bad arguments"""
+    cached = snapshots[department].get(version, query_string)
+    if cached is None:
+        triage = departments.get(department)
+        # Read before the snapshot: events after this seq may already be reflected in it,
+        # which clients tolerate because applying events is idempotent
+        seq = events.seq
+        page_args = parse_page_args(args)
+        try:
+            patients, total, next_cursor = triage.page(**page_args)
+        except KeyError:
+            raise ValueError("Cursor patient is no longer in the queue")
+        # Each patient carries its queue position and ETA from the incremental estimator
+        # (a patient called since the page was read simply has no estimate)
+        rows = [dict(p.to_dict(), **(triage.wait_time(p.patient_id) or {})) for p in patients]
+        cached = snapshots[department].put(version, query_string, (dumps(rows), total, next_cursor, seq))
+    return cached
@@ -0,0 +1,295 @@
+import os
+import sqlite3
+import threading
+import uuid
+
+from backend.departments import DEFAULT_DEPARTMENT
+from backend.queue_logic import Patient
+from backend.scheduler import StrictPriority
+from backend.wait_times import BASE_SERVICE_MINUTES, DEFAULT_SERVICE_MINUTES, MIN_WAIT_MINUTES
+
+BUSY_TIMEOUT = 30  # Seconds a worker waits for another worker's write transaction
+
+
+class SQLiteTriageQueue:
+    """TriageQueue whose state lives in a SQLite database shared by every worker.
+
+    Drop-in for TriageQueue when gunicorn runs several worker processes (or
+    threads): each one opens the same database file in WAL mode, so readers
+    never block writers. Calling the next patient selects and deletes the head
+    row inside a ``BEGIN IMMEDIATE`` transaction, which takes SQLite's write
+    lock up front; two workers can never pop the same patient. Ordering uses an
+    index on (severity, seq) where seq is an autoincrementing admission number.
+
+    Each department is a SQLiteTriageQueue over the same table, restricted
+    to its rows by a department column; seq is shared, so ``pop_first`` can
+    call the next patient across departments in a single transaction.
+
+    Listeners only see changes made by this process. Patients are always
+    called strictly by severity: aging would need every row re-ranked.
+    """
+
+    scheduler = StrictPriority()
+
+    def __init__(self, path, service_minutes=None, department=DEFAULT_DEPARTMENT):
+        self.path = path
+        self.department = department
+        self.service_minutes = dict(service_minutes or BASE_SERVICE_MINUTES)
+        self._local = threading.local()
+        self._listeners = []
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS queue (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                patient_id TEXT NOT NULL UNIQUE,
+                severity INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                condition TEXT,
+                arrival_time TEXT
+            );
+            CREATE INDEX IF NOT EXISTS queue_name ON queue (name);
+        """)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(queue)")]
+        if "department" not in columns:
+            # Databases from before departments: existing rows belong to the default one
+            conn.execute(f"ALTER TABLE queue ADD COLUMN department TEXT NOT NULL DEFAULT '{DEFAULT_DEPARTMENT}'")
+        conn.execute("DROP INDEX IF EXISTS queue_priority")
+        conn.execute("CREATE INDEX IF NOT EXISTS queue_department ON queue (department, severity, seq)")
+
+    def _conn(self):
+        """One connection per thread; sqlite3 connections are not thread-safe"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM queue WHERE department = ?",
+                                    (self.department,)).fetchone()[0]
+
+    def severity_counts(self):
+        """Waiting patients per severity"""
+        return dict(self._conn().execute(
+            "SELECT severity, COUNT(*) FROM queue WHERE department = ? GROUP BY severity", (self.department,)))
+
+    @property
+    def version(self):
+        """Changes whenever any worker changes the queue: admissions raise the
+        last-issued seq and removals lower the row count"""
+        last_seq, count = self._conn().execute(
+            "SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'queue'),"
+            " (SELECT COUNT(*) FROM queue WHERE department = ?)", (self.department,)).fetchone()
+        return f"{last_seq or 0}-{count}"
+
+    def add_listener(self, listener):
+        """Call listener(event, patient) after every change made by this process"""
+        self._listeners.append(listener)
+
+    def _notify(self, event, patient):
+        for listener in self._listeners:
+            listener(event, patient)
+
+    def add_patient(self, patient):
+        """Insert a patient; ordering comes from the (severity, seq) index"""
+        if patient.patient_id is None:
+            patient.patient_id = uuid.uuid4().hex
+        patient.department = self.department
+        self._conn().execute(f"INSERT INTO queue ({_INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", _values(patient))
+        self._notify('admitted', patient)
+        return patient.patient_id
+
+    def add_patients(self, patients):
+        """Insert a batch in one transaction; returns the patient IDs in order"""
+        for patient in patients:
+            if patient.patient_id is None:
+                patient.patient_id = uuid.uuid4().hex
+            patient.department = self.department
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(f"INSERT INTO queue ({_INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                             [_values(p) for p in patients])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        for patient in patients:
+            self._notify('admitted', patient)
+        return [patient.patient_id for patient in patients]
+
+    def get_next_patient(self):
+        """Atomically remove and return the head of the queue across all workers"""
+        return self.pop_first([self])
+
+    @staticmethod
+    def pop_first(queues):
+        """Call the highest-priority patient across departments sharing one database.
+
+        seq is common to every department, so a single indexed query inside
+        one write transaction finds and removes the head of their union.
+        """
+        by_department = {queue.department: queue for queue in queues}
+        conn = queues[0]._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM queue WHERE department IN ({','.join('?' * len(by_department))})"
+                " ORDER BY severity, seq LIMIT 1", list(by_department)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM queue WHERE seq = ?", (row[0],))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        patient = _patient(row)
+        by_department[patient.department]._notify('called', patient)
+        return patient
+
+    def view_queue(self):
+        """View the current queue in priority order without modifying it"""
+        rows = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM queue WHERE department = ? ORDER BY severity, seq", (self.department,))
+        return [_patient(row) for row in rows]
+
+    def page(self, offset=0, limit=None, cursor=None, severities=None, since=None, until=None):
+        """Same contract as TriageQueue.page; raises KeyError for an unknown cursor"""
+        conn = self._conn()
+        # Severity filters apply to both the page and the total; the cursor and
+        # arrival bounds only to the page
+        filters, filter_params = ["department = ?"], [self.department]
+        if severities is not None:
+            filters.append(f"severity IN ({','.join('?' * len(severities))})")
+            filter_params.extend(severities)
+        clauses, params = list(filters), list(filter_params)
+        if cursor is not None:
+            row = conn.execute("SELECT severity, seq FROM queue WHERE patient_id = ? AND department = ?",
+                               (cursor, self.department)).fetchone()
+            if row is None:
+                raise KeyError(cursor)
+            clauses.append("(severity, seq) > (?, ?)")
+            params.extend(row)
+            offset = 0
+        if since is not None:
+            clauses.append("arrival_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("arrival_time <= ?")
+            params.append(until)
+        rows = conn.execute(
+            f"SELECT {_COLUMNS} FROM queue{_where(clauses)} ORDER BY severity, seq LIMIT ? OFFSET ?",
+            params + [limit + 1 if limit is not None else -1, offset]).fetchall()
+
+        total = None
+        if since is None and until is None:
+            total = conn.execute(f"SELECT COUNT(*) FROM queue{_where(filters)}", filter_params).fetchone()[0]
+        more = limit is not None and len(rows) > limit
+        patients = [_patient(row) for row in rows[:limit]]
+        return patients, total, patients[-1].patient_id if more else None
+
+    def get_patient(self, patient_id):
+        row = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM queue WHERE patient_id = ? AND department = ?",
+            (patient_id, self.department)).fetchone()
+        return _patient(row) if row else None
+
+    def find_by_name(self, name):
+        """Return every queued patient with this name, in admission order"""
+        rows = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM queue WHERE name = ? AND department = ? ORDER BY seq", (name, self.department))
+        return [_patient(row) for row in rows]
+
+    def remove_by_id(self, patient_id):
+        """Remove a patient by ID; only one worker can succeed for a given patient"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM queue WHERE patient_id = ? AND department = ?",
+                (patient_id, self.department)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM queue WHERE seq = ?", (row[0],))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        patient = _patient(row)
+        self._notify('treated', patient)
+        return patient
+
+    def remove_many(self, patient_ids):
+        """Remove a batch by ID in one transaction; None for IDs not in the queue"""
+        conn = self._conn()
+        removed = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for patient_id in patient_ids:
+                row = conn.execute(
+                    f"SELECT {_COLUMNS} FROM queue WHERE patient_id = ? AND department = ?",
+                    (patient_id, self.department)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM queue WHERE seq = ?", (row[0],))
+                removed.append(row)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        patients = [_patient(row) if row else None for row in removed]
+        for patient in patients:
+            if patient is not None:
+                self._notify('treated', patient)
+        return patients
+
+    def wait_time(self, patient_id):
+        """Position and estimated wait from index range counts of the patients ahead"""
+        conn = self._conn()
+        row = conn.execute("SELECT severity, seq FROM queue WHERE patient_id = ? AND department = ?",
+                           (patient_id, self.department)).fetchone()
+        if row is None:
+            return None
+        severity, seq = row
+        ahead = conn.execute(
+            "SELECT severity, COUNT(*) FROM queue WHERE department = ? AND (severity < ? OR (severity = ? AND seq < ?))"
+            " GROUP BY severity", (self.department, severity, severity, seq)).fetchall()
+        position = sum(count for _, count in ahead) + 1
+        minutes = sum(count * self.service_minutes.get(s, DEFAULT_SERVICE_MINUTES) for s, count in ahead)
+        minutes += self.service_minutes.get(severity, DEFAULT_SERVICE_MINUTES)
+        return {"position": position, "estimated_wait": max(MIN_WAIT_MINUTES, minutes)}
+
+
+_COLUMNS = "seq, patient_id, severity, name, condition, arrival_time, department"
+_INSERT_COLUMNS = "patient_id, severity, name, condition, arrival_time, department"
+
+
+def _where(clauses):
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+def _values(patient):
+    return (patient.patient_id, patient.severity, patient.name, patient.condition, patient.arrival_time,
+            patient.department)
+
+
+def _patient(row):
+    _, patient_id, severity, name, condition, arrival_time, department = row
+    return Patient.from_dict({
+        "patient_id": patient_id,
+        "name": name,
+        "condition": condition,
+        "severity": severity,
+        "arrival_time": arrival_time,
+        "department": department,
+    })
+
+
+def queue_from_env(environ=os.environ, department=DEFAULT_DEPARTMENT):
+    """QUEUE_DB=path shares the queue between workers through SQLite; otherwise None"""
+    path = environ.get('QUEUE_DB')
+    return SQLiteTriageQueue(path, department=department) if path else None
@@ -0,0 +1,47 @@
+import json
+import threading
+
+try:
+    import orjson  # Optional: several times faster than the json module on large pages
+except ImportError:
+    orjson = None
+
+DEFAULT_MAX_ENTRIES = 64  # Distinct page/filter combinations cached per queue version
+
+
+def dumps(obj):
+    """Encode obj as compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+class SnapshotCache:
+    """Encoded responses for the current queue version, keyed by request.
+
+    Everything cached belongs to one version; the first lookup or store for
+    a different version drops it all. A snapshot is built after reading the
+    version, so it may include later changes too, but a reader can never see
+    that older version again, so nothing stale is served.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._entries = {}
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                return None
+            return self._entries.get(key)
+
+    def put(self, version, key, value):
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._entries = {}
+            if len(self._entries) < self.max_entries:
+                self._entries[key] = value
+        return value
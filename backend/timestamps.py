@@ -0,0 +1,15 @@
+import datetime
+import time
+
+ARRIVAL_FORMAT = "%Y-%m-%d %H:%M:%S"  # UTC; the format clients send and receive
+_EPOCH = datetime.datetime(1970, 1, 1)
+_SECOND = datetime.timedelta(seconds=1)
+
+
+def parse_arrival(text):
+    """Epoch seconds for a UTC "YYYY-MM-DD HH:MM:SS" timestamp"""
+    return (datetime.datetime.fromisoformat(text) - _EPOCH) // _SECOND
+
+
+def format_arrival(epoch):
+    return time.strftime(ARRIVAL_FORMAT, time.gmtime(epoch))
@@ -0,0 +1,257 @@
+import heapq
+import itertools
+import math
+
+BASE_SERVICE_MINUTES = {1: 15, 2: 10, 3: 5}  # Expected minutes per severity level
+DEFAULT_SERVICE_MINUTES = 5
+MIN_WAIT_MINUTES = 5
+
+
+class _Fenwick:
+    """Binary indexed tree over 0/1 slot flags, grown by doubling"""
+
+    def __init__(self, size=64):
+        self.tree = [0] * (size + 1)
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, index, delta):
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """Sum of slots [0, index)"""
+        total = 0
+        i = index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        """Index of the slot holding the k-th (0-based) set flag"""
+        pos = 0
+        bit = 1 << (len(self.tree) - 1).bit_length()
+        while bit:
+            nxt = pos + bit
+            if nxt < len(self.tree) and self.tree[nxt] <= k:
+                pos = nxt
+                k -= self.tree[nxt]
+            bit >>= 1
+        return pos
+
+    @classmethod
+    def from_flags(cls, flags, size):
+        fenwick = cls(size)
+        tree = fenwick.tree
+        tree[1:len(flags) + 1] = flags
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        return fenwick
+
+
+class Ticket:
+    """A patient's place in its severity lane, and their admission order across lanes"""
+    __slots__ = ("severity", "slot", "item", "order")
+
+    def __init__(self, severity, slot, item=None, order=None):
+        self.severity = severity
+        self.slot = slot
+        self.item = item
+        self.order = order
+
+
+class _Lane:
+    """Patients of one severity in admission order, with live counts per prefix"""
+
+    def __init__(self):
+        self.slots = []  # Ticket, or None once the patient has left
+        self.fenwick = _Fenwick()
+        self.live = 0
+        self.first = 0  # No waiting ticket before this slot
+
+    def append(self, ticket):
+        ticket.slot = len(self.slots)
+        self.slots.append(ticket)
+        if len(self.slots) > len(self.fenwick):
+            self._rebuild(2 * len(self.fenwick))
+        else:
+            self.fenwick.add(ticket.slot, 1)
+        self.live += 1
+
+    def remove(self, ticket):
+        self.slots[ticket.slot] = None
+        self.fenwick.add(ticket.slot, -1)
+        self.live -= 1
+        if self.live == 0:
+            self.slots = []
+            self.fenwick = _Fenwick()
+            self.first = 0
+        elif len(self.slots) > 2 * self.live + 64:
+            # Compact away departed slots so a lane that never drains stays O(live)
+            self.slots = [t for t in self.slots if t is not None]
+            self.first = 0
+            for slot, t in enumerate(self.slots):
+                t.slot = slot
+            self._rebuild(max(64, 2 * len(self.slots)))
+
+    def ahead(self, ticket):
+        return self.fenwick.prefix(ticket.slot)
+
+    def head(self):
+        """First waiting ticket (amortised O(1)), or None"""
+        slots, first = self.slots, self.first
+        while first < len(slots) and slots[first] is None:
+            first += 1
+        self.first = first
+        return slots[first] if first < len(slots) else None
+
+    def count_before(self, arrival, order=None):
+        """Waiting patients who arrived before ``arrival``, or at ``arrival`` and
+        were admitted before ``order``, in O(log^2 n).
+
+        Assumes arrivals increase in admission order, as they do for patients
+        admitted when they arrive; otherwise the count is approximate.
+        """
+        low, high = 0, self.live
+        while low < high:
+            middle = (low + high) // 2
+            ticket = self.slots[self.fenwick.find(middle)]
+            ticket_arrival = ticket.item.arrival
+            if ticket_arrival is not None and (
+                    ticket_arrival < arrival
+                    or ticket_arrival == arrival and order is not None and ticket.order < order):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _rebuild(self, size):
+        flags = [0 if t is None else 1 for t in self.slots]
+        self.fenwick = _Fenwick.from_flags(flags, size)
+
+
+class WaitTimeEstimator:
+    """Incremental queue position and ETA per patient.
+
+    Keeps one lane per severity with a Fenwick tree of who is still waiting,
+    so admitting, calling or treating a patient is O(log n) and estimating a
+    patient's wait only needs the head counts of more urgent lanes plus a
+    prefix count in its own lane.
+    """
+
+    def __init__(self, service_minutes=None):
+        self.service_minutes = dict(service_minutes or BASE_SERVICE_MINUTES)
+        self._lanes = {}
+
+    def admit(self, severity, item=None, order=None):
+        lane = self._lanes.get(severity)
+        if lane is None:
+            lane = self._lanes[severity] = _Lane()
+        ticket = Ticket(severity, 0, item, order)
+        lane.append(ticket)
+        return ticket
+
+    def remove(self, ticket):
+        self._lanes[ticket.severity].remove(ticket)
+
+    def _minutes(self, severity):
+        return self.service_minutes.get(severity, DEFAULT_SERVICE_MINUTES)
+
+    def severities(self):
+        return self._lanes.keys()
+
+    def head(self):
+        """The longest-waiting ticket of the most urgent non-empty lane"""
+        urgent = min((severity for severity, lane in self._lanes.items() if lane.live), default=None)
+        return self._lanes[urgent].head() if urgent is not None else None
+
+    def heads(self):
+        """The longest-waiting ticket of every non-empty lane"""
+        return [lane.head() for lane in self._lanes.values() if lane.live]
+
+    def estimate(self, ticket, cutoffs=None):
+        """Return (position, estimated wait in minutes) for a waiting patient.
+
+        Patients of more urgent severities are all counted ahead, unless
+        ``cutoffs`` maps a severity to the arrival time before which its
+        patients rank ahead (see scheduler.AgingPriority.cutoff); those who
+        arrived at the cutoff itself tie on rank and are ahead if they were
+        admitted first.
+        """
+        ahead = 0
+        minutes = 0
+        for severity, lane in self._lanes.items():
+            if severity == ticket.severity:
+                continue
+            if cutoffs is None:
+                count = lane.live if severity < ticket.severity else 0
+            elif cutoffs[severity] == math.inf:
+                count = lane.live
+            elif cutoffs[severity] == -math.inf:
+                count = 0
+            else:
+                count = lane.count_before(cutoffs[severity], ticket.order)
+            ahead += count
+            minutes += count * self._minutes(severity)
+        same = self._lanes[ticket.severity].ahead(ticket)
+        ahead += same
+        minutes += (same + 1) * self._minutes(ticket.severity)
+        return ahead + 1, max(MIN_WAIT_MINUTES, minutes)
+
+    def counts(self):
+        """Waiting patients per severity"""
+        return {severity: lane.live for severity, lane in self._lanes.items()}
+
+    def count(self, severities=None):
+        """Number of waiting patients, optionally only for some severities"""
+        return sum(lane.live for severity, lane in self._lanes.items()
+                   if severities is None or severity in severities)
+
+    def iter_items(self, start=0, after=None, severities=None, key=None):
+        """Yield waiting items in priority order.
+
+        Starts at the ``start``-th item (counted among ``severities`` only) or,
+        when ``after`` is given, just behind that ticket. Skipping to the start
+        costs O(log n) rather than walking the lanes ahead of it.
+
+        With ``key(ticket)`` the lanes are merged by key instead of taken in
+        severity order (for aging priorities); skipping is then O(start).
+        """
+        if key is not None:
+            yield from self._merged_items(start, after, severities, key)
+            return
+        for severity in sorted(self._lanes):
+            if severities is not None and severity not in severities:
+                continue
+            lane = self._lanes[severity]
+            if after is not None:
+                if severity < after.severity:
+                    continue
+                slot = after.slot + 1 if severity == after.severity else 0
+            elif start >= lane.live:
+                start -= lane.live
+                continue
+            else:
+                slot = lane.fenwick.find(start)
+                start = 0
+            for ticket in itertools.islice(lane.slots, slot, None):
+                if ticket is not None:
+                    yield ticket.item
+
+    def _merged_items(self, start, after, severities, key):
+        lanes = [(ticket for ticket in lane.slots if ticket is not None)
+                 for severity, lane in self._lanes.items()
+                 if severities is None or severity in severities]
+        tickets = heapq.merge(*lanes, key=key)
+        if after is not None:
+            for ticket in tickets:
+                if ticket is after:
+                    break
+        for ticket in itertools.islice(tickets, start if after is None else 0, None):
+            yield ticket.item
@@ -0,0 +1,94 @@
+"""/stats aggregates vs scanning raw history.
+
+Simulates months of traffic (arrivals and calls with random waits) through a
+QueueAnalytics listener and keeps the equivalent raw history records. Then
+times reports over the whole range, grouped several ways, against computing
+the same figures by scanning the records, and checks that the sketched
+percentiles are within the promised relative error.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_analytics [days] [patients_per_hour]
+"""
+import random
+import statistics
+import sys
+import time
+
+from backend.analytics import RELATIVE_ACCURACY, QueueAnalytics
+from backend.queue_logic import Patient, format_arrival, parse_arrival
+
+CONDITIONS = ["Chest pain", "Fracture", "Fever", "Laceration", "Burn", "Asthma", "Migraine",
+              "Abdominal pain", "Allergic reaction", "Sprain", "Head injury", "Dehydration"]
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+
+
+def simulate(days, per_hour, seed=7):
+    """Feed the listener and return the raw history records it saw"""
+    rng = random.Random(seed)
+    now = [START]
+    analytics = QueueAnalytics(clock=lambda: now[0])
+    records = []
+    for hour in range(days * 24):
+        for _ in range(per_hour):
+            arrival = START + hour * 3600 + rng.randrange(3600)
+            patient = Patient("Patient", rng.choice(CONDITIONS), rng.choice((1, 2, 3)))
+            patient.arrival = arrival
+            analytics.on_change('admitted', patient)
+            now[0] = arrival + int(rng.expovariate(1 / (600 * patient.severity)))
+            event = 'called' if rng.random() < 0.8 else 'treated'
+            analytics.on_change(event, patient)
+            records.append(dict(patient.to_dict(), status=event, served_time=format_arrival(now[0])))
+    return analytics, records
+
+
+def scan(records, key):
+    """The same figures computed from raw records, the way a report used to be built"""
+    groups = {}
+    for record in records:
+        arrival = parse_arrival(record['arrival_time'])
+        wait = parse_arrival(record['served_time']) - arrival
+        groups.setdefault(key(record), []).append(wait)
+    return {k: statistics.quantiles(waits, n=100, method='inclusive') for k, waits in groups.items()}
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main(argv):
+    days = int(argv[0]) if argv else 180
+    per_hour = int(argv[1]) if len(argv) > 1 else 20
+    start = time.perf_counter()
+    analytics, records = simulate(days, per_hour)
+    print(f"{len(records):,} patients over {days} days, recorded in {time.perf_counter() - start:.1f} s")
+
+    since = START + 3 * 3600 + 1800  # Ragged start so partial days are exercised
+    until = START + (days - 1) * 86400 + 5 * 3600
+    print("\nreport            aggregates    raw scan")
+    keys = {None: lambda r: None, "severity": lambda r: r['severity'],
+            "condition": lambda r: r['condition'], "day": lambda r: r['arrival_time'][:10]}
+    for group_by, key in keys.items():
+        report, fast = timed(lambda: analytics.report(since, until, group_by))
+        _, slow = timed(lambda: scan(records, key), repeat=1)
+        print(f"{str(group_by):<15} {fast * 1000:9.2f} ms {slow * 1000:9.0f} ms")
+
+    # Accuracy over the whole range, per severity
+    report = analytics.report(group_by="severity", quantiles=(0.5, 0.9, 0.99))
+    exact = scan(records, lambda r: r['severity'])
+    worst = 0.0
+    for group in report["groups"]:
+        for label, index in (("p50", 49), ("p90", 89), ("p99", 98)):
+            true = exact[group["key"]][index] / 60
+            worst = max(worst, abs(group["wait_minutes"][label] - true) / true)
+    print(f"\nworst relative percentile error {worst:.2%} (bound {RELATIVE_ACCURACY:.0%} plus 0.1 min rounding)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
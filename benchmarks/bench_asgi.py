@@ -0,0 +1,202 @@
+"""Many concurrent connections: the asyncio front end vs threaded workers.
+
+Opens --connections keep-alive connections (1000 by default) to a server and
+has every one of them send requests back to back for --seconds: mostly
+/view_queue polls, with admissions and call-next in equal numbers so the
+queue stays about the same length. Reports requests per second and the
+p50/p99/p99.9 latency of each endpoint, as seen by the client.
+
+The target is started on a free local port, or given as a URL:
+
+- ``asgi``: backend.asgi on its built-in HTTP server (no dependencies)
+- ``uvicorn``: backend.asgi under uvicorn, if installed
+- ``gunicorn``: backend.server (Flask) under gunicorn sync workers, if installed
+- ``http://host:port``: a server that is already running
+
+Sync workers serve one connection at a time and close it after each
+response, so with --workers 4 the other 996 connections queue in the
+listen backlog; the p99 shows it. The client is a single asyncio process,
+so at high rates it can become the bottleneck itself: watch its CPU.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_asgi [--target asgi|uvicorn|gunicorn|URL] [--connections 1000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+MIX = {"view_queue": 0.8, "add_patient": 0.1, "next_patient": 0.1}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(target, port, workers):
+    """Spawn the server for a named target; returns the process"""
+    if target == "asgi":
+        command = [sys.executable, "-m", "backend.asgi", str(port)]
+    elif target == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "backend.asgi:app", "--port", str(port),
+                   "--log-level", "warning", "--backlog", "4096"]
+    elif target == "gunicorn":
+        if shutil.which("gunicorn") is None:
+            sys.exit("gunicorn is not installed")
+        command = ["gunicorn", "backend.server:app", "--bind", f"127.0.0.1:{port}",
+                   "--workers", str(workers), "--backlog", "4096", "--log-level", "warning"]
+    else:
+        sys.exit(f"Unknown target {target}")
+    process = subprocess.Popen(command, env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"{target} exited with status {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    sys.exit(f"{target} did not start listening on port {port}")
+
+
+def build_request(op, host, rng):
+    if op == "add_patient":
+        body = json.dumps({"name": f"Patient {rng.randrange(10**6)}", "condition": "Fever",
+                           "severity": rng.choice((1, 2, 3))}).encode()
+        head = (f"POST /add_patient HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n")
+        return head.encode() + body
+    if op == "next_patient":
+        return f"POST /next_patient HTTP/1.1\r\nHost: {host}\r\nContent-Length: 0\r\n\r\n".encode()
+    return f"GET /view_queue?limit=20 HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+
+
+async def read_response(reader):
+    """(status, keep_alive) after reading one Content-Length delimited response"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+    length, keep_alive = 0, not status_line.startswith(b"HTTP/1.0")
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection":
+            keep_alive = value.strip().lower() != b"close"
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def connection(host, port, deadline, rng, latencies, errors, ready):
+    """One client: requests back to back until deadline[0], reconnecting when the server closes"""
+    reader = writer = None
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors.append("connect")
+    await ready.wait()
+    ops, weights = zip(*MIX.items())
+    while time.perf_counter() < deadline[0]:
+        op = rng.choices(ops, weights)[0]
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(build_request(op, f"{host}:{port}", rng))
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            errors.append(op)
+            keep_alive = False
+        else:
+            if status >= 500:
+                errors.append(op)
+            else:
+                latencies[op].append(time.perf_counter() - start)
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def measure(host, port, connections, seconds, seed):
+    """Open the connections, then let them all send requests for ``seconds``"""
+    latencies = {op: [] for op in MIX}
+    errors = []
+    ready = asyncio.Event()
+    deadline = [0.0]
+    tasks = [asyncio.ensure_future(connection(host, port, deadline, random.Random(seed + index),
+                                              latencies, errors, ready))
+             for index in range(connections)]
+    await asyncio.sleep(min(5, 0.5 + connections / 1000))  # Let the connections open before the clock starts
+    start = time.perf_counter()
+    deadline[0] = start + seconds
+    ready.set()
+    await asyncio.gather(*tasks)
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--target", default="asgi", help="asgi, uvicorn, gunicorn or a server URL")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    # Every connection is a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = args.connections + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    process = None
+    if args.target.startswith("http"):
+        url = urlsplit(args.target)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        process = start_server(args.target, port, args.workers)
+    try:
+        latencies, errors, elapsed = asyncio.run(measure(host, port, args.connections, args.seconds, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"{args.target}: {args.connections} connections for {args.seconds:g} s, "
+          f"{total:,} requests, {total / elapsed:,.0f} req/s, {len(errors):,} errors\n")
+    print(f"{'endpoint':<14}{'requests':>10}{'p50':>10}{'p99':>10}{'p99.9':>10}")
+    for op, samples in latencies.items():
+        if samples:
+            print(f"{op:<14}{len(samples):>10,}{percentile(samples, 50) * 1e3:>7.1f} ms"
+                  f"{percentile(samples, 99) * 1e3:>7.1f} ms{percentile(samples, 99.9) * 1e3:>7.1f} ms")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
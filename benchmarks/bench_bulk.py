@@ -0,0 +1,83 @@
+"""Bulk admission/treatment vs one patient at a time.
+
+Compares a loop of add_patient/remove_by_id calls against single
+add_patients/remove_many calls on the in-memory queue and the shared SQLite
+queue. With --http the same comparison goes through the Flask app (test
+client), where the per-request overhead is what batching saves.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bulk [--http] [sizes...]
+"""
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+from backend.queue_logic import TriageQueue, Patient
+from backend.shared_queue import SQLiteTriageQueue
+
+
+def make_patients(n):
+    patients = []
+    for i in range(n):
+        patient = Patient(f"Patient {i}", "Fracture", (i % 3) + 1)
+        patient.arrival_time = "2024-01-01 00:00:00"
+        patients.append(patient)
+    return patients
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_queue(label, make_queue, n):
+    queue = make_queue()
+    ids = []
+    admit_one = timed(lambda: ids.extend(queue.add_patient(p) for p in make_patients(n)))
+    treat_one = timed(lambda: [queue.remove_by_id(pid) for pid in ids])
+    queue = make_queue()
+    ids = []
+    admit_bulk = timed(lambda: ids.extend(queue.add_patients(make_patients(n))))
+    treat_bulk = timed(lambda: queue.remove_many(ids))
+    print(f"{label:<8} {n:>8,}  admit {admit_one * 1000:9.1f} ms -> {admit_bulk * 1000:9.1f} ms"
+          f"   treat {treat_one * 1000:9.1f} ms -> {treat_bulk * 1000:9.1f} ms")
+
+
+def bench_http(n):
+    from backend.server import app
+    client = app.test_client()
+    payload = [{"name": f"Patient {i}", "condition": "Fracture", "severity": (i % 3) + 1}
+               for i in range(n)]
+
+    ids = []
+    admit_one = timed(lambda: ids.extend(
+        client.post('/add_patient', json=p).get_json()['patient_id'] for p in payload))
+    treat_one = timed(lambda: [client.post('/mark_treated', json={"patient_id": pid}) for pid in ids])
+
+    ids = []
+    admit_bulk = timed(lambda: ids.extend(
+        r['patient_id'] for r in client.post('/add_patients', json=payload).get_json()['results']))
+    treat_bulk = timed(lambda: client.post('/mark_treated_batch', json=ids))
+    print(f"http     {n:>8,}  admit {admit_one * 1000:9.1f} ms -> {admit_bulk * 1000:9.1f} ms"
+          f"   treat {treat_one * 1000:9.1f} ms -> {treat_bulk * 1000:9.1f} ms")
+
+
+def main(argv):
+    http = "--http" in argv
+    sizes = [int(a) for a in argv if a != "--http"] or [1_000, 10_000]
+    print("backend         n  one at a time -> bulk")
+    with tempfile.TemporaryDirectory() as tmp:
+        databases = itertools.count()
+        for n in sizes:
+            bench_queue("memory", TriageQueue, n)
+            bench_queue("sqlite", lambda: SQLiteTriageQueue(os.path.join(tmp, f"queue{next(databases)}.db")), n)
+            if http:
+                bench_http(n)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
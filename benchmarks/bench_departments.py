@@ -0,0 +1,100 @@
+"""Throughput of one shared queue vs one queue per department.
+
+The same client threads run the same mix of admissions, call-next,
+treat-by-ID and page reads, first against a single department and then
+spread over 2, 4 and 8 departments (client i works in department i mod N),
+with a share of calls going through the cross-department call_next. Each
+department has its own lock, so clients in different departments stop
+queueing behind each other; how much that buys depends on the interpreter
+(under the GIL it shows mostly in tail latency). Checks that no patient was
+served twice or lost.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_departments [clients] [ops_per_client]
+"""
+import itertools
+import random
+import sys
+import threading
+import time
+
+from backend.departments import Departments
+from backend.queue_logic import Patient, TriageQueue
+
+CROSS_CALL_SHARE = 0.05  # Calls that take the most urgent patient of every department
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def client(departments, department, client_id, ops, barrier, latencies, admitted):
+    rng = random.Random(client_id)
+    queue = departments.get(department)
+    everywhere = list(departments)
+    mine = []
+    timings = []
+    barrier.wait()
+    for i in range(ops):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.5:
+            patient = Patient(f"C{client_id}-{i}", "Laceration", rng.choice((1, 2, 3)))
+            patient.arrival_time = "2024-01-01 00:00:00"
+            mine.append(queue.add_patient(patient))
+        elif roll < 0.5 + CROSS_CALL_SHARE:
+            departments.call_next(everywhere)
+        elif roll < 0.7:
+            queue.get_next_patient()
+        elif roll < 0.85 and mine:
+            queue.remove_by_id(mine.pop(rng.randrange(len(mine))))
+        else:
+            queue.page(limit=10)
+        timings.append(time.perf_counter() - start)
+    latencies.extend(timings)
+    admitted.extend(mine)
+
+
+def run(department_count, clients, ops):
+    order = itertools.count()
+    names = [f"dept{d}" for d in range(department_count)]
+    departments = Departments(lambda name: TriageQueue(department=name, order=order), names)
+    served = []
+    served_lock = threading.Lock()
+
+    def record(event, patient):
+        if event != 'admitted':
+            with served_lock:
+                served.append(patient.patient_id)
+
+    departments.add_listener(record)
+    barrier = threading.Barrier(clients + 1)
+    latencies, admitted = [], []
+    threads = [threading.Thread(target=client, args=(departments, names[c % department_count], c, ops,
+                                                     barrier, latencies, admitted))
+               for c in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    while departments.call_next(names) is not None:
+        pass
+    assert len(served) == len(set(served)), "a patient was served twice"
+    assert all(len(queue) == 0 for _, queue in departments.items())
+
+    print(f"{department_count:>11} {clients * ops / elapsed:11,.0f} "
+          f"{percentile(latencies, 50) * 1e6:9.1f} us {percentile(latencies, 99) * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    print(f"{clients} clients x {ops} ops\ndepartments       ops/s        p50          p99")
+    for department_count in (1, 2, 4, 8):
+        run(department_count, clients, ops)
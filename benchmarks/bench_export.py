@@ -0,0 +1,61 @@
+"""Peak memory and throughput of the streaming history export.
+
+Fills a history store with N records, then drains export_chunks() the way
+/history/export streams a response, and reports the extra memory the export
+needed at its peak (tracemalloc) next to the size of the data it produced.
+The peak should stay flat as N grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_export [format] [sizes...]
+"""
+import sys
+import time
+import tracemalloc
+
+from backend.export import export_chunks, format_available
+from backend.history import ColumnarHistoryStore, iter_records
+from backend.queue_logic import format_arrival
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+
+
+def fill(n):
+    store = ColumnarHistoryStore()
+    for i in range(n):
+        store.append({
+            "patient_id": f"{i:032x}",
+            "name": f"Patient {i}",
+            "condition": "Fracture",
+            "severity": (i % 3) + 1,
+            "arrival_time": format_arrival(START + i * 30),
+            "status": "called",
+            "served_time": format_arrival(START + i * 30 + 900),
+        })
+    return store
+
+
+def main(argv):
+    fmt = argv[0] if argv and not argv[0].isdigit() else "csv"
+    sizes = [int(a) for a in argv if a.isdigit()] or [100_000, 1_000_000]
+    if not format_available(fmt):
+        sys.exit(f"{fmt} export needs pyarrow")
+    print(f"format {fmt}\n{'records':>10} {'output':>10} {'peak extra':>11} {'records/s':>11}")
+    for n in sizes:
+        store = fill(n)
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in export_chunks(iter_records(store), fmt))
+        seconds = time.perf_counter() - start
+        # Memory on a second pass, since tracing slows allocation down
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in export_chunks(iter_records(store), fmt):
+            pass
+        peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        print(f"{n:>10,} {size / 2**20:8.1f} MB {peak / 2**20:8.1f} MB {n / seconds:11,.0f}")
+        del store
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,315 @@
+"""Discrete-event emergency department simulation used as a load test.
+
+Generates a realistic day (or week) of traffic and replays it against the
+queue as fast as it will go, timing every call:
+
+- Arrivals are a non-homogeneous Poisson process. A daily curve peaks in
+  the evening, and random surges (a multi-vehicle crash, a bad flu night)
+  multiply the rate for an hour or two.
+- Each patient has a severity drawn from a mix, a condition and a
+  log-normally distributed treatment time whose mean depends on severity.
+  Some leave without being seen (they are marked treated).
+- Doctors call the next patient whenever they are free. Dashboards poll
+  /view_queue and patients check /wait_time on a fixed simulated interval.
+
+The same simulation drives the queue in-process (``memory``), the Flask app
+through its test client (``flask``, honouring the server's environment
+variables such as QUEUE_DB or DEPARTMENTS) or a running server
+(``http://host:port``). It reports calls per second, p50/p99/max latency
+per endpoint, peak memory and the simulated patients' waits. Save a run
+with --save and compare a later one with --baseline to catch regressions:
+the exit status is 1 when any endpoint's p50 or p99 got slower by more
+than --tolerance.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_load [--target memory|flask|URL] [--hours 24] [--scale 1]
+"""
+import argparse
+import heapq
+import json
+import math
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+from backend.queue_logic import Patient, TriageQueue, format_arrival
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+SEVERITY_MIX = {1: 0.15, 2: 0.45, 3: 0.40}
+TREATMENT_MINUTES = {1: 45, 2: 25, 3: 12}  # Mean treatment time per severity
+CONDITIONS = ["Chest pain", "Fracture", "Fever", "Laceration", "Burn", "Asthma", "Migraine",
+              "Abdominal pain", "Allergic reaction", "Sprain", "Head injury", "Dehydration"]
+LEFT_WITHOUT_BEING_SEEN = 0.04  # Share of patients who give up waiting
+PATIENCE_MINUTES = 120  # Mean time before they do
+SURGES_PER_DAY = 0.5
+SURGE_FACTOR = 4.0  # Arrival rate multiplier during a surge
+OPERATIONS = ("add_patient", "next_patient", "view_queue", "wait_time", "mark_treated")
+
+
+def daily_curve(seconds):
+    """Relative arrival rate over the day: quiet at 5am, busiest around 7pm (mean 1)"""
+    hour = (seconds % 86400) / 3600
+    return 1 + 0.6 * math.sin((hour - 13) / 24 * 2 * math.pi)
+
+
+def arrivals(hours, per_hour, rng):
+    """(time, severity, condition, treatment seconds, patience seconds or None) per patient.
+
+    Thinning: candidates are drawn at the peak rate and kept with probability
+    rate(t) / peak, which samples the time-varying Poisson process exactly.
+    """
+    end = START + int(hours * 3600)
+    surges = []
+    t = START
+    while True:
+        t += rng.expovariate(SURGES_PER_DAY / 86400)
+        if t >= end:
+            break
+        surges.append((t, t + rng.uniform(1, 2) * 3600))
+    peak = per_hour / 3600 * 1.6 * SURGE_FACTOR
+    severities, weights = zip(*SEVERITY_MIX.items())
+    patients = []
+    t = START
+    while True:
+        t += rng.expovariate(peak)
+        if t >= end:
+            return patients, len(surges)
+        rate = per_hour / 3600 * daily_curve(t)
+        if any(start <= t < stop for start, stop in surges):
+            rate *= SURGE_FACTOR
+        if rng.random() * peak >= rate:
+            continue
+        severity = rng.choices(severities, weights)[0]
+        mean = TREATMENT_MINUTES[severity] * 60
+        treatment = rng.lognormvariate(math.log(mean) - 0.125, 0.5)  # sigma 0.5, mean `mean`
+        patience = rng.expovariate(1 / (PATIENCE_MINUTES * 60)) if rng.random() < LEFT_WITHOUT_BEING_SEEN else None
+        patients.append((int(t), severity, rng.choice(CONDITIONS), treatment, patience))
+
+
+class MemoryDriver:
+    """Calls a TriageQueue directly: the cost of the queue itself"""
+
+    def __init__(self):
+        self.queue = TriageQueue()
+
+    def add_patient(self, payload):
+        patient = Patient(payload["name"], payload["condition"], payload["severity"])
+        patient.arrival_time = payload["arrival_time"]
+        return self.queue.add_patient(patient)
+
+    def next_patient(self):
+        patient = self.queue.get_next_patient()
+        return patient.to_dict() if patient else None
+
+    def view_queue(self):
+        patients, _, _ = self.queue.page(limit=10)
+        return [dict(p.to_dict(), **(self.queue.wait_time(p.patient_id) or {})) for p in patients]
+
+    def wait_time(self, patient_id):
+        return self.queue.wait_time(patient_id)
+
+    def mark_treated(self, patient_id):
+        return self.queue.remove_by_id(patient_id)
+
+
+class ClientDriver:
+    """Calls the HTTP endpoints through a Flask test client or a requests session"""
+
+    def __init__(self, client, base_url=""):
+        self.client = client
+        self.base_url = base_url
+
+    def _json(self, response):
+        return response.json() if callable(getattr(response, "json", None)) else response.get_json()
+
+    def add_patient(self, payload):
+        response = self.client.post(f"{self.base_url}/add_patient", json=payload)
+        return self._json(response)["patient_id"]
+
+    def next_patient(self):
+        response = self.client.post(f"{self.base_url}/next_patient")
+        return self._json(response) if response.status_code == 200 else None
+
+    def view_queue(self):
+        return self._json(self.client.get(f"{self.base_url}/view_queue?limit=10"))
+
+    def wait_time(self, patient_id):
+        response = self.client.get(f"{self.base_url}/wait_time?patient_id={patient_id}")
+        return self._json(response) if response.status_code == 200 else None
+
+    def mark_treated(self, patient_id):
+        response = self.client.post(f"{self.base_url}/mark_treated", json={"patient_id": patient_id})
+        return response.status_code == 200
+
+
+def make_driver(target):
+    if target == "memory":
+        return MemoryDriver()
+    if target == "flask":
+        from backend.server import app
+        return ClientDriver(app.test_client())
+    import requests
+    return ClientDriver(requests.Session(), target.rstrip("/"))
+
+
+def simulate(driver, patients, doctors, poll_seconds):
+    """Replay the arrivals; returns (latencies per operation, waits per severity, peak queue length)"""
+    latencies = {op: [] for op in OPERATIONS}
+
+    def timed(op, *args):
+        start = time.perf_counter()
+        result = getattr(driver, op)(*args)
+        latencies[op].append(time.perf_counter() - start)
+        return result
+
+    # (time, seq, kind, data); seq keeps simultaneous events in scheduling order
+    events = [(t, i, "arrival", i) for i, (t, *_) in enumerate(patients)]
+    events.append((START, len(events), "poll", None))
+    heapq.heapify(events)
+    seq = len(events) + 1
+    admitted = {}  # patient_id -> (arrival, treatment seconds)
+    waiting = {}  # patient_id -> None, for kiosk lookups
+    waits = {severity: [] for severity in SEVERITY_MIX}
+    idle = doctors
+    peak = 0
+    last_arrival = patients[-1][0] if patients else START
+
+    def schedule(when, kind, data=None):
+        nonlocal seq
+        heapq.heappush(events, (when, seq, kind, data))
+        seq += 1
+
+    while events:
+        now, _, kind, data = heapq.heappop(events)
+        if kind == "arrival":
+            arrival, severity, condition, seconds, patience = patients[data]
+            patient_id = timed("add_patient", {
+                "name": f"Patient {data}", "condition": condition,
+                "severity": severity, "arrival_time": format_arrival(arrival),
+            })
+            admitted[patient_id] = (arrival, seconds)
+            waiting[patient_id] = None
+            peak = max(peak, len(waiting))
+            if patience is not None:
+                schedule(now + int(patience), "leave", patient_id)
+            if idle:
+                idle -= 1
+                schedule(now, "free")
+        elif kind == "free":
+            patient = timed("next_patient")
+            if patient is None:
+                idle += 1
+                continue
+            waiting.pop(patient["patient_id"], None)
+            arrival, seconds = admitted.pop(patient["patient_id"])
+            waits[patient["severity"]].append(now - arrival)
+            schedule(now + int(seconds), "free")
+        elif kind == "leave":
+            if data in waiting:
+                del waiting[data]
+                del admitted[data]
+                timed("mark_treated", data)
+        elif kind == "poll":
+            timed("view_queue")
+            if waiting:
+                timed("wait_time", next(iter(waiting)))
+            if now < last_arrival:
+                schedule(now + poll_seconds, "poll")
+    return latencies, waits, peak
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints whose p50 or p99 is more than ``tolerance`` slower than the baseline"""
+    regressions = []
+    for op, stats in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(op)
+        if not before:
+            continue
+        for key in ("p50_us", "p99_us"):
+            if stats[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{op} {key[:3]} {before[key]:.1f} -> {stats[key]:.1f} us")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--target", default="memory", help="memory, flask or a server URL")
+    parser.add_argument("--hours", type=float, default=24, help="simulated hours")
+    parser.add_argument("--rate", type=float, default=12, help="mean arrivals per hour")
+    parser.add_argument("--doctors", type=int, default=6)
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiply arrivals and doctors (a bigger hospital, same load)")
+    parser.add_argument("--poll", type=float, default=30, help="simulated seconds between dashboard polls")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report traced Python allocations (slower) instead of peak RSS")
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown as a fraction (p99 is noisy below --scale 10)")
+    args = parser.parse_args(argv)
+    if args.trace_memory and args.baseline:
+        parser.error("--trace-memory slows every call; run it separately from --baseline comparisons")
+
+    rng = random.Random(args.seed)
+    patients, surges = arrivals(args.hours, args.rate * args.scale, rng)
+    doctors = max(1, round(args.doctors * args.scale))
+    driver = make_driver(args.target)
+    print(f"{len(patients):,} patients over {args.hours:g} h ({surges} surges), "
+          f"{doctors} doctors, target {args.target}")
+
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    latencies, waits, peak = simulate(driver, patients, doctors, args.poll)
+    elapsed = time.perf_counter() - start
+    if args.trace_memory:
+        memory = f"{tracemalloc.get_traced_memory()[1] / 2**20:.1f} MB traced peak"
+        tracemalloc.stop()
+    else:
+        # ru_maxrss is KiB on Linux (bytes on macOS); the server's own memory when target is a URL
+        memory = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB peak RSS (this process)"
+
+    calls = sum(len(samples) for samples in latencies.values())
+    results = {"calls_per_second": calls / elapsed, "endpoints": {}}
+    print(f"{calls:,} calls in {elapsed:.2f} s: {calls / elapsed:,.0f} calls/s, {memory}, "
+          f"longest queue {peak:,}\n")
+    print(f"{'endpoint':<14}{'calls':>9}{'p50':>11}{'p99':>11}{'max':>11}")
+    for op, samples in latencies.items():
+        if not samples:
+            continue
+        stats = {"calls": len(samples), "p50_us": percentile(samples, 50) * 1e6,
+                 "p99_us": percentile(samples, 99) * 1e6, "max_us": max(samples) * 1e6}
+        results["endpoints"][op] = stats
+        print(f"{op:<14}{stats['calls']:>9,}{stats['p50_us']:>8.1f} us{stats['p99_us']:>8.1f} us"
+              f"{stats['max_us']:>8.0f} us")
+
+    print("\nsimulated waits (minutes)")
+    for severity, samples in waits.items():
+        if samples:
+            print(f"  severity {severity}: p50 {percentile(samples, 50) / 60:5.0f}   "
+                  f"p95 {percentile(samples, 95) / 60:5.0f}   max {max(samples) / 60:5.0f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"\nno endpoint slower than the baseline by more than {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
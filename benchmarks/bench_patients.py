@@ -0,0 +1,116 @@
+"""Memory and throughput of patient records, old representation vs compact.
+
+Builds N patients (1M by default) as the original dict-backed objects with
+string timestamps and as slotted Patients, then fills a MemoryHistoryStore
+and a ColumnarHistoryStore with N records each. Memory is what tracemalloc
+sees still allocated afterwards, including the field strings each
+representation keeps; throughput covers construction, serialization and
+reading pages of history.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_patients [n]
+"""
+import sys
+import time
+import tracemalloc
+import uuid
+
+from backend.history import ColumnarHistoryStore, MemoryHistoryStore
+from backend.queue_logic import Patient, format_arrival
+
+CONDITIONS = ("Chest pain", "Fracture", "Fever", "Laceration", "Burn", "Asthma")
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+
+
+class DictPatient:
+    """The previous Patient: a plain object serialized with vars()"""
+
+    def __init__(self, name, condition, severity):
+        self.patient_id = None
+        self.name = name
+        self.condition = condition
+        self.severity = severity
+        self.arrival_time = None
+
+
+def fields(n):
+    """(patient_id, name, condition, severity, arrival_time) as they arrive in requests"""
+    for i in range(n):
+        # Fresh string objects per record, as decoding a JSON body would produce
+        condition = "".join(CONDITIONS[i % len(CONDITIONS)])
+        yield uuid.uuid4().hex, f"Patient {i}", condition, (i % 3) + 1, format_arrival(START + i)
+
+
+def build_dict_patients(n):
+    patients = []
+    for patient_id, name, condition, severity, arrival_time in fields(n):
+        patient = DictPatient(name, condition, severity)
+        patient.patient_id = patient_id
+        patient.arrival_time = arrival_time
+        patients.append(patient)
+    return patients
+
+
+def build_slotted_patients(n):
+    patients = []
+    for patient_id, name, condition, severity, arrival_time in fields(n):
+        patient = Patient(name, condition, severity)
+        patient.patient_id = patient_id
+        patient.arrival_time = arrival_time
+        patients.append(patient)
+    return patients
+
+
+def fill(store_class, records):
+    store = store_class()
+    for record in records:
+        store.append(record)
+    return store
+
+
+def retained(build):
+    """Bytes still allocated after build() returns, i.e. what its result keeps alive"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def timed(build):
+    """(result, seconds); run separately from retained() since tracing slows allocation"""
+    start = time.perf_counter()
+    result = build()
+    return result, time.perf_counter() - start
+
+
+def main(argv):
+    n = int(argv[0]) if argv else 1_000_000
+    print(f"{n:,} records")
+
+    print("\npatients        memory   bytes/rec   build/s   serialize/s")
+    for label, build, serialize in (
+            ("dict + vars", build_dict_patients, vars),
+            ("slots", build_slotted_patients, Patient.to_dict)):
+        size = retained(lambda: build(n))
+        patients, seconds = timed(lambda: build(n))
+        _, serialized = timed(lambda: [serialize(patient) for patient in patients])
+        print(f"{label:<12} {size / 2**20:7.0f} MB {size / n:9.0f} {n / seconds:11,.0f} {n / serialized:11,.0f}")
+        del patients
+
+    records = [patient.to_dict() for patient in build_slotted_patients(n)]
+    print("\nhistory store   memory   bytes/rec  append/s   page reads/s")
+    for store_class in (MemoryHistoryStore, ColumnarHistoryStore):
+        size = retained(lambda: fill(store_class, records))
+        store, seconds = timed(lambda: fill(store_class, records))
+        reads = 1_000
+        _, paged = timed(lambda: [store.query(offset=(i * 997) % n, limit=50) for i in range(reads)])
+        print(f"{store_class.__name__[:-12]:<12} {size / 2**20:7.0f} MB {size / n:9.0f} "
+              f"{n / seconds:11,.0f} {reads / paged:11,.0f}")
+        del store
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
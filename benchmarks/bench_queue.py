@@ -0,0 +1,47 @@
+"""Admit/call-next throughput for TriageQueue.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_queue [size ...]
+"""
+import random
+import sys
+import time
+
+from backend.queue_logic import TriageQueue, Patient
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def make_patients(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        Patient(name=f"Patient {i}", condition="Chest pain", severity=rng.choice((1, 2, 3)))
+        for i in range(count)
+    ]
+
+
+def run(count):
+    patients = make_patients(count)
+    triage = TriageQueue()
+
+    start = time.perf_counter()
+    for patient in patients:
+        triage.add_patient(patient)
+    admit_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    while triage.get_next_patient() is not None:
+        pass
+    pop_elapsed = time.perf_counter() - start
+
+    print(
+        f"{count:>10,} patients | admit {count / admit_elapsed:>12,.0f}/s"
+        f" | call-next {count / pop_elapsed:>12,.0f}/s"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    for size in sizes:
+        run(size)
@@ -0,0 +1,95 @@
+"""Write-ahead log cost on admissions and recovery time for large logs.
+
+Admissions are timed in memory, with the journal's flusher running, and with
+the flusher held off so only the request path (noting each change under the
+queue lock) is measured; encoding and writing happen on the flusher thread.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_recovery [entries]
+"""
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from backend.persistence import QueueJournal
+from backend.queue_logic import TriageQueue, Patient
+
+DEFAULT_ENTRIES = 100_000
+
+
+def make_patient(i, rng):
+    patient = Patient(name=f"Patient {i}", condition="Chest pain", severity=rng.choice((1, 2, 3)))
+    patient.arrival_time = "2024-01-01 00:00:00"
+    return patient
+
+
+def admit_throughput(count, journal_dir=None, flush_interval=0.05):
+    rng = random.Random(1)
+    patients = [make_patient(i, rng) for i in range(count)]
+    triage = TriageQueue()
+    journal = None
+    if journal_dir is not None:
+        journal = QueueJournal(journal_dir, flush_interval=flush_interval, snapshot_every=10 * count)
+        journal.recover(triage)
+    start = time.perf_counter()
+    for patient in patients:
+        triage.add_patient(patient)
+    elapsed = time.perf_counter() - start
+    if journal is not None:
+        journal.close()
+    return count / elapsed
+
+
+def build_log(directory, entries):
+    """Write a log of `entries` records: roughly 2 admits for every call/treat"""
+    rng = random.Random(2)
+    triage = TriageQueue()
+    journal = QueueJournal(directory, snapshot_every=10 * entries)
+    journal.recover(triage)
+    for i in range(entries):
+        if len(triage) and rng.random() < 1 / 3:
+            triage.get_next_patient()
+        else:
+            triage.add_patient(make_patient(i, rng))
+    journal.close()
+    return len(triage)
+
+
+def run(entries):
+    directory = tempfile.mkdtemp(prefix="triage-wal-")
+    try:
+        plain = admit_throughput(entries)
+        logged = admit_throughput(entries, directory)
+        shutil.rmtree(directory)
+        noted = admit_throughput(entries, directory, flush_interval=3600)
+        print(f"admit throughput: {plain:,.0f}/s in memory, {logged:,.0f}/s with WAL, "
+              f"{noted:,.0f}/s with WAL on the request path alone")
+
+        shutil.rmtree(directory)
+        waiting = build_log(directory, entries)
+        start = time.perf_counter()
+        journal = QueueJournal(directory)
+        restored = journal.recover(TriageQueue())
+        replay_elapsed = time.perf_counter() - start
+        assert len(restored) == waiting
+
+        journal.compact()
+        journal.close()
+        start = time.perf_counter()
+        journal = QueueJournal(directory)
+        journal.recover(TriageQueue())
+        snapshot_elapsed = time.perf_counter() - start
+        journal.close()
+        print(
+            f"{entries:,} log entries ({waiting:,} waiting): recovery {replay_elapsed * 1000:.0f} ms"
+            f" from log, {snapshot_elapsed * 1000:.0f} ms from snapshot"
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ENTRIES)
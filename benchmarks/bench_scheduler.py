@@ -0,0 +1,100 @@
+"""Waits under strict severity priority vs aging priorities.
+
+Simulates an emergency department over a few weeks: patients arrive at
+random (Poisson) with a severity mix, a fixed number of doctors call the
+next patient through a TriageQueue whenever they are free, and treatment
+takes an exponentially distributed time whose mean depends on severity.
+The department runs close to capacity, so under strict priority the
+severity-3 lane can be overtaken for hours. The same arrivals are replayed
+under each policy and the p95 and max waits per severity are compared, along
+with the cost of a call-next.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scheduler [days] [utilisation]
+"""
+import heapq
+import random
+import sys
+import time
+
+from backend.queue_logic import Patient, TriageQueue
+from backend.scheduler import AgingPriority, StrictPriority
+from backend.wait_times import BASE_SERVICE_MINUTES
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+DOCTORS = 4
+SEVERITY_MIX = {1: 0.35, 2: 0.35, 3: 0.30}
+POLICIES = {
+    "strict": StrictPriority(),
+    "aging 3:1": AgingPriority({3: 1.0}),
+    "aging 2:0.5,3:1": AgingPriority({2: 0.5, 3: 1.0}),
+    "aging 2:1,3:2": AgingPriority({2: 1.0, 3: 2.0}),
+    "2:0.5,3:1 f=1.5": AgingPriority({2: 0.5, 3: 1.0}, floor=1.5),
+    "2:1,3:2 f=1.5": AgingPriority({2: 1.0, 3: 2.0}, floor=1.5),
+}
+
+
+def arrivals(days, utilisation, seed=11):
+    """(time, severity, treatment seconds) for every patient, the same for each policy"""
+    rng = random.Random(seed)
+    mean_service = sum(share * BASE_SERVICE_MINUTES[s] * 60 for s, share in SEVERITY_MIX.items())
+    rate = utilisation * DOCTORS / mean_service  # Patients per second
+    severities, weights = zip(*SEVERITY_MIX.items())
+    now, end, patients = START, START + days * 86400, []
+    while True:
+        now += rng.expovariate(rate)
+        if now >= end:
+            return patients
+        severity = rng.choices(severities, weights)[0]
+        patients.append((int(now), severity, rng.expovariate(1 / (BASE_SERVICE_MINUTES[severity] * 60))))
+
+
+def simulate(patients, scheduler):
+    """Replay the arrivals; returns ({severity: [waits in seconds]}, seconds spent calling)"""
+    clock = [START]
+    triage = TriageQueue(scheduler=scheduler, clock=lambda: clock[0])
+    treatment = {}
+    waits = {severity: [] for severity in SEVERITY_MIX}
+    free_at = [START] * DOCTORS  # Heap of times each doctor is next free
+    calling = 0.0
+    index = 0
+    while index < len(patients) or len(triage):
+        next_arrival = patients[index][0] if index < len(patients) else None
+        if len(triage) and (next_arrival is None or free_at[0] <= next_arrival):
+            clock[0] = max(clock[0], free_at[0])
+            start = time.perf_counter()
+            patient = triage.get_next_patient()
+            calling += time.perf_counter() - start
+            waits[patient.severity].append(clock[0] - patient.arrival)
+            heapq.heapreplace(free_at, clock[0] + treatment.pop(patient.patient_id))
+        else:
+            clock[0] = max(clock[0], next_arrival)
+            arrival, severity, seconds = patients[index]
+            patient = Patient("Patient", "Condition", severity)
+            patient.arrival = arrival
+            treatment[triage.add_patient(patient)] = seconds
+            index += 1
+    return waits, calling
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main(argv):
+    days = int(argv[0]) if argv else 28
+    utilisation = float(argv[1]) if len(argv) > 1 else 0.95
+    patients = arrivals(days, utilisation)
+    print(f"{len(patients):,} patients over {days} days, {DOCTORS} doctors, {utilisation:.0%} utilisation\n")
+    header = "".join(f"   sev {s} p95/max (min)" for s in SEVERITY_MIX)
+    print(f"{'policy':<16}{header}   call-next")
+    for name, scheduler in POLICIES.items():
+        waits, calling = simulate(patients, scheduler)
+        cells = "".join(f"{percentile(waits[s], 95) / 60:>13.0f} /{max(waits[s]) / 60:>6.0f}" for s in SEVERITY_MIX)
+        print(f"{name:<16}{cells}   {calling / len(patients) * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
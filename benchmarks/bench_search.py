@@ -0,0 +1,130 @@
+"""Search latency over a large history.
+
+Fills a columnar history store with --records served patients (1M by
+default; names drawn from a large generated surname pool, conditions from
+a realistic list), indexes the latest --window of them with PatientSearch
+(all of them by default, to show the worst case), then times a mix of
+queries a triage desk makes: a surname, a short name prefix, first name
+plus surname prefix, a condition word filtered by severity and
+department, the second page of a common word, and a miss. Reports p50,
+p99 and max per query kind, the index build rate, and for comparison a
+linear scan of the first 100k records with the same query.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search [--records 1000000] [--window N] [--queries 500]
+"""
+import argparse
+import random
+import sys
+import time
+
+from backend.history import ColumnarHistoryStore
+from backend.queue_logic import format_arrival
+from backend.search import PatientSearch, Query
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William",
+               "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah",
+               "Charles", "Karen", "Maria", "Wei", "Mohammed", "Aisha", "Juan", "Ana", "Li", "Fatima", "Olga",
+               "Hiroshi", "Priya", "Kwame", "Sofia", "Lucas", "Emma", "Noah", "Olivia", "Liam", "Ava", "Mateo"]
+SYLLABLES = ["an", "ber", "cal", "dor", "el", "fen", "gar", "hol", "is", "jen", "kov", "lin", "mar", "nov",
+             "or", "pet", "quin", "ros", "sen", "tor", "ul", "van", "wick", "yam", "zel", "son", "ez", "ski"]
+CONDITIONS = ["Chest pain", "Shortness of breath", "Fracture of left arm", "Fracture of right leg", "High fever",
+              "Abdominal pain", "Severe headache", "Laceration to hand", "Allergic reaction", "Asthma attack",
+              "Back pain", "Burn to forearm", "Dehydration", "Dizziness", "Head injury", "Kidney stones",
+              "Migraine", "Nausea and vomiting", "Sprained ankle", "Urinary tract infection"]
+DEPARTMENTS = ["ed", "pediatrics", "urgent_care"]
+
+
+def surnames(count, rng):
+    pool = set()
+    while len(pool) < count:
+        pool.add("".join(rng.choice(SYLLABLES) for _ in range(rng.choice((2, 3)))).title())
+    return sorted(pool)
+
+
+def fill(store, records, rng):
+    family = surnames(20_000, rng)
+    for i in range(records):
+        store.append({
+            "patient_id": rng.getrandbits(128).to_bytes(16, "big").hex(),
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(family)}",
+            "condition": rng.choice(CONDITIONS),
+            "severity": rng.choice((1, 2, 2, 3, 3, 3)),
+            "arrival_time": format_arrival(START + i * 30),
+            "department": rng.choice(DEPARTMENTS),
+            "status": "treated",
+            "served_time": format_arrival(START + i * 30 + 1800),
+        })
+    return family
+
+
+def query_mix(family, rng):
+    """name -> function returning (Query, cursor page) for one random query of that kind"""
+    return {
+        "surname": lambda: (Query(rng.choice(family), prefix=False), 1),
+        "prefix (3)": lambda: (Query(rng.choice(family)[:3]), 1),
+        "first + prefix": lambda: (Query(f"{rng.choice(FIRST_NAMES)} {rng.choice(family)[:4]}"), 1),
+        "cond+sev+dept": lambda: (Query(rng.choice(CONDITIONS).split()[-1], fields=("condition",),
+                                        severities={1}, department=rng.choice(DEPARTMENTS)), 1),
+        "page 2 (common)": lambda: (Query(rng.choice(FIRST_NAMES)), 2),
+        "miss": lambda: (Query(f"{rng.choice(FIRST_NAMES)} qqq"), 1),
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, help="history records searched (default: all of them)")
+    parser.add_argument("--queries", type=int, default=500, help="queries timed per kind")
+    parser.add_argument("--limit", type=int, default=20, help="results per page")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    store = ColumnarHistoryStore()
+    start = time.perf_counter()
+    family = fill(store, args.records, rng)
+    print(f"{args.records:,} history records stored in {time.perf_counter() - start:.1f} s")
+
+    search = PatientSearch(store, window=args.window or args.records)
+    start = time.perf_counter()
+    search.catch_up()
+    elapsed = time.perf_counter() - start
+    indexed = min(args.records, search.window)
+    postings = sum(map(len, search._records._postings.values()))
+    print(f"{indexed:,} indexed in {elapsed:.1f} s ({indexed / elapsed:,.0f} records/s): "
+          f"{len(search._records):,} keys, {postings:,} postings\n")
+
+    print(f"{'query':<18}{'p50':>10}{'p99':>10}{'max':>10}{'hits/query':>12}")
+    for kind, make in query_mix(family, rng).items():
+        timings, hits = [], 0
+        for _ in range(args.queries):
+            query, pages = make()
+            cursor = None
+            for _ in range(pages - 1):
+                _, cursor = search.history(query, args.limit, cursor)
+            start = time.perf_counter()
+            records, _ = search.history(query, args.limit, cursor)
+            timings.append(time.perf_counter() - start)
+            hits += len(records)
+        print(f"{kind:<18}{percentile(timings, 50) * 1e6:>7.0f} us{percentile(timings, 99) * 1e6:>7.0f} us"
+              f"{max(timings) * 1e6:>7.0f} us{hits / args.queries:>12.1f}")
+
+    query = Query(rng.choice(family))
+    scanned = min(args.records, 100_000)
+    start = time.perf_counter()
+    matches = [record for record in map(store.get, range(1, scanned + 1))
+               if query.matches(record["name"], record["condition"], record["severity"], record["department"])]
+    print(f"\nlinear scan of {scanned:,} records for one surname prefix: "
+          f"{(time.perf_counter() - start) * 1e3:.0f} ms ({len(matches)} hits)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+"""Load test for the SQLite-backed shared queue across worker processes.
+
+Each worker process opens the same database, like a gunicorn worker with
+QUEUE_DB set, and runs a mix of admissions and call-next operations. The
+benchmark reports combined throughput per worker count and checks that no
+patient was served twice.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_shared_queue [ops_per_worker] [max_workers]
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from backend.queue_logic import Patient
+from backend.shared_queue import SQLiteTriageQueue
+
+
+def worker(path, worker_id, ops, start_barrier, results):
+    triage = SQLiteTriageQueue(path)
+    served = []
+    start_barrier.wait()
+    for i in range(ops):
+        patient = Patient(f"W{worker_id} patient {i}", "Fracture", 1 + i % 3)
+        patient.arrival_time = "2024-01-01 00:00:00"
+        triage.add_patient(patient)
+        if i % 2:
+            called = triage.get_next_patient()
+            if called is not None:
+                served.append(called.patient_id)
+    results.put(served)
+
+
+def drain(path):
+    triage = SQLiteTriageQueue(path)
+    served = []
+    while True:
+        patient = triage.get_next_patient()
+        if patient is None:
+            return served
+        served.append(patient.patient_id)
+
+
+def run(workers, ops):
+    directory = tempfile.mkdtemp(prefix="triage-shared-")
+    path = os.path.join(directory, "queue.db")
+    try:
+        SQLiteTriageQueue(path)  # Create the schema before the workers race for it
+        barrier = multiprocessing.Barrier(workers + 1)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(path, w, ops, barrier, results))
+                 for w in range(workers)]
+        for proc in procs:
+            proc.start()
+        barrier.wait()
+        start = time.perf_counter()
+        served = [pid for _ in procs for pid in results.get()]
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - start
+
+        served += drain(path)
+        admitted = workers * ops
+        duplicates = len(served) - len(set(served))
+        total_ops = admitted + admitted // 2
+        print(
+            f"{workers:>2} workers | {total_ops / elapsed:>9,.0f} ops/s"
+            f" | admitted {admitted:,}, served {len(served):,}, served twice {duplicates}"
+        )
+        assert len(served) == admitted and duplicates == 0
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 4
+    workers = 1
+    while workers <= max_workers:
+        run(workers, ops)
+        workers *= 2
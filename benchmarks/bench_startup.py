@@ -0,0 +1,109 @@
+"""Cold-start cost of the dashboard and backend imports.
+
+Each run starts a fresh interpreter and times one import target with
+``python -X importtime``, so nothing is shared with an earlier run. The
+``app`` target executes the import statements at the top of app.py, which
+is what a kiosk pays before Streamlit can draw the first frame; its
+heaviest modules are listed, and any module that should only load on
+first use (see LAZY) is flagged if it shows up. Targets whose
+dependencies are not installed are reported and skipped.
+
+Save a run with --save and compare later ones with --baseline: the exit
+status is 1 when a target got slower by more than --tolerance, or when a
+lazy module is imported at startup.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs 7] [--save FILE] [--baseline FILE]
+"""
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+
+TARGETS = ("dashboard.render", "dashboard.live_state", "dashboard.api", "backend.queue_logic",
+           "backend.service", "app")
+# Needed by some actions only; importing one of these at startup is a regression
+LAZY = ("pandas", "pyarrow", "pytz", "numpy")
+INTERPRETER = set()  # Modules every interpreter imports at startup, filled in by main
+
+
+def app_imports(path="app.py"):
+    """The module-level import statements of app.py, as source"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure(target):
+    """({module: cumulative microseconds}, total microseconds) in a fresh interpreter; raises on import errors.
+
+    The total leaves out what the interpreter imports before running anything (site, encodings).
+    """
+    source = "pass" if target is None else app_imports() if target == "app" else f"import {target}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", source], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; the outermost ones add up to the whole cost
+        if len(name) - len(name.lstrip()) == 1 and name.strip() not in INTERPRETER:
+            total += int(cumulative)
+        modules[name.strip()] = int(cumulative)
+    return modules, total
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters per target (the median is kept)")
+    parser.add_argument("--top", type=int, default=10, help="heaviest modules listed for app")
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown as a fraction")
+    args = parser.parse_args(argv)
+
+    INTERPRETER.update(measure(None)[0])
+    results = {}
+    failed = []
+    print(f"{'target':<22}{'median':>10}{'min':>10}")
+    for target in TARGETS:
+        try:
+            runs = [measure(target) for _ in range(args.runs)]
+        except ImportError as e:
+            print(f"{target:<22}  skipped: {e}")
+            continue
+        totals = [total for _, total in runs]
+        results[target] = statistics.median(totals) / 1000
+        print(f"{target:<22}{results[target]:>7.1f} ms{min(totals) / 1000:>7.1f} ms")
+        modules = runs[-1][0]
+        eager = [name for name in LAZY if name in modules]
+        if eager:
+            failed.append(f"{target} imports {', '.join(eager)} at startup")
+        if target == "app":
+            print("\nheaviest imports of app.py (cumulative)")
+            for name, value in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+                print(f"  {name:<40}{value / 1000:>7.1f} ms")
+            print()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for target, ms in results.items():
+            before = baseline.get(target)
+            if before and ms > before * (1 + args.tolerance):
+                failed.append(f"{target} {before:.1f} -> {ms:.1f} ms")
+    for failure in failed:
+        print(f"REGRESSION: {failure}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,154 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_CACHE_ENTRIES = 256  # Read responses kept for revalidation with If-None-Match
+RETRY_STATUSES = (429, 502, 503, 504)  # Render returns these while the backend wakes up or redeploys
+
+
+class BackendClient:
+    """One keep-alive connection pool to the backend, shared by every dashboard session.
+
+    Requests reuse pooled TCP/TLS connections instead of opening a new one
+    each call. Failed connections are retried with exponential backoff, as
+    are GETs answered with a transient status; POSTs that reached the server
+    are only retried when they carry an idempotency key, which makes the
+    backend replay its first answer instead of applying them twice. ``submit`` runs a call
+    on a small thread pool so independent fetches can overlap.
+
+    ``get_cached`` is the read path: responses that carry an ETag are kept
+    and revalidated with If-None-Match, so the backend decides when they are
+    stale (it bumps the ETag on every change) and an unchanged page costs a
+    body-less 304. Mutations go through ``post`` and are never cached.
+    """
+
+    def __init__(self, base_url, pool_size=8, retries=3, backoff=0.3, timeout=DEFAULT_TIMEOUT,
+                 cache_entries=DEFAULT_CACHE_ENTRIES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="backend")
+        self.cache_entries = cache_entries
+        self._cache = collections.OrderedDict()  # (path, params) -> CachedResponse, LRU order
+        self._cache_lock = threading.Lock()
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(self.url(path), **kwargs)
+
+    def get_cached(self, path, params=None):
+        """GET through the shared ETag cache; returns a Response or a CachedResponse"""
+        key = (path, tuple(sorted((params or {}).items())))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        headers = {"If-None-Match": cached.etag} if cached else {}
+        response = self.get(path, params=params, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+            return cached
+        etag = response.headers.get("ETag")
+        if response.status_code == 200 and etag:
+            cached = CachedResponse(etag, response.headers, response.json())
+            with self._cache_lock:
+                self._cache[key] = cached
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+            return cached
+        return response
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def post(self, path, json=None, idempotency_key=None, **kwargs):
+        """POST once, or with an idempotency_key as often as a GET would be tried"""
+        kwargs.setdefault("timeout", self.timeout)
+        if idempotency_key is None:
+            return self.session.post(self.url(path), json=json, **kwargs)
+        kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"Idempotency-Key": idempotency_key})
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.url(path), json=json, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                # 409 with Retry-After: the first attempt is still running, and its answer
+                # is replayed once it finishes
+                still_running = response.status_code == 409 and "Retry-After" in response.headers
+                if (response.status_code not in RETRY_STATUSES and not still_running) or attempt == self.retries:
+                    return response
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn in the background; returns a Future"""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class CachedResponse:
+    """A stored 200 response, read like a requests.Response"""
+
+    status_code = 200
+
+    def __init__(self, etag, headers, body):
+        self.etag = etag
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class RerunTimer:
+    """Backend calls made during one dashboard rerun and how long they took"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = []  # (label, start, end)
+
+    def track(self, label, fn, *args, **kwargs):
+        """Call fn, recording its duration under label"""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._calls.append((label, start, time.perf_counter()))
+
+    def summary(self):
+        """e.g. "3 backend calls, 240 ms (wall 130 ms)"; wall is less when calls overlapped"""
+        with self._lock:
+            calls = list(self._calls)
+        if not calls:
+            return "No backend calls this refresh"
+        busy = sum(end - start for _, start, end in calls)
+        wall = max(end for _, _, end in calls) - min(start for _, start, _ in calls)
+        return f"{len(calls)} backend call{'s' if len(calls) != 1 else ''}, {busy * 1000:.0f} ms (wall {wall * 1000:.0f} ms)"
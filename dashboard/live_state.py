@@ -0,0 +1,159 @@
+import bisect
+import heapq
+import itertools
+import time
+
+import requests
+
+from backend.scheduler import parse_spec
+from backend.timestamps import parse_arrival
+from backend.wait_times import BASE_SERVICE_MINUTES, DEFAULT_SERVICE_MINUTES, MIN_WAIT_MINUTES
+
+
+class LiveQueue:
+    """Dashboard-side copy of the triage queue kept current by /events deltas.
+
+    The first sync downloads /view_queue once; after that each sync only asks
+    the backend for events newer than the last applied sequence number and
+    patches the local copy. If the backend no longer has those events, or
+    restarted since (its epoch changed), it answers HTTP 410 and the copy is
+    reloaded. Applying events is idempotent, so events that were already
+    reflected in a snapshot are harmless. A backend with a shared queue sends
+    no events; the copy then polls /view_queue with If-None-Match instead.
+
+    The copy follows one department (the backend's default when None); events
+    for patients of other departments are skipped. When the backend ages
+    priorities (X-Triage-Aging) the copy is ranked the same way on every read.
+    """
+
+    def __init__(self, backend_url, service_minutes=None, department=None):
+        self.backend_url = backend_url
+        self.department = department
+        self.service_minutes = dict(service_minutes or BASE_SERVICE_MINUTES)
+        self.seq = None  # Last applied event; None until the first full load
+        self.epoch = None  # The backend process lifetime seq belongs to
+        self.polling = False  # True when the backend sends no events (shared queue)
+        self.etag = None  # Of the last /view_queue snapshot
+        self._order = []  # Sorted (severity, admission order, patient_id)
+        self._rows = {}  # patient_id -> ((severity, order, patient_id), row)
+        self._next_order = 0
+        self._estimates_stale = False
+        self.scheduler = None  # AgingPriority when the backend ages priorities
+        self._arrivals = {}  # patient_id -> arrival epoch, for aging
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def version(self):
+        """Changes whenever a page could: with every applied event (or new
+        snapshot when polling), and every minute under aging, whose ranks and
+        estimates move with the clock. Includes the backend's epoch, since
+        its sequence numbers restart with it."""
+        if self.seq is None:
+            return None
+        if self.polling:
+            return self.etag
+        if self.scheduler is not None:
+            return f"{self.epoch}-{self.seq}-{int(time.time()) // 60}"
+        return f"{self.epoch}-{self.seq}"
+
+    def sync(self, session=requests, timeout=10):
+        """Bring the copy up to date; raises requests exceptions on network errors"""
+        if self.seq is not None and not self.polling:
+            params = {"since": self.seq}
+            if self.epoch:
+                params["epoch"] = self.epoch
+            response = session.get(f"{self.backend_url}/events", params=params, timeout=timeout)
+            if response.status_code == 200:
+                for event in response.json()["events"]:
+                    self.apply(event)
+                return
+            # 410: too far behind or another epoch; 404: events were turned off
+            if response.status_code not in (404, 410):
+                response.raise_for_status()
+        self.reload(session, timeout)
+
+    def reload(self, session=requests, timeout=10):
+        """Replace the copy with a full /view_queue snapshot, unless (when polling) it is unchanged"""
+        params = {"department": self.department} if self.department else None
+        headers = {"If-None-Match": self.etag} if self.polling and self.etag else None
+        response = session.get(f"{self.backend_url}/view_queue", params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+        self.department = response.headers.get("X-Department", self.department)
+        aging = response.headers.get("X-Triage-Aging")
+        self.scheduler = parse_spec(aging) if aging else None
+        seq = response.headers.get("X-Event-Seq")
+        self.polling = seq is None
+        self.epoch = response.headers.get("X-Event-Epoch")
+        self.etag = response.headers.get("ETag")
+        self.reset(response.json(), int(seq or 0))
+
+    def reset(self, rows, seq):
+        self._order, self._rows, self._arrivals = [], {}, {}
+        for row in rows:
+            self._insert(row)
+        self.seq = seq
+        self._estimates_stale = True
+
+    def apply(self, event):
+        """Apply one admitted/called/treated event"""
+        if event["seq"] <= self.seq:
+            return
+        patient = event["patient"]
+        self.seq = event["seq"]
+        if self.department is not None and patient.get("department", self.department) != self.department:
+            return  # Another department's queue
+        if event["type"] == "admitted":
+            if patient["patient_id"] not in self._rows:
+                self._insert(dict(patient))
+        else:
+            self._discard(patient["patient_id"])
+        self._estimates_stale = True
+
+    def _insert(self, row):
+        # Snapshot rows arrive in queue order and events in admission order, so
+        # a running counter preserves first-come, first-served within a severity
+        key = (row.get("severity", 3), self._next_order, row["patient_id"])
+        self._next_order += 1
+        bisect.insort(self._order, key)
+        self._rows[row["patient_id"]] = (key, row)
+        if row.get("arrival_time"):
+            self._arrivals[row["patient_id"]] = parse_arrival(row["arrival_time"])
+
+    def _discard(self, patient_id):
+        entry = self._rows.pop(patient_id, None)
+        if entry is not None:
+            del self._order[bisect.bisect_left(self._order, entry[0])]
+            self._arrivals.pop(patient_id, None)
+
+    def _ranked(self):
+        """Keys in the order the backend would call the patients now"""
+        if self.scheduler is None:
+            return self._order
+        # Merge the first-come, first-served lanes of each severity by rank, as the backend does
+        now = time.time()
+        rank = self.scheduler.rank
+        lanes = [list(lane) for _, lane in itertools.groupby(self._order, key=lambda key: key[0])]
+        return list(heapq.merge(*lanes, key=lambda key: (rank(key[0], self._arrivals.get(key[2]), now), key[1])))
+
+    def _refresh_estimates(self, order):
+        """Recompute positions and ETAs in one pass, the same way the backend estimates them"""
+        minutes = 0
+        for position, (severity, _, patient_id) in enumerate(order, start=1):
+            minutes += self.service_minutes.get(severity, DEFAULT_SERVICE_MINUTES)
+            row = self._rows[patient_id][1]
+            row["position"] = position
+            row["estimated_wait"] = max(MIN_WAIT_MINUTES, minutes)
+        self._estimates_stale = False
+
+    def page(self, page=1, page_size=10):
+        """One page of the queue in priority order, shaped like a server-side page"""
+        order = self._ranked()
+        # Aged ranks change with the clock, so they are recomputed on every read
+        if self._estimates_stale or self.scheduler is not None:
+            self._refresh_estimates(order)
+        keys = order[(page - 1) * page_size:page * page_size]
+        return {"items": [self._rows[key[2]][1] for key in keys], "total": len(self._rows)}
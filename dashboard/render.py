@@ -0,0 +1,110 @@
+import collections
+import functools
+import html
+import os
+import re
+import threading
+from datetime import datetime
+
+DEFAULT_RENDER_ENTRIES = 128  # Rendered pages kept across reruns and sessions
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SEVERITY_EMOJI = {1: "🚨", 2: "⚠️", 3: "✅"}
+
+
+def format_display_time(timestamp_str):
+    try:
+        dt = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+        return dt.strftime("%H:%M:%S")
+    except (TypeError, ValueError):
+        return timestamp_str  # Return original if parsing fails
+
+
+@functools.lru_cache(maxsize=None)
+def stylesheet(name="dashboard.css"):
+    """A <style> block for a stylesheet in static/, read and minified once per process"""
+    with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    css = re.sub(r"\s+", " ", css).strip()
+    return f"<style>{css}</style>"
+
+
+def _text(value):
+    return html.escape(str(value))
+
+
+def patient_card(p, position):
+    """One queue entry as a card; names and conditions are escaped"""
+    severity = p.get('severity', 3)
+    return f"""
+        <div class="patient-card" data-patient-id="{_text(p.get('patient_id', ''))}">
+            <div style="display: flex; justify-content: space-between; align-items: center;">
+                <div>
+                    <strong style="font-size: 1.1em;">{SEVERITY_EMOJI.get(severity, "✅")} {position}. {_text(p.get('name', 'Unknown'))}</strong>
+                    <div style="color: #64748b; font-size: 0.9em;">{_text(p.get('condition', 'Not specified'))}</div>
+                </div>
+                <span class="severity-badge severity-{_text(severity)}">Priority {_text(severity)}</span>
+            </div>
+            <div style="margin-top: 8px; display: flex; justify-content: space-between; align-items: center;">
+                <div style="font-size: 0.8em; color: #64748b;">
+                    Arrived: {_text(format_display_time(p.get('arrival_time', 'N/A')))}
+                </div>
+                <div class="wait-time">
+                    Estimated wait: ~{_text(p.get('estimated_wait', 10))} minutes
+                </div>
+            </div>
+        </div>"""
+
+
+def history_item(p):
+    severity = p.get('severity', 3)
+    return f"""
+        <div class="history-item">
+            <div style="font-weight: bold;">{_text(p.get('name', 'Unknown'))}</div>
+            <div style="font-size: 0.85em; opacity: 0.9;">{_text(p.get('condition', 'Not specified'))}</div>
+            <span class="severity-badge severity-{_text(severity)}">Severity {_text(severity)}</span>
+            <div class="timestamp">Arrived: {_text(format_display_time(p.get('arrival_time', 'N/A')))}</div>
+        </div>"""
+
+
+def queue_cards(rows, start=1):
+    """A whole queue page as one HTML block, numbered from ``start``"""
+    return "".join(patient_card(p, position) for position, p in enumerate(rows, start=start))
+
+
+def history_list(rows):
+    return "".join(history_item(p) for p in rows)
+
+
+class RenderCache:
+    """Rendered pages keyed by (view, version, page, ...), least recently used out first.
+
+    A page is {"items", "total", "html"}: the rows (for their actions), the
+    row count for paging and the whole page's markup, built in one pass.
+
+    Versions come from the backend (the event sequence for the queue, the
+    ETag for history), so a rerun that changed nothing finds its page here
+    and skips rebuilding it. One cache serves every session, which all show
+    the same backend.
+    """
+
+    def __init__(self, max_entries=DEFAULT_RENDER_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get_or_build(self, key, build):
+        """The page for key, calling build() only on a miss; a key holding a None
+        version is never cached, since it cannot tell when the page changed"""
+        if None in key:
+            return build()
+        with self._lock:
+            view = self._entries.get(key)
+            if view is not None:
+                self._entries.move_to_end(key)
+                return view
+        view = build()
+        with self._lock:
+            self._entries[key] = view
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return view
@@ -0,0 +1,48 @@
+from backend.analytics import DAY, HOUR, MAX_CONDITIONS, OTHER_CONDITION, QueueAnalytics
+from backend.queue_logic import Patient
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC (a day start)
+
+
+def admit(analytics, now, condition="Fever", when=None):
+    patient = Patient("Patient", condition, 2)
+    patient.arrival = now[0] if when is None else when
+    analytics.on_change('admitted', patient)
+
+
+def test_hour_cells_are_dropped_past_retention_but_totals_stay():
+    now = [START]
+    analytics = QueueAnalytics(clock=lambda: now[0], hour_retention=2 * DAY)
+    for hour in range(30 * 24):
+        now[0] = START + hour * HOUR + 600
+        admit(analytics, now)
+    assert len(analytics._periods[HOUR]) <= 3 * 24
+    assert analytics.report()["total"]["arrivals"] == 30 * 24
+    # A ragged range older than the hourly detail is widened to whole days
+    report = analytics.report(since=START + 5 * DAY + 3 * HOUR, until=START + 6 * DAY + 5 * HOUR)
+    assert report["total"]["arrivals"] == 2 * 24
+    # Recent ranges keep hourly precision
+    recent = START + 29 * DAY
+    assert analytics.report(since=recent + 3 * HOUR, until=recent + 5 * HOUR)["total"]["arrivals"] == 3
+
+
+def test_backfilled_records_older_than_retention_only_fill_days():
+    now = [START + 10 * DAY]
+    analytics = QueueAnalytics(clock=lambda: now[0], hour_retention=DAY)
+    admit(analytics, now)
+    admit(analytics, now, when=START + 3 * HOUR)
+    assert min(analytics._periods[HOUR]) >= START + 9 * DAY
+    assert analytics.report()["total"]["arrivals"] == 2
+
+
+def test_conditions_are_normalised_and_capped():
+    now = [START]
+    analytics = QueueAnalytics(clock=lambda: now[0])
+    for condition in ("Chest pain", " chest  PAIN ", "Chest Pain"):
+        admit(analytics, now, condition)
+    for i in range(MAX_CONDITIONS + 50):
+        admit(analytics, now, f"Condition {i}")
+    groups = {group["key"]: group["arrivals"] for group in analytics.report(group_by="condition")["groups"]}
+    assert groups["Chest pain"] == 3
+    assert len(groups) == MAX_CONDITIONS + 1
+    assert groups[OTHER_CONDITION] == 51
@@ -0,0 +1,43 @@
+import pytest
+
+from backend.history import ColumnarHistoryStore, MemoryHistoryStore, SQLiteHistoryStore
+from backend.queue_logic import Patient, TriageQueue, format_arrival
+from backend.shared_queue import SQLiteTriageQueue
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+SINCE = format_arrival(START + 10)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path):
+    if request.param == "memory":
+        return TriageQueue()
+    return SQLiteTriageQueue(str(tmp_path / "queue.db"))
+
+
+@pytest.fixture(params=["memory", "columnar", "sqlite"])
+def history(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    else:
+        store = {"memory": MemoryHistoryStore, "columnar": ColumnarHistoryStore}[request.param]()
+    yield store
+    store.close()
+
+
+def test_queue_offset_counts_patients_in_the_arrival_range(queue):
+    for i in range(20):
+        queue.add_patient(Patient(f"p{i}", "Fever", 2, START + i))
+    patients, total, _ = queue.page(offset=5, limit=3, since=SINCE)
+    assert [p.name for p in patients] == ["p15", "p16", "p17"]
+    assert total is None
+
+
+def test_history_offset_counts_records_in_the_arrival_range(history):
+    for i in range(20):
+        history.append({"name": f"p{i}", "severity": 2 if i % 2 else 3,
+                        "arrival_time": format_arrival(START + i), "status": "called"})
+    records, _, _ = history.query(offset=5, limit=3, since=SINCE)
+    assert [r["name"] for r in records] == ["p15", "p16", "p17"]
+    records, _, _ = history.query(offset=2, limit=2, since=SINCE, severities=[2, 3])
+    assert [r["name"] for r in records] == ["p12", "p13"]
@@ -0,0 +1,42 @@
+import os
+import threading
+
+import pytest
+
+from backend.persistence import JournalWriteError, QueueJournal
+from backend.queue_logic import Patient, TriageQueue
+
+
+def names(queue):
+    return [patient.name for patient in queue.view_queue()]
+
+
+def test_failed_write_keeps_the_batch_and_the_flusher(tmp_path, monkeypatch):
+    journal = QueueJournal(str(tmp_path), flush_interval=0.01, sync=True)
+    queue = journal.recover(TriageQueue())
+
+    real_fsync = os.fsync
+    def full_disk(fd):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(os, "fsync", full_disk)
+    queue.add_patient(Patient("A", "Fever", 2))
+    queue.add_patient(Patient("B", "Fever", 2))
+    queue.remove_by_id(queue.find_by_name("A")[0].patient_id)
+    # Fails instead of waiting forever for a flusher that cannot write
+    with pytest.raises(JournalWriteError):
+        journal.wait_durable()
+    assert journal._flusher.is_alive()
+
+    monkeypatch.setattr(os, "fsync", real_fsync)
+    done = threading.Thread(target=journal.wait_durable)
+    done.start()
+    done.join(5)
+    assert not done.is_alive()
+    journal.close()
+
+    # The failed segment already holds the lines whose fsync failed; replaying
+    # them again from the retry must not bring A back
+    assert len(os.listdir(tmp_path)) == 2
+    recovered = QueueJournal(str(tmp_path))
+    assert names(recovered.recover(TriageQueue())) == ["B"]
+    recovered.close()
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from backend.departments import Departments
+from backend.persistence import QueueJournal
+from backend.queue_logic import AdmissionOrder, Patient, TriageQueue
+from backend.scheduler import AgingPriority
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+NAMES = ("ed", "peds")
+
+
+def restart(tmp_path, recover_order=NAMES, scheduler=None, clock=None):
+    """Departments sharing an admission order, each recovered from its journal in turn"""
+    order = AdmissionOrder()
+    journals = {}
+
+    def make_queue(name):
+        return TriageQueue(department=name, order=order, scheduler=scheduler, clock=clock or time.time)
+
+    departments = Departments(make_queue, NAMES)
+    for name in recover_order:
+        journals[name] = QueueJournal(str(tmp_path / name))
+        journals[name].recover(departments.get(name))
+    return departments, journals
+
+
+def close(journals):
+    for journal in journals.values():
+        journal.close()
+
+
+@pytest.mark.parametrize("compact", [False, True], ids=["log", "snapshot"])
+def test_recovery_keeps_first_come_first_served_across_departments(tmp_path, compact):
+    departments, journals = restart(tmp_path)
+    departments.get("peds").add_patient(Patient("First", "Fever", 2, START))
+    departments.get("ed").add_patient(Patient("Second", "Fever", 2, START + 1))
+    departments.get("peds").add_patient(Patient("Third", "Fever", 2, START + 2))
+    if compact:
+        for journal in journals.values():
+            journal.compact()
+    close(journals)
+
+    departments, journals = restart(tmp_path)
+    departments.get("ed").add_patient(Patient("Fourth", "Fever", 2, START + 3))
+    called = [departments.call_next(list(NAMES)).name for _ in range(4)]
+    close(journals)
+    assert called == ["First", "Second", "Third", "Fourth"]
+
+
+def test_snapshot_keeps_admission_order_for_aging_ties(tmp_path):
+    # Snapshotted while Aged (admitted first) still ranks behind Early; by the time
+    # Aged reaches the floor they tie, and admission order must put Aged first
+    scheduler = AgingPriority({3: 1}, floor=2)
+    now = [START + 1800]
+    departments, journals = restart(tmp_path, scheduler=scheduler, clock=lambda: now[0])
+    ed = departments.get("ed")
+    ed.add_patient(Patient("Aged", "Fever", 3, START))
+    ed.add_patient(Patient("Early", "Fever", 2, START + 60))
+    assert [p.name for p in ed.view_queue()] == ["Early", "Aged"]
+    journals["ed"].compact()
+    close(journals)
+
+    now[0] = START + 3 * 3600
+    departments, journals = restart(tmp_path, scheduler=scheduler, clock=lambda: now[0])
+    assert [p.name for p in departments.get("ed").view_queue()] == ["Aged", "Early"]
+    close(journals)
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from backend.queue_logic import Patient, TriageQueue
+from backend.scheduler import AgingPriority
+
+START = 1_704_067_200  # 2024-01-01 00:00:00 UTC
+
+
+def aged_queue(seed, scheduler):
+    """A queue filled over a few hours with several arrivals per second at times,
+    so patients of different severities often share an arrival second"""
+    rng = random.Random(seed)
+    now = [START]
+    queue = TriageQueue(scheduler=scheduler, clock=lambda: now[0])
+    for i in range(200):
+        now[0] += rng.choice((0, 0, 1, 60, 300))
+        queue.add_patient(Patient(f"Patient {i}", "Condition", rng.choice((1, 2, 2, 3, 3, 3)), now[0]))
+    for _ in range(40):
+        queue.get_next_patient()
+    now[0] += rng.randrange(4 * 3600)
+    return queue
+
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("scheduler", [
+    AgingPriority({2: 0.5, 3: 1}),
+    AgingPriority({2: 0.5, 3: 1}, floor=1.5),
+    AgingPriority({3: 2}, floor=2),
+], ids=["no floor", "floor 1.5", "floor 2"])
+def test_wait_time_position_matches_view_queue(seed, scheduler):
+    queue = aged_queue(seed, scheduler)
+    for position, patient in enumerate(queue.view_queue(), start=1):
+        assert queue.wait_time(patient.patient_id)["position"] == position, patient.name